@@ -13,6 +13,7 @@ import PIL.Image as Image
 import plotly.express as px
 import plotly.graph_objects as go
 import requests
+import time
 import uuid
 
 from assets import templates
@@ -20,6 +21,7 @@ from assets import templates
 
 ### GLOBAL VARIABLES AND DATA LOADING
 COMP_URL = 'http://job-service:8080/api/v0/'
+OPERATION_TIMEOUT = 3          # seconds to wait for a host reset/delete before reporting that it is still running
 
 
 class Constraints:
@@ -255,6 +257,39 @@ app.layout = html.Div(
 )
 
 ##### CALLBACKS ####
+def wait_for_operation(operation, timeout=OPERATION_TIMEOUT):
+    '''
+    Retrieves a host reset/delete or system reset operation until it finishes or timeout seconds have passed
+    Args:
+        operation:  Operation returned by the reset/delete request
+        timeout:    Maximum waiting time in seconds
+    Returns:
+        operation:  Last retrieved operation
+    '''
+    deadline = time.monotonic() + timeout
+    while operation['status']['state'] == 'running' and time.monotonic() < deadline:
+        time.sleep(0.2)
+        operation = requests.get(f'{COMP_URL}operations/{operation["uid"]}').json()
+    return operation
+
+
+def operation_description(operation):
+    '''
+    Describes the state of a host reset/delete or system reset operation
+    Args:
+        operation:  Operation
+    Returns:
+        description:    Message to append to the confirmation, empty if the operation has been completed
+    '''
+    state = operation['status']['state']
+    if state == 'running':
+        return f' There are {operation["pending_workers"]} unfinished processes, the changes will be applied once ' \
+               f'they are completely terminated.'
+    if state == 'failed':
+        return f' The processes could not be terminated: {operation["error"]}'
+    return ''
+
+
 @app.callback(
     Output("privacy-toggle", "children"),
     Input({'type':'privacy', "index": ALL}, "on")
@@ -487,34 +522,18 @@ def show_messages(reset_database_click, reset_host_click, delete_host_click, row
         description = ''
         if action == 0:
             comp_req = requests.delete(f'{COMP_URL}system/reset')
-            response_details = comp_req.json()
-            for detail in response_details:
-                if detail['flag']:
-                    host_uid = detail['uid']
-                    description += f' Host {host_uid}'
-            if len(description)>0:
-                description += ' has/have unfinished processes. Please wait until these processes are completely' \
-                               ' terminated and try again.'
+            if comp_req.status_code == 200:
+                description = operation_description(wait_for_operation(comp_req.json()))
         if action == 1:
             host_uid = comp_table[row[0]]["host_id"]
             comp_req = requests.patch(f'{COMP_URL}host/{host_uid}/reset')
-            response_details = comp_req.json()
-            if response_details['flag']:
-                host_uid = response_details['uid']
-                description += f' Host {host_uid}'
-            if len(description) > 0:
-                description += ' has unfinished processes. It can take some few seconds for the changes to be ' \
-                               'reflected on the plot.'
+            if comp_req.status_code == 200:
+                description = operation_description(wait_for_operation(comp_req.json()))
         if action == 2:
             host_uid = comp_table[row[0]]["host_id"]
             comp_req = requests.delete(f'{COMP_URL}host/{host_uid}/delete')
-            response_details = comp_req.json()
-            if response_details['flag']:
-                host_uid = response_details['uid']
-                description += f' Host {host_uid}'
-            if len(description) > 0:
-                description += ' has unfinished processes. Please wait until these processes are completely' \
-                               ' terminated and try again.'
+            if comp_req.status_code == 200:
+                description = operation_description(wait_for_operation(comp_req.json()))
         response = comp_req.status_code
         warning_open = False
         action = -1
@@ -0,0 +1,405 @@
+import logging
+from datetime import datetime
+from typing import List
+
+from pymongo import ReturnDocument, UpdateOne
+
+from model import MlexWorkflow, MlexWorker, MlexJob, MlexHost, Status, WorkerRequirements, ServiceType, LogChunk, \
+                  JobEvent
+from job_service import ComputeService, JobNotFound, WorkerNotFound, WorkflowNotFound, MAX_RESERVATION_ATTEMPTS
+
+
+logger = logging.getLogger('job_manager')
+
+
+class AsyncComputeService:
+    def __init__(self, client, db_name=None):
+        """
+        Asynchronous compute service built on motor, used by the server. The operations requested by the workers (next
+        worker, next job, job events, status updates and logs) are awaited on the event loop, such that they do not hold
+        threads of the threadpool while they wait for the database. The remaining operations (e.g. workflow submission,
+        termination and resets) are run by a ComputeService that shares the same database and subscriptions, and they
+        are called in the threadpool by the server
+        Args:
+            client:     AsyncIOMotorClient
+            db_name:    Database name
+        """
+        if db_name is None:
+            db_name = 'job_manager'
+        self._sync_svc = ComputeService(client.delegate, db_name)
+        self._db = client[db_name]
+        self._collection_resources_list = self._db.resources_list
+        self._collection_workflow_list = self._db.workflow_list
+        self._collection_worker_list = self._db.worker_list
+        self._collection_job_list = self._db.job_list
+        self._collection_log_list = self._db.log_list
+
+    def __getattr__(self, name):
+        # the operations that are not asynchronous are run by the synchronous service
+        if name == '_sync_svc':
+            raise AttributeError(name)
+        return getattr(self._sync_svc, name)
+
+    async def get_next_worker(self,
+                              host_uid: str,
+                              service_type: ServiceType,
+                              ) -> MlexWorker:
+        '''
+        Finds next worker in queue to be executed at host location and update the status of the worker and the resources
+        at the host location
+        Args:
+            host_uid:       host uid
+            service_type:   frontend, backend, or hybrid
+        Returns:
+            Next worker to be executed
+        '''
+        worker = None
+        skipped_workers = []                # workers whose resources could not be reserved in this request
+        for attempt in range(MAX_RESERVATION_ATTEMPTS):
+            mlex_host = await self._get_host(host_uid)
+            if not mlex_host:
+                break
+            available = self._available_resources(mlex_host, service_type)
+            if available.num_nodes <= 0:
+                break
+            available = available.copy(update={'num_gpus': self._reservable_gpus(mlex_host, service_type)})
+            next_worker = await self._collection_worker_list.find_one_and_update(
+                self._next_worker_query(host_uid, service_type, available, skipped_workers),
+                {"$set": {"status.state": "running", "timestamps.execution_time": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER)
+            if not next_worker:
+                break
+            # if a new worker can be launched, reserve its resources at the host
+            requirements = WorkerRequirements.parse_obj(next_worker['requirements'])
+            reservations = self._worker_reservations(mlex_host, service_type, requirements)
+            reserved_gpus = await self._reserve_host_resources(mlex_host, reservations)
+            if reserved_gpus is None:
+                # the worker goes back to queue and the next worker in queue is tried
+                await self._collection_worker_list.update_one(
+                    {"uid": next_worker["uid"]},
+                    {"$set": {"status.state": "queue", "timestamps.execution_time": None}})
+                skipped_workers.append(next_worker["uid"])
+                continue
+            worker_update = self._reserved_worker_update(service_type, reservations, reserved_gpus)
+            worker = await self._collection_worker_list.find_one_and_update(
+                {"uid": next_worker["uid"]},
+                {"$set": worker_update},
+                return_document=ReturnDocument.AFTER)
+            self._clean_id(worker)
+            await self._update_workflow(None, Status(state='running'), worker['uid'])
+            break
+        return worker
+
+    async def get_next_worker_by_priority(self,
+                                          host_uid: str,
+                                          service_types: List[ServiceType],
+                                          ) -> MlexWorker:
+        '''
+        Finds next worker in queue to be executed at host location, trying the service types in order of priority
+        Args:
+            host_uid:       host uid
+            service_types:  list of service types (frontend, backend, or hybrid) in order of priority
+        Returns:
+            Next worker to be executed
+        '''
+        for service_type in service_types:
+            worker = await self.get_next_worker(host_uid, service_type)
+            if worker:
+                return worker
+        return None
+
+    async def get_job_event(self,
+                            uid: str
+                            ) -> JobEvent:
+        '''
+        Finds the current status and termination flag of a given job, without retrieving the full job
+        Args:
+            uid:   job uid
+        Returns:
+            Job status and termination flag
+        '''
+        item = await self._collection_job_list.find_one({"uid": uid}, {"uid": 1, "status": 1, "terminate": 1})
+        if not item:
+            raise JobNotFound(f"no job with id: {uid}")
+        self._clean_id(item)
+        return JobEvent.parse_obj(item)
+
+    async def get_next_job(self,
+                           worker_uid: str
+                           ) -> MlexJob:
+        '''
+        Finds the job that matches the query parameters
+        Args:
+            worker_uid:   worker UID
+        Returns:
+            Job that matches the query
+        '''
+        worker = await self._collection_worker_list.find_one({"uid": worker_uid}, {"jobs_list": 1})
+        if not worker:
+            raise WorkerNotFound(f"no worker with id: {worker_uid}")
+        jobs_list = worker["jobs_list"]
+        # dequeues a job in worker whose dependencies have all finished
+        item = await self._collection_job_list.find_one_and_update({"uid": {"$in": jobs_list},
+                                                                    "status.state": "queue",
+                                                                    "pending_deps": 0},
+                                                                   {"$set": {"status.state": "running",
+                                                                             "timestamps.execution_time":
+                                                                                 datetime.utcnow()}},
+                                                                   return_document=ReturnDocument.AFTER)
+        if item:
+            self._clean_id(item)
+            job = MlexJob.parse_obj(item)
+        else:
+            # checks if there are further jobs to run in the worker (in case some have been canceled)
+            num_pending_jobs = await self._collection_job_list.count_documents(
+                {"uid": {"$in": jobs_list},
+                 "status.state": {"$nin": ['complete', 'failed', 'terminated', 'canceled']}})
+            job = None if num_pending_jobs > 0 else -1
+        return job
+
+    async def update_worker(self, worker_uid: str, status: Status):
+        '''
+        Updates the status of a given worker and it's associated workflow
+        Args:
+            worker_uid: worker unique identifier
+            status:     worker status
+        Returns:
+            None
+        '''
+        worker = await self._get_worker(uid=worker_uid)
+        if worker.status.state != status.state:                     # update if status has changed
+            if status.state in ['complete', 'complete with errors', 'failed', 'terminated', 'canceled']:
+                await self._collection_worker_list.update_one(
+                    {'uid': worker_uid},
+                    {'$set': {'status': status.dict(), "timestamps.end_time": datetime.utcnow()}})
+                await self._update_host(worker.host_uid, worker.requirements, worker.service_type)
+            else:
+                await self._collection_worker_list.update_one(
+                    {'uid': worker_uid},
+                    {'$set': {'status': status.dict()}})
+            workflow = await self._get_workflow(worker_uid=worker_uid)
+            # check if this is the last worker in workflow
+            last_worker = await self._collection_worker_list.count_documents(
+                {'uid': {'$in': workflow.workers_list, '$ne': worker_uid},
+                 'status.state': {'$in': ['running', 'queue', 'warning']}}) == 0
+            status.state = self._workflow_state(status.state, workflow.status.state, last_worker)
+            if workflow.status.state != status.state:               # update if status has changed
+                await self._update_workflow(workflow.uid, status)
+
+    async def update_job(self, job_uid: str, status: Status, logs: str = None):
+        '''
+        Update the status of a given job and the worker associated with this job
+        Args:
+            job_uid:    job unique identifier
+            status:     job status
+            logs:       job logs
+        Returns:
+            None
+        '''
+        finished = status is not None and status.state in ['complete', 'failed', 'terminated', 'canceled']
+        if status:
+            job = await self._collection_job_list.find_one({"uid": job_uid}, {"status": 1})
+            if not job:
+                raise JobNotFound(f"no job with id: {job_uid}")
+            updated = job['status']['state'] != status.state                      # update if state has changed
+            if updated and finished:
+                # only the first final status is applied, such that the dependencies are updated once
+                result = await self._collection_job_list.update_one(
+                    {'uid': job_uid, 'status.state': {'$nin': ['complete', 'failed', 'terminated', 'canceled']}},
+                    {'$set': {'status': status.dict(), "timestamps.end_time": datetime.utcnow()}})
+                updated = result.modified_count == 1
+                if updated:
+                    await self._update_dependencies([job_uid])
+            elif updated:
+                await self._collection_job_list.update_one(
+                    {'uid': job_uid},
+                    {'$set': {'status': status.dict()}})
+            if updated:
+                worker = await self._get_worker(job_uid=job_uid)             # retrieve worker information
+                # check if this is the last job in worker
+                last_job = await self._collection_job_list.count_documents(
+                    {'uid': {'$in': worker.jobs_list, '$ne': job_uid},
+                     'status.state': {'$in': ['running', 'queue']}}) == 0
+                status.state = self._worker_state(status.state, worker.status.state, last_job)
+                if worker.status.state != status.state:                       # update if state has changed
+                    await self.update_worker(worker_uid=worker.uid, status=status)
+        if logs:
+            await self._append_logs(job_uid, logs)
+        if finished:
+            await self._delete_if_pending(job_uid)
+
+    async def append_logs(self, chunks: List[LogChunk]) -> List[str]:
+        '''
+        Appends a batch of logs to one or more jobs, the chunks of each job are stored as a single new log chunk. The
+        statuses in the chunks are applied once the logs have been stored
+        Args:
+            chunks:     List of log chunks, in the order they were produced
+        Returns:
+            List of job uids that were updated
+        '''
+        job_logs = {}
+        for chunk in chunks:
+            if chunk.logs:
+                job_logs.setdefault(chunk.uid, []).append(chunk.logs)
+        documents = []
+        for job_uid, logs in job_logs.items():
+            seq = await self._next_log_seq(job_uid)
+            if seq is None:
+                logger.warning(f'Discarding logs of unknown job {job_uid}')
+                continue
+            documents.append({'job_uid': job_uid, 'seq': seq, 'logs': ''.join(logs)})
+        if len(documents) > 0:
+            await self._collection_log_list.insert_many(documents)
+        job_uids = [document['job_uid'] for document in documents]
+        for chunk in chunks:
+            if chunk.status:
+                try:
+                    await self.update_job(chunk.uid, chunk.status)
+                except JobNotFound:
+                    logger.warning(f'Discarding status of unknown job {chunk.uid}')
+                    continue
+                if chunk.uid not in job_uids:
+                    job_uids.append(chunk.uid)
+        return job_uids
+
+    async def update_job_mapping(self, job_uid: str, ports: dict):
+        '''
+        Update the port mapping of a given job
+        Args:
+            job_uid:    job unique identifier
+            ports:      job ports
+        Returns:
+            None
+        '''
+        await self._collection_job_list.update_one(
+            {'uid': job_uid},
+            {'$set': {'job_kwargs.map': ports['ports']}}
+        )
+
+    async def _get_host(self, host_uid):
+        host = await self._collection_resources_list.find_one({"uid": host_uid})
+        if not host:
+            return None
+        self._clean_id(host)
+        return MlexHost.parse_obj(host)
+
+    async def _get_workflow(self, uid=None, worker_uid=None):
+        if uid:
+            item = await self._collection_workflow_list.find_one({"uid": uid})
+            if not item:
+                raise WorkflowNotFound(f"no workflow with id: {uid}")
+        else:
+            item = await self._collection_workflow_list.find_one({"workers_list": worker_uid})
+            if not item:
+                raise WorkflowNotFound(f"no workflow with worker_uid: {worker_uid}")
+        self._clean_id(item)
+        return MlexWorkflow.parse_obj(item)
+
+    async def _get_worker(self, uid=None, job_uid=None):
+        if uid:
+            item = await self._collection_worker_list.find_one({"uid": uid})
+            if not item:
+                raise WorkerNotFound(f"no worker with id: {uid}")
+        else:
+            item = await self._collection_worker_list.find_one({"jobs_list": job_uid})
+            if not item:
+                raise WorkerNotFound(f"no worker with job_uid: {job_uid}")
+        self._clean_id(item)
+        return MlexWorker.parse_obj(item)
+
+    async def _update_host(self, host_uid, worker_requirements, service_type):
+        '''
+        Releases the computing resources back to the host
+        '''
+        await self._collection_resources_list.update_one({"uid": host_uid},
+                                                         self._release_update(worker_requirements, service_type))
+        self._notify('queue', host_uid)
+
+    async def _update_workflow(self, workflow_uid, status, worker_uid=None):
+        '''
+        Update the status of a given workflow
+        '''
+        if worker_uid:
+            workflow = await self._get_workflow(worker_uid=worker_uid)
+            workflow_uid = workflow.uid
+        else:
+            workflow = await self._get_workflow(uid=workflow_uid)
+        if workflow.status != status:                     # update if status has changed
+            for update in self._workflow_status_updates(status):
+                await self._collection_workflow_list.update_one({'uid': workflow_uid}, update)
+        return workflow_uid
+
+    async def _update_dependencies(self, job_uids):
+        '''
+        Updates the job dependencies accross workers
+        Args:
+            job_uids:   List of unique identifiers of the jobs that have finished
+        Returns:
+            None
+        '''
+        dependent_jobs = self._collection_job_list.find({'dependencies': {'$in': job_uids}},
+                                                        {'uid': 1, 'dependencies': 1})
+        job_decrements = self._dependency_decrements([job async for job in dependent_jobs], job_uids)
+        if len(job_decrements) == 0:
+            return
+        await self._collection_job_list.bulk_write([UpdateOne({'uid': uid}, {'$inc': {'pending_deps': -decrement}})
+                                                    for uid, decrement in job_decrements.items()], ordered=False)
+        workers = self._collection_worker_list.find({'jobs_list': {'$in': list(job_decrements)}},
+                                                    {'uid': 1, 'host_uid': 1, 'jobs_list': 1})
+        operations, hosts = self._worker_decrements([worker async for worker in workers], job_decrements)
+        if len(operations) > 0:
+            await self._collection_worker_list.bulk_write(operations, ordered=False)
+        for host_uid in hosts:
+            self._notify('queue', host_uid)
+
+    async def _reserve_host_resources(self, mlex_host, reservations):
+        '''
+        Reserves computing resources at a host in a single atomic operation, as long as they are still available
+        Args:
+            mlex_host:      Host, as retrieved before the reservation
+            reservations:   Resources to reserve per availability field, e.g. {"backend_available": Constraints}
+        Returns:
+            Dictionary of reserved GPUs per availability field, None if the resources are no longer available
+        '''
+        reservation_update = self._reservation_update(mlex_host, reservations)
+        if reservation_update is None:
+            return None
+        query, update = reservation_update
+        host = await self._collection_resources_list.find_one_and_update(query, update,
+                                                                         projection=list(reservations),
+                                                                         return_document=ReturnDocument.BEFORE)
+        if not host:
+            return None
+        return {field: host[field]["list_gpus"][:resources.num_gpus] for field, resources in reservations.items()}
+
+    async def _delete_if_pending(self, job_uid):
+        '''
+        Deletes a job and its logs if it is pending deletion and has finished
+        '''
+        job = await self._collection_job_list.find_one_and_delete(
+            {'uid': job_uid, 'pending_delete': True,
+             'status.state': {'$in': ['complete', 'failed', 'terminated', 'canceled']}},
+            projection={'uid': 1})
+        if job:
+            await self._collection_log_list.delete_many({'job_uid': job_uid})
+
+    async def _append_logs(self, job_uid, logs):
+        '''
+        Appends a new chunk of logs to a given job, without reading its previous logs
+        '''
+        seq = await self._next_log_seq(job_uid)
+        if seq is None:
+            raise JobNotFound(f"no job with id: {job_uid}")
+        await self._collection_log_list.insert_one({'job_uid': job_uid, 'seq': seq, 'logs': logs})
+
+    async def _next_log_seq(self, job_uid):
+        '''
+        Reserves the sequence number of the next log chunk of a given job
+        '''
+        job = await self._collection_job_list.find_one_and_update({'uid': job_uid},
+                                                                  {'$inc': {'log_seq': 1}},
+                                                                  projection={'log_seq': 1},
+                                                                  return_document=ReturnDocument.AFTER)
+        if not job:
+            return None
+        return job['log_seq']
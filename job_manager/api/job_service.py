@@ -1,4 +1,5 @@
 import logging
+import threading
 import time
 
 from datetime import datetime
@@ -6,14 +7,15 @@ from itertools import compress
 from uuid import uuid4
 import math
 import numpy as np
-from ortools.sat.python import cp_model
 import random
 from pymongo.mongo_client import MongoClient
-from pymongo import ReturnDocument
-from typing import List
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import OperationFailure
+from typing import List, Union
 
 from model import UserWorkflow, MlexWorkflow, MlexWorker, MlexJob, MlexHost, Status, WorkerRequirements, ServiceType, \
-                  Constraints, ResourcesQuery, States
+                  Constraints, ResourcesQuery, States, JobLogs, LogChunk, JobEvent, MlexOperation, OperationType, \
+                  BulkQuery, BulkSummary
 
 
 class JobNotFound(Exception):
@@ -28,7 +30,50 @@ class WorkflowNotFound(Exception):
 class WorkflowNotValid(Exception):
     pass
 
+class OperationNotFound(Exception):
+    pass
+
 MAX_COST = 1E10         # cost if not enough resources for cost
+MAX_RESERVATION_ATTEMPTS = 3    # attempts to reserve resources at a host while they are reserved concurrently
+HOST_DRAIN_TIMEOUT = 20         # seconds for the workers at a host to finish before a reset/delete fails
+
+SUBMISSION_ORDER = [('timestamps.submission_time', 1), ('uid', 1)]     # sort order of the list queries
+# indexes per collection, derived from the queries in ComputeService: (keys, index options)
+INDEXES = {
+    'resources_list': [([('uid', 1)], {'unique': True}),
+                       ([('nickname', 1)], {'unique': True}),
+                       ([('hostname', 1)], {'unique': True})],
+    'workflow_list': [([('uid', 1)], {'unique': True}),
+                      ([('user_uid', 1), ('status.state', 1)], {}),
+                      ([('status.state', 1)], {}),
+                      ([('workers_list', 1)], {}),                      # get_workflow(worker_uid=)
+                      (SUBMISSION_ORDER, {})],
+    'worker_list': [([('uid', 1)], {'unique': True}),
+                    ([('host_uid', 1), ('service_type', 1), ('status.state', 1)], {}),     # get_next_worker
+                    ([('status.state', 1)], {}),
+                    ([('jobs_list', 1)], {}),                           # get_worker(job_uid=)
+                    (SUBMISSION_ORDER, {})],
+    'job_list': [([('uid', 1)], {'unique': True}),
+                 ([('user_uid', 1), ('status.state', 1)], {}),
+                 ([('host_uid', 1), ('status.state', 1)], {}),
+                 ([('workflow_uid', 1)], {}),
+                 ([('worker_uid', 1)], {}),
+                 ([('dependencies', 1)], {}),                           # _update_dependencies
+                 ([('status.state', 1)], {}),
+                 ([('mlex_app', 1)], {}),
+                 ([('pending_delete', 1)], {'sparse': True}),          # _reap_deleted_jobs
+                 (SUBMISSION_ORDER, {})],
+    'log_list': [([('job_uid', 1), ('seq', 1)], {'unique': True})],
+    'operation_list': [([('uid', 1)], {'unique': True})]
+}
+# indexes created by previous versions that no query uses
+OBSOLETE_INDEXES = {
+    'workflow_list': ['workflow_type_1', 'status_1'],
+    'worker_list': ['host_uid_1', 'status_1'],
+    'job_list': ['type_1', 'status_1', 'pid_1']
+}
+
+logger = logging.getLogger('job_manager')
 
 class ComputeService:
     def __init__(self, client, db_name=None):
@@ -42,26 +87,25 @@ class ComputeService:
         self._collection_workflow_list = self._db.workflow_list
         self._collection_worker_list = self._db.worker_list
         self._collection_job_list = self._db.job_list
+        self._collection_log_list = self._db.log_list
+        self._collection_operation_list = self._db.operation_list
+        self._subscribers = {}
+        self._subscribers_lock = threading.Lock()
         self._create_indexes()
+        self._backfill_pending_deps()
+        self._backfill_job_owners()
+        self._reap_deleted_jobs()
     
-    def reset_system(self) -> List:
+    def reset_system(self) -> MlexOperation:
         '''
-        Resets database
+        Terminates the workflows at all hosts and starts an operation that resets the database once their workers have
+        finished
         Returns:
-            response_list
+            Operation that tracks the progress of the reset
         '''
-        host_list = self.get_hosts()
-        response_list = []
-        tflag = False
-        for host in host_list:
-            uid, flag = self.reset_host(host.uid)
-            response_list.append({'uid': uid, 'flag': flag})
-            tflag = tflag or flag
-        if not tflag:
-            self._collection_job_list.delete_many({})
-            self._collection_worker_list.delete_many({})
-            self._collection_workflow_list.delete_many({})
-        return response_list
+        for host in self.get_hosts(fields=['uid']):
+            self._terminate_host_workflows(host['uid'])
+        return self._start_drain(OperationType.reset_system)
     
     def hard_reset_system(self) -> str:
         '''
@@ -70,6 +114,7 @@ class ComputeService:
             OK message
         '''
         self._collection_job_list.delete_many({})
+        self._collection_log_list.delete_many({})
         self._collection_worker_list.delete_many({})
         self._collection_workflow_list.delete_many({})
         return 'OK'
@@ -90,61 +135,49 @@ class ComputeService:
         self._collection_resources_list.insert_one(mlex_host_dict)
         return mlex_host.uid
     
-    def reset_host(self, host_uid) -> (str, bool):
+    def reset_host(self, host_uid) -> MlexOperation:
         '''
-        Resets host resources in database
+        Terminates the workflows at a host and starts an operation that waits for their workers to finish
         Args:
             host_uid: [str] host uid
         Returns:
-            host_uid
-            flag:     [bool] flag that indicates if there are hanging containers in the host
+            Operation that tracks the progress of the reset, it fails if there are hanging containers in the host
         '''
-        workflows = self.get_workflows(host_uid=host_uid)
-        for workflow in workflows:
-            self.terminate_workflow(workflow.uid)
-        # check if the workflows have been completely canceled
-        workflows_status = [workflow.status.state for workflow in workflows]
-        count = 0       # up to 20s for all processes to terminate
-        while len(set(['queue', 'running', 'warning']) & set(workflows_status)) > 0 and count<2000:
-            workflows = self.get_workflows(host_uid=host_uid)
-            workflows_status = [workflow.status.state for workflow in workflows]
-            count += 1
-            time.sleep(0.01)
-        if count>=2000:
-            return host_uid, True
-        return host_uid, False
+        self._terminate_host_workflows(host_uid)
+        return self._start_drain(OperationType.reset_host, host_uid)
     
     def hard_reset_host(self, host_uid) -> str:
         self._collection_resources_list.update_one({"uid": host_uid},
                                                    [{"$set": {"frontend_available": "$frontend_constraints",
                                                               "backend_available": "$backend_constraints"}}])
+        self._notify('queue', host_uid)
         return host_uid
     
-    def delete_host(self, host_uid) -> (str, bool):
+    def delete_host(self, host_uid) -> MlexOperation:
         '''
-        Deletes host in database
+        Terminates the workflows at a host and starts an operation that deletes the host once their workers have
+        finished
         Args:
             host_uid: [str] host uid
         Returns:
-            host_uid
+            Operation that tracks the progress of the deletion
         '''
-        workflows = self.get_workflows(host_uid=host_uid)
-        for workflow in workflows:
-            self.terminate_workflow(workflow.uid)
-        # check if the workflows have been completely canceled
-        workflows_status = [workflow.status.state for workflow in workflows]
-        count = 0       # up to 20s for all processes to terminate
-        while len(set(['queue', 'running', 'warning']) & set(workflows_status)) > 0 and count < 2000:
-            workflows = self.get_workflows(host_uid=host_uid)
-            workflows_status = [workflow.status.state for workflow in workflows]
-            count += 1
-            time.sleep(0.01)
-        if count>=2000:
-            return host_uid, True
-        else:
-            # delete host
-            self._collection_resources_list.delete_one({'uid': host_uid})
-        return host_uid, False
+        self._terminate_host_workflows(host_uid)
+        return self._start_drain(OperationType.delete_host, host_uid)
+
+    def get_operation(self, uid: str) -> MlexOperation:
+        '''
+        Finds the operation that matches the query parameters
+        Args:
+            uid:    operation uid
+        Returns:
+            Operation that matches the query
+        '''
+        item = self._collection_operation_list.find_one({"uid": uid})
+        if not item:
+            raise OperationNotFound(f"no operation with id: {uid}")
+        self._clean_id(item)
+        return MlexOperation.parse_obj(item)
 
     def submit_workflow(self, workflow: UserWorkflow) -> MlexWorkflow:
         '''
@@ -160,6 +193,8 @@ class ComputeService:
         self._collection_workflow_list.insert_one(mlex_workflow_dict)
         self._collection_worker_list.insert_many(mlex_workers_dict)
         self._collection_job_list.insert_many(mlex_jobs_dict)
+        for host_uid in set(worker['host_uid'] for worker in mlex_workers_dict):
+            self._notify('queue', host_uid)
         return mlex_workflow.uid
         # return -1
 
@@ -215,15 +250,21 @@ class ComputeService:
 
     def get_hosts(self,
                  hostname: str = None,
-                 nickname: str = None
-                 ) -> List[MlexHost]:
+                 nickname: str = None,
+                 limit: int = None,
+                 after: str = None,
+                 fields: List[str] = None
+                 ) -> List[Union[MlexHost, dict]]:
         '''
         Finds a host that matches the query parameters
         Args:
             hostname:      Hostname
             nickname:      Nickname
+            limit:         Maximum number of hosts
+            after:         Uid of the last host in the previous page
+            fields:        Fields to retrieve, all fields if None
         Returns:
-            MLExchange host with a description of its resources
+            MLExchange host with a description of its resources, or dictionaries with the requested fields
         '''
         subqueries = []
         query = {}
@@ -233,10 +274,12 @@ class ComputeService:
             subqueries.append({"nickname": nickname})
         if len(subqueries) > 0:
             query = {"$and": subqueries}
-        hosts = self._collection_resources_list.find(query)
+        hosts = self._find_page(self._collection_resources_list, query, limit, after, self._projection(fields),
+                                sort_field="uid")
+        if fields:
+            return hosts
         mlex_host = []
         for host in hosts:
-            self._clean_id(host)
             mlex_host.append(MlexHost.parse_obj(host))
         return mlex_host
 
@@ -274,44 +317,48 @@ class ComputeService:
         Returns:
             Port mapping information
         '''
-        workflow = self.get_workflow(uid)
-        ports = {}
-        for worker_uid in workflow.workers_list:
-            worker = self.get_worker(worker_uid)
-            for job_uid in worker.jobs_list:
-                job = self.get_job(job_uid)
-                ports[job.uid] = job.job_kwargs.map
+        if not self._collection_workflow_list.find_one({"uid": uid}, {"uid": 1}):
+            raise WorkflowNotFound(f"no workflow with id: {uid}")
+        jobs = self._collection_job_list.find({"workflow_uid": uid}, {"uid": 1, "job_kwargs.map": 1})
+        ports = {job["uid"]: job["job_kwargs"].get("map") for job in jobs}
         return ports
 
     def get_workflows(self,
                       user: str = None,
                       host_uid: str = None,
                       state: States = None,
-                      ) -> List[MlexWorkflow]:
+                      limit: int = None,
+                      after: str = None,
+                      fields: List[str] = None
+                      ) -> List[Union[MlexWorkflow, dict]]:
         '''
-        Finds list of workflows that match the query parameters
+        Finds list of workflows that match the query parameters, sorted by submission time
         Args:
             user:           username
             host_uid:       host uid
+            state:          state
+            limit:          maximum number of workflows
+            after:          uid of the last workflow in the previous page
+            fields:         fields to retrieve, all fields if None
         Returns:
-            List of workflows that match the query
+            List of workflows that match the query, or dictionaries with the requested fields
         '''
-        query = []
+        subqueries = []
+        query = {}
         if user:
-            query.append({"$match": {"user_uid": user}})
+            subqueries.append({"user_uid": user})
         if host_uid:
-            query += [{"$lookup": {"from": "worker_list",
-                                   "let": {"workers_list": "$workers_list"},
-                                   "pipeline": [{"$match": {"$expr": {"$in": ["$uid", "$$workers_list"]}}}],
-                                   "as": "workers"}},
-                      {"$match": {"workers.host_uid": host_uid}}]
+            workflows_uid = self._collection_job_list.distinct("workflow_uid", {"host_uid": host_uid})
+            subqueries.append({"uid": {"$in": workflows_uid}})
         if state:
-            query.append({"$match": {"status.state": state}})
-        # if worker_uid:
-        #     query.append({"$match": {"workers_list": worker_uid}})
+            subqueries.append({"status.state": state})
+        if len(subqueries) > 0:
+            query = {"$and": subqueries}
+        items = self._find_page(self._collection_workflow_list, query, limit, after, self._projection(fields))
+        if fields:
+            return items
         workflows = []
-        for item in self._collection_workflow_list.aggregate(query):
-            self._clean_id(item)
+        for item in items:
             workflows.append(MlexWorkflow.parse_obj(item))
         return workflows
 
@@ -341,15 +388,21 @@ class ComputeService:
 
     def get_workers(self,
                     host_uid: str = None,
-                    state: States = None
-                    ) -> List[MlexWorker]:
+                    state: States = None,
+                    limit: int = None,
+                    after: str = None,
+                    fields: List[str] = None
+                    ) -> List[Union[MlexWorker, dict]]:
         '''
-        Finds workers that match the query parameters
+        Finds workers that match the query parameters, sorted by submission time
         Args:
             host_uid:       host uid
             state:          state
+            limit:          maximum number of workers
+            after:          uid of the last worker in the previous page
+            fields:         fields to retrieve, all fields if None
         Returns:
-            List of workers that match the query
+            List of workers that match the query, or dictionaries with the requested fields
         '''
         subqueries = []
         query = {}
@@ -359,9 +412,11 @@ class ComputeService:
             subqueries.append({"status.state": state})
         if len(subqueries) > 0:
             query = {"$and": subqueries}
+        items = self._find_page(self._collection_worker_list, query, limit, after, self._projection(fields))
+        if fields:
+            return items
         workers = []
-        for item in self._collection_worker_list.find(query):
-            self._clean_id(item)
+        for item in items:
             workers.append(MlexWorker.parse_obj(item))
         return workers
 
@@ -378,118 +433,62 @@ class ComputeService:
         Returns:
             Next worker to be executed
         '''
-        mlex_host = self.get_host(host_uid=host_uid)
         worker = None
-        if mlex_host:
-            if service_type == "frontend":
-                available_processors = mlex_host.frontend_available.num_processors
-                available_gpus = mlex_host.frontend_available.num_gpus
-                list_gpus = mlex_host.frontend_available.list_gpus
-                available_workers = mlex_host.frontend_available.num_nodes
-
-            if service_type == "backend":
-                available_processors = mlex_host.backend_available.num_processors
-                available_gpus = mlex_host.backend_available.num_gpus
-                list_gpus = mlex_host.backend_available.list_gpus
-                available_workers = mlex_host.backend_available.num_nodes
-
-            if service_type == "hybrid":
-                f_num_processors = mlex_host.frontend_available.num_processors
-                b_num_processors = mlex_host.backend_available.num_processors
-                available_processors =  b_num_processors + f_num_processors
-
-                f_num_gpus = mlex_host.frontend_available.num_gpus
-                b_num_gpus = mlex_host.backend_available.num_gpus
-                available_gpus = f_num_gpus + b_num_gpus
-
-                f_gpus = mlex_host.frontend_available.list_gpus
-                b_gpus = mlex_host.backend_available.list_gpus
-
-                f_num_nodes = mlex_host.frontend_available.num_nodes
-                b_num_nodes = mlex_host.backend_available.num_nodes
-                available_workers = f_num_nodes + b_num_nodes
-            if available_workers > 0:
-                next_worker = self._collection_worker_list.find_one_and_update(
-                    {
-                        "host_uid": host_uid,
-                        "service_type": service_type,
-                        "status.state": "queue",
-                        "requirements.num_processors": {'$lte': available_processors},
-                        "requirements.num_gpus": {'$lte': available_gpus},
-                        "dependencies": 0
-                    },
-                    {"$set": {"status.state": "running", "timestamps.execution_time": datetime.utcnow()},
-                     # "$push": {"requirements.list_gpus": {"$each": list_gpus, "$slice": "$$num_gpus"}}},
-                     },
-                    return_document=ReturnDocument.AFTER)  # returns the updated worker
-
-                if next_worker:  # if a new worker can be launched, update the available resources status in host
-                    self._clean_id(next_worker)
-                    worker = MlexWorker.parse_obj(next_worker)
-                    num_processors = worker.requirements.num_processors
-                    num_gpus = worker.requirements.num_gpus
-                    if service_type == 'hybrid':
-                        (f_av_num_gpus, b_av_num_gpus), (f_aloc_num_gpus, b_aloc_num_gpus) = \
-                            self._update_hybrid_resources(f_num_gpus, b_num_gpus, num_gpus)
-                        (f_av_num_processors, b_av_num_processors), (f_aloc_num_processors, b_aloc_num_processors) = \
-                            self._update_hybrid_resources(f_num_processors, b_num_processors, num_processors)
-                        (f_av_num_nodes, b_av_num_nodes), (f_aloc_num_nodes, b_aloc_num_nodes) = \
-                            self._update_hybrid_resources(f_num_nodes, b_num_nodes, 1)
-                        worker = self._collection_worker_list.find_one_and_update(
-                            {"uid": worker.uid},
-                            {"$set": {"requirements.list_gpus": f_gpus[0:f_aloc_num_gpus] + b_gpus[0:b_aloc_num_gpus],
-                                      "requirements.kwargs": {
-                                          "num_processors": f_aloc_num_processors,
-                                          "num_gpus": f_aloc_num_gpus,
-                                          "list_gpus": f_gpus[0:f_aloc_num_gpus],
-                                          "num_nodes": f_aloc_num_nodes
-                                      }
-                             }},return_document = ReturnDocument.AFTER
-                        )
-                        del f_gpus[0:f_aloc_num_gpus]
-                        del b_gpus[0:b_aloc_num_gpus]
-                        self._collection_resources_list.update_one(
-                            {"uid": host_uid},
-                            {"$set": {
-                                "frontend_available.num_processors": f_av_num_processors,
-                                "frontend_available.num_gpus": f_av_num_gpus,
-                                "frontend_available.list_gpus": f_gpus,
-                                "frontend_available.num_nodes": f_av_num_nodes,
-                                "backend_available.num_processors": b_av_num_processors,
-                                "backend_available.num_gpus": b_av_num_gpus,
-                                "backend_available.list_gpus": b_gpus,
-                                "backend_available.num_nodes": b_av_num_nodes}})
-
-                    else:
-                        worker = self._collection_worker_list.find_one_and_update(
-                            {"uid": worker.uid},
-                            {"$set": {"requirements.list_gpus": list_gpus[0:num_gpus]}},
-                            return_document=ReturnDocument.AFTER
-                        )
-                        available_processors -= num_processors
-                        available_gpus -= num_gpus
-                        del list_gpus[0:num_gpus]
-                        available_workers -= 1
-                        if service_type == "frontend":
-                            self._collection_resources_list.update_one(
-                                {"uid": host_uid},
-                                {"$set": {
-                                    "frontend_available.num_processors": available_processors,
-                                    "frontend_available.num_gpus": available_gpus,
-                                    "frontend_available.list_gpus": list_gpus,
-                                    "frontend_available.num_nodes": available_workers}})
-                        if service_type == "backend":
-                            self._collection_resources_list.update_one(
-                                {"uid": host_uid},
-                                {"$set": {
-                                    "backend_available.num_processors": available_processors,
-                                    "backend_available.num_gpus": available_gpus,
-                                    "backend_available.list_gpus": list_gpus,
-                                    "backend_available.num_nodes": available_workers}})
-                    self._clean_id(worker)
-                    self.update_workflow(None, Status(state='running'), worker['uid'])
+        skipped_workers = []                # workers whose resources could not be reserved in this request
+        for attempt in range(MAX_RESERVATION_ATTEMPTS):
+            mlex_host = self.get_host(host_uid=host_uid)
+            if not mlex_host:
+                break
+            available = self._available_resources(mlex_host, service_type)
+            if available.num_nodes <= 0:
+                break
+            available = available.copy(update={'num_gpus': self._reservable_gpus(mlex_host, service_type)})
+            next_worker = self._collection_worker_list.find_one_and_update(
+                self._next_worker_query(host_uid, service_type, available, skipped_workers),
+                {"$set": {"status.state": "running", "timestamps.execution_time": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER)  # returns the updated worker
+            if not next_worker:
+                break
+            # if a new worker can be launched, reserve its resources at the host
+            requirements = WorkerRequirements.parse_obj(next_worker['requirements'])
+            reservations = self._worker_reservations(mlex_host, service_type, requirements)
+            reserved_gpus = self._reserve_host_resources(mlex_host, reservations)
+            if reserved_gpus is None:
+                # the resources were reserved concurrently by another request or the worker cannot be placed with the
+                # GPUs listed at the host: the worker goes back to queue and the next worker in queue is tried
+                self._collection_worker_list.update_one(
+                    {"uid": next_worker["uid"]},
+                    {"$set": {"status.state": "queue", "timestamps.execution_time": None}})
+                skipped_workers.append(next_worker["uid"])
+                continue
+            worker_update = self._reserved_worker_update(service_type, reservations, reserved_gpus)
+            worker = self._collection_worker_list.find_one_and_update(
+                {"uid": next_worker["uid"]},
+                {"$set": worker_update},
+                return_document=ReturnDocument.AFTER)
+            self._clean_id(worker)
+            self.update_workflow(None, Status(state='running'), worker['uid'])
+            break
         return worker
 
+    def get_next_worker_by_priority(self,
+                                    host_uid: str,
+                                    service_types: List[ServiceType],
+                                    ) -> MlexWorker:
+        '''
+        Finds next worker in queue to be executed at host location, trying the service types in order of priority
+        Args:
+            host_uid:       host uid
+            service_types:  list of service types (frontend, backend, or hybrid) in order of priority
+        Returns:
+            Next worker to be executed
+        '''
+        for service_type in service_types:
+            worker = self.get_next_worker(host_uid, service_type)
+            if worker:
+                return worker
+        return None
+
     def get_job(self,
                 uid: str
                 ) -> MlexJob:
@@ -504,9 +503,80 @@ class ComputeService:
         if not item:
             raise JobNotFound(f"no job with id: {uid}")
         self._clean_id(item)
+        item['logs'] = self._get_logs([uid], {uid: item.get('logs')})[uid]
         job = MlexJob.parse_obj(item)
         return job
 
+    def get_job_event(self,
+                      uid: str
+                      ) -> JobEvent:
+        '''
+        Finds the current status and termination flag of a given job, without retrieving the full job
+        Args:
+            uid:   job uid
+        Returns:
+            Job status and termination flag
+        '''
+        item = self._collection_job_list.find_one({"uid": uid}, {"uid": 1, "status": 1, "terminate": 1})
+        if not item:
+            raise JobNotFound(f"no job with id: {uid}")
+        self._clean_id(item)
+        return JobEvent.parse_obj(item)
+
+    def subscribe(self, event: str, uid: str, callback):
+        '''
+        Registers a callback that is called when an event occurs on a given asset
+        Args:
+            event:      "terminate" when a job is flagged for termination (uid: job uid), "queue" when workers may be
+                        ready to be launched at a host (uid: host uid, None for any host)
+            uid:        asset unique identifier
+            callback:   function that receives the asset uid
+        Returns:
+            None
+        '''
+        with self._subscribers_lock:
+            self._subscribers.setdefault((event, uid), set()).add(callback)
+
+    def unsubscribe(self, event: str, uid: str, callback):
+        '''
+        Removes a callback registered with subscribe
+        Args:
+            event:      event name
+            uid:        asset unique identifier
+            callback:   registered function
+        Returns:
+            None
+        '''
+        with self._subscribers_lock:
+            callbacks = self._subscribers.get((event, uid), set())
+            callbacks.discard(callback)
+            if len(callbacks) == 0:
+                self._subscribers.pop((event, uid), None)
+
+    def get_job_logs(self,
+                     uid: str,
+                     offset: int = 0
+                     ) -> JobLogs:
+        '''
+        Finds the log chunks of a given job that were appended after the given offset
+        Args:
+            uid:        job uid
+            offset:     sequence number of the last log chunk already retrieved
+        Returns:
+            Job logs after offset and the new offset
+        '''
+        item = self._collection_job_list.find_one({"uid": uid}, {"logs": 1, "log_seq": 1})
+        if not item:
+            raise JobNotFound(f"no job with id: {uid}")
+        logs = ''
+        if offset == 0 and item.get('logs'):          # logs stored inline before chunked storage
+            logs = item['logs']
+        chunks = self._collection_log_list.find({"job_uid": uid, "seq": {"$gt": offset}}).sort("seq", 1)
+        for chunk in chunks:
+            logs += chunk['logs']
+            offset = chunk['seq']
+        return JobLogs(uid=uid, logs=logs, offset=offset)
+
     def get_next_job(self,
                 worker_uid: str
                 ) -> MlexJob:
@@ -517,53 +587,26 @@ class ComputeService:
         Returns:
             Job that matches the query
         '''
-        status = Status(**{"state": "running"})
-        worker = self.get_worker(uid=worker_uid)
-        jobs_list = worker.jobs_list
-        job = None
-        self._collection_job_list.aggregate(
-            [{"$match": {"uid": {"$in": jobs_list}, "status.state": "queue"}},
-             {"$lookup": {"from":"job_list",
-                          "let": {"dep": "$dependencies"},
-                          "pipeline": [{"$match": {"$expr": {"$in": ["$uid", "$$dep"]}}},
-                                       {"$group": {"_id": 0, "state":{"$push":"$status.state"}}}],
-                          "as": "dependencies_status"}},
-             {"$set": {"dependencies_status": {"$cond": {"if": {"$eq": ["$dependencies_status", []]},
-                                                             "then": [["no_dependencies"]],
-                                                             "else": "$dependencies_status.state"}}
-                           }},
-             {"$unwind": "$dependencies_status"},
-             {"$set": {"status.state": {"$cond": {"if": {"$in": ["queue", "$dependencies_status"]},
-                                                  "then": "$status.state",
-                                                  "else": {
-                                                      "$cond": {"if": {"$in": ["running", "$dependencies_status"]},
-                                                                "then": "$status.state",
-                                                                "else": "running"}
-                                                  }}
-                                        }}},
-             {"$project": {"dependencies_status": 0}},
-             {"$merge": {"into": "job_list",
-                         "whenMatched": "replace",
-                         "whenNotMatched": "discard"}}
-             ])
+        worker = self._collection_worker_list.find_one({"uid": worker_uid}, {"jobs_list": 1})
+        if not worker:
+            raise WorkerNotFound(f"no worker with id: {worker_uid}")
+        jobs_list = worker["jobs_list"]
+        # dequeues a job in worker whose dependencies have all finished
         item = self._collection_job_list.find_one_and_update({"uid": {"$in": jobs_list},
-                                                              "status.state": "running",
-                                                              "timestamps.execution_time": {"$type":"null"}},
-                                                             {"$set": {"timestamps.execution_time": datetime.utcnow()}})
+                                                              "status.state": "queue",
+                                                              "pending_deps": 0},
+                                                             {"$set": {"status.state": "running",
+                                                                       "timestamps.execution_time": datetime.utcnow()}},
+                                                             return_document=ReturnDocument.AFTER)
         if item:
             self._clean_id(item)
             job = MlexJob.parse_obj(item)
         else:
-            job = -1
-            for elem in jobs_list:      # checks if there are further jobs to run in the workflow (in case some have been canceled)
-                try:
-                    details = self.get_job(elem)
-                    if details['status']['state'] not in ['complete', 'failed', 'terminated', 'canceled']:
-                        job=None
-                        break
-                except Exception as e:
-                    print(f'Exception while retrieving next job for worker {worker_uid}: {e}')
-
+            # checks if there are further jobs to run in the worker (in case some have been canceled)
+            num_pending_jobs = self._collection_job_list.count_documents(
+                {"uid": {"$in": jobs_list},
+                 "status.state": {"$nin": ['complete', 'failed', 'terminated', 'canceled']}})
+            job = None if num_pending_jobs > 0 else -1
         return job
 
     def get_jobs(self,
@@ -572,48 +615,48 @@ class ComputeService:
                  host_uid: str = None,
                  service_type: ServiceType = None,
                  state: States = None,
-                 ) -> List[MlexJob]:
+                 limit: int = None,
+                 after: str = None,
+                 fields: List[str] = None
+                 ) -> List[Union[MlexJob, dict]]:
         '''
-        Finds jobs that match the query parameters
+        Finds jobs that match the query parameters, sorted by submission time
         Args:
             user:       username
             mlex_app:   MLExchange app associated with job
             host_uid:   host uid
             service_type: service type
             state:      job state
+            limit:      maximum number of jobs
+            after:      uid of the last job in the previous page
+            fields:     fields to retrieve, all fields but logs if None
         Returns:
-            List of jobs that match the query
+            List of jobs that match the query, or dictionaries with the requested fields
         '''
-
-        query = []
-        if mlex_app:
-            query.append({"$match": {"mlex_app": mlex_app}})
+        subqueries = []
+        query = {}
         if user:
-            query += [{"$lookup": {"from": "worker_list",
-                                   "let": {"job_uid": "$uid"},
-                                   "pipeline": [{"$match": {"$expr": {"$in": ["$$job_uid", "$jobs_list"]}}}],
-                                   "as": "workers"}},
-                      {"$unwind": "$workers"},
-                      {"$lookup": {"from": "workflow_list",
-                                   "let": {"worker_uid": "$workers.uid"},
-                                   "pipeline": [{"$match": {"$expr": {"$in": ["$$worker_uid", "$workers_list"]}}}],
-                                   "as": "workflows"}},
-                      {"$unwind": "$workflows"},
-                      {"$match": {"workflows.user_uid": user}}]
+            subqueries.append({"user_uid": user})
         if host_uid:
-            query += [{"$lookup": {"from": "worker_list",
-                                   "let": {"job_uid": "$uid"},
-                                   "pipeline": [{"$match": {"$expr": {"$in": ["$$job_uid", "$jobs_list"]}}}],
-                                   "as": "workers"}},
-                      {"$unwind": "$workers"},
-                      {"$match": {"workers.host_uid": host_uid}}]
+            subqueries.append({"host_uid": host_uid})
+        if mlex_app:
+            subqueries.append({"mlex_app": mlex_app})
         if service_type:
-            query.append({"$match": {"service_type": service_type}})
+            subqueries.append({"service_type": service_type})
         if state:
-            query.append({"$match": {"status.state": state}})
+            subqueries.append({"status.state": state})
+        if len(subqueries) > 0:
+            query = {"$and": subqueries}
+        projection = self._projection(fields) if fields else {"logs": 0}
+        items = self._find_page(self._collection_job_list, query, limit, after, projection)
+        if fields and "logs" in fields:
+            logs = self._get_logs([item['uid'] for item in items], {item['uid']: item.get('logs') for item in items})
+            for item in items:
+                item['logs'] = logs[item['uid']]
+        if fields:
+            return items
         jobs = []
-        for item in self._collection_job_list.aggregate(query):
-            self._clean_id(item)
+        for item in items:
             jobs.append(MlexJob.parse_obj(item))
         return jobs
 
@@ -627,42 +670,9 @@ class ComputeService:
         Returns:
             None
         '''
-        num_processors = worker_requirements.num_processors
-        num_gpus = worker_requirements.num_gpus
-        list_gpus = worker_requirements.list_gpus
-        if service_type == 'frontend':
-            self._collection_resources_list.update_one(
-                {"uid": host_uid},
-                {"$addToSet": {"frontend_available.list_gpus": {"$each": list_gpus}},
-                 "$inc": {"frontend_available.num_processors": num_processors,
-                          "frontend_available.num_gpus": num_gpus,
-                          "frontend_available.num_nodes": 1}
-                 })
-        if service_type == 'backend':
-            self._collection_resources_list.update_one(
-                {"uid": host_uid},
-                {"$addToSet": {"backend_available.list_gpus": {"$each": list_gpus}},
-                 "$inc": {"backend_available.num_processors": num_processors,
-                          "backend_available.num_gpus": num_gpus,
-                          "backend_available.num_nodes": 1}
-                 })
-        if service_type == 'hybrid':
-            frontend_specs = Constraints.parse_obj(worker_requirements.kwargs)
-            f_num_processors = frontend_specs.num_processors
-            f_num_gpus = frontend_specs.num_gpus
-            f_list_gpus = frontend_specs.list_gpus
-            f_num_workers = frontend_specs.num_nodes
-            self._collection_resources_list.update_one(
-                {"uid": host_uid},
-                {"$addToSet": {"frontend_available.list_gpus": {"$each": f_list_gpus},
-                               "backend_available.list_gpus": {"$each": list(set(list_gpus)^set(f_list_gpus))}},
-                 "$inc": {"frontend_available.num_processors": f_num_processors,
-                          "frontend_available.num_gpus": f_num_gpus,
-                          "frontend_available.num_nodes": f_num_workers,
-                          "backend_available.num_processors": num_processors - f_num_processors,
-                          "backend_available.num_gpus": num_gpus - f_num_gpus,
-                          "backend_available.num_nodes": 1 - f_num_workers}
-                 })
+        self._collection_resources_list.update_one({"uid": host_uid},
+                                                   self._release_update(worker_requirements, service_type))
+        self._notify('queue', host_uid)
         pass
 
     def update_workflow(self, workflow_uid: str, status: Status, worker_uid: str = None):
@@ -680,18 +690,8 @@ class ComputeService:
         else:
             workflow = self.get_workflow(uid=workflow_uid)
         if workflow.status != status:                     # update if status has changed
-            if status.state == 'running':
-                self._collection_workflow_list.update_one(
-                    {'uid': workflow_uid},
-                    {'$set': {'status': status.dict(), "timestamps.execution_time": datetime.utcnow()}})
-            if status.state in ['complete', 'complete with errors', 'failed', 'terminated', 'canceled']:
-                self._collection_workflow_list.update_one(
-                    {'uid': workflow_uid},
-                    {'$set': {'status': status.dict(), "timestamps.end_time": datetime.utcnow()}})
-            else:
-                self._collection_workflow_list.update_one(
-                    {'uid': workflow_uid},
-                    {'$set': {'status': status.dict()}})
+            for update in self._workflow_status_updates(status):
+                self._collection_workflow_list.update_one({'uid': workflow_uid}, update)
         return workflow_uid
 
     def terminate_workflow(self, workflow_uid: str):
@@ -741,24 +741,11 @@ class ComputeService:
                     {'uid': worker_uid},
                     {'$set': {'status': status.dict()}})
             workflow = self.get_workflow(worker_uid=worker_uid)
-            last_worker = True                          # check if this is the last job in worker
-            for item_uid in workflow.workers_list:
-                item = self.get_worker(uid=item_uid)
-                if item.status.state in ['running', 'queue', 'warning'] and item.uid != worker_uid:
-                    last_worker = False
-                    break
-            # check if it is the last worker in workflow with error/termination
-            if last_worker and workflow.status.state == 'warning' and \
-                    status.state in ['complete', 'complete with errors']:
-                status.state = 'complete with errors'
-            # if it is not the last worker in workflow and the worker has failed, completed with errors or was
-            # terminated or canceled, the workflow is tagged with a "warning"
-            elif not last_worker and (workflow.status.state == 'warning' or \
-                    status.state in ['failed', 'terminated', 'canceled', 'complete with errors']):
-                status.state = 'warning'
-            # if it is not the last worker, but it has completed it's execution
-            elif not last_worker and status.state == 'complete':
-                status.state = 'running'
+            # check if this is the last worker in workflow
+            last_worker = self._collection_worker_list.count_documents(
+                {'uid': {'$in': workflow.workers_list, '$ne': worker_uid},
+                 'status.state': {'$in': ['running', 'queue', 'warning']}}) == 0
+            status.state = self._workflow_state(status.state, workflow.status.state, last_worker)
             print(f'current workflow state: {workflow.status.state}')
             print(f'being changed to: {status.state}')
             if workflow.status.state != status.state:               # update if status has changed
@@ -800,48 +787,74 @@ class ComputeService:
         Returns:
             None
         '''
-        job = self.get_job(uid = job_uid)
+        finished = status is not None and status.state in ['complete', 'failed', 'terminated', 'canceled']
         if status:
-            if job.status.state != status.state:                              # update if state has changed
-                if status.state in ['complete', 'failed', 'terminated', 'canceled']:
-                    self._collection_job_list.update_one(
-                        {'uid': job_uid},
-                        {'$set': {'status': status.dict(), "timestamps.end_time": datetime.utcnow()}})
-                    self._update_dependencies(job_uid)
-                else:
-                    self._collection_job_list.update_one(
-                        {'uid': job_uid},
-                        {'$set': {'status': status.dict()}})
+            job = self._collection_job_list.find_one({"uid": job_uid}, {"status": 1})
+            if not job:
+                raise JobNotFound(f"no job with id: {job_uid}")
+            updated = job['status']['state'] != status.state                      # update if state has changed
+            if updated and finished:
+                # only the first final status is applied, such that the dependencies are updated once
+                result = self._collection_job_list.update_one(
+                    {'uid': job_uid, 'status.state': {'$nin': ['complete', 'failed', 'terminated', 'canceled']}},
+                    {'$set': {'status': status.dict(), "timestamps.end_time": datetime.utcnow()}})
+                updated = result.modified_count == 1
+                if updated:
+                    self._update_dependencies([job_uid])
+            elif updated:
+                self._collection_job_list.update_one(
+                    {'uid': job_uid},
+                    {'$set': {'status': status.dict()}})
+            if updated:
                 worker = self.get_worker(job_uid=job_uid)               # retrieve worker information
-                last_job = True                                         # check if this is the last job in worker
-                for item_uid in worker.jobs_list:
-                    item = self.get_job(uid=item_uid)
-                    if item.status.state in ['running', 'queue'] and item.uid != job_uid:
-                        last_job = False
-                        break
-                if status.state in ['failed', 'terminated', 'canceled']:      # if the job failed or was terminated/canceled,
-                    status.state = 'warning'                                  # the worker is tagged as "warning"
-                # check if it is the last job in worker with error/termination
-                if last_job and (worker.status.state == 'warning' or status.state == 'warning'):
-                    status.state = 'complete with errors'
-                # if it is not the last job in worker and there was a previous error/termination
-                elif worker.status.state == 'warning':
-                    status.state = 'warning'
-                # if it is not the last job, but it has completed it's execution
-                elif not last_job and status.state == 'complete':
-                    status.state = 'running'
+                # check if this is the last job in worker
+                last_job = self._collection_job_list.count_documents(
+                    {'uid': {'$in': worker.jobs_list, '$ne': job_uid},
+                     'status.state': {'$in': ['running', 'queue']}}) == 0
+                status.state = self._worker_state(status.state, worker.status.state, last_job)
                 if worker.status.state != status.state:                       # update if state has changed
                     self.update_worker(worker_uid=worker.uid, status=status)
         if logs:
-            current_logs = job.logs
-            if current_logs is not None:
-                logs = current_logs + logs
-            self._collection_job_list.update_one(
-                {'uid': job_uid},
-                {'$set': {'logs': logs}}
-            )
+            self._append_logs(job_uid, logs)
+        if finished:
+            self._delete_if_pending(job_uid)
         pass
     
+    def append_logs(self, chunks: List[LogChunk]) -> List[str]:
+        '''
+        Appends a batch of logs to one or more jobs, the chunks of each job are stored as a single new log chunk. The
+        statuses in the chunks are applied once the logs have been stored, such that a job can send its last logs and
+        its final status in the same batch
+        Args:
+            chunks:     List of log chunks, in the order they were produced
+        Returns:
+            List of job uids that were updated
+        '''
+        job_logs = {}
+        for chunk in chunks:
+            if chunk.logs:
+                job_logs.setdefault(chunk.uid, []).append(chunk.logs)
+        documents = []
+        for job_uid, logs in job_logs.items():
+            seq = self._next_log_seq(job_uid)
+            if seq is None:
+                logger.warning(f'Discarding logs of unknown job {job_uid}')
+                continue
+            documents.append({'job_uid': job_uid, 'seq': seq, 'logs': ''.join(logs)})
+        if len(documents) > 0:
+            self._collection_log_list.insert_many(documents)
+        job_uids = [document['job_uid'] for document in documents]
+        for chunk in chunks:
+            if chunk.status:
+                try:
+                    self.update_job(chunk.uid, chunk.status)
+                except JobNotFound:
+                    logger.warning(f'Discarding status of unknown job {chunk.uid}')
+                    continue
+                if chunk.uid not in job_uids:
+                    job_uids.append(chunk.uid)
+        return job_uids
+
     def update_job_mapping(self, job_uid: str, ports: dict):
         '''
         Update the status of a given job and the worker associated with this job
@@ -878,25 +891,139 @@ class ComputeService:
             {'$set': {'terminate': True, 'status.state': 'canceled'}}
         )
         if results.modified_count>0:        # if the job is cancelled, update dependencies
-            self._update_dependencies(job_uid)
+            self._update_dependencies([job_uid])
+        self._notify('terminate', job_uid)
         pass
 
     def delete_job(self, job_uid: str):
         '''
-        Deletes a given job
+        Deletes a given job. The job is terminated and flagged as pending deletion, it is deleted once it finishes
         Args:
             job_uid: job unique identifier
         Returns:
             None
         '''
+        result = self._collection_job_list.update_one({'uid': job_uid}, {'$set': {'pending_delete': True}})
+        if result.matched_count == 0:
+            raise JobNotFound(f"no job with id: {job_uid}")
         self.terminate_job(job_uid)                                             # terminates the job
-        job = self._collection_job_list.find_one({"uid": job_uid})
-        while job['status']['state'] not in ['complete', 'failed', 'terminated', 'canceled']: # wait until it terminates
-            time.sleep(1)
-            job = self._collection_job_list.find_one({"uid": job_uid})
-        self._collection_job_list.delete_one({'uid': job_uid})                  # deletes
+        self._delete_if_pending(job_uid)                                        # deletes if it has already finished
         pass
 
+    def terminate_jobs(self, query: BulkQuery) -> BulkSummary:
+        '''
+        Terminates the jobs that match the query with set-based updates
+        Args:
+            query:      Job uids and/or filters
+        Returns:
+            Summary of the terminated jobs
+        '''
+        job_uids = self._collection_job_list.distinct('uid', self._bulk_jobs_query(query))
+        return self._terminate_jobs(job_uids)
+
+    def delete_jobs(self, query: BulkQuery) -> BulkSummary:
+        '''
+        Deletes the jobs that match the query with set-based updates. The jobs are terminated and flagged as pending
+        deletion, the jobs that have already finished are deleted right away
+        Args:
+            query:      Job uids and/or filters
+        Returns:
+            Summary of the deleted jobs
+        '''
+        job_uids = self._collection_job_list.distinct('uid', self._bulk_jobs_query(query))
+        self._collection_job_list.update_many({'uid': {'$in': job_uids}}, {'$set': {'pending_delete': True}})
+        summary = self._terminate_jobs(job_uids)
+        finished_query = {'uid': {'$in': job_uids}, 'pending_delete': True,
+                          'status.state': {'$in': ['complete', 'failed', 'terminated', 'canceled']}}
+        finished_jobs = self._collection_job_list.distinct('uid', finished_query)
+        summary.deleted = self._collection_job_list.delete_many(finished_query).deleted_count
+        self._collection_log_list.delete_many({'job_uid': {'$in': finished_jobs}})
+        return summary
+
+    def terminate_workflows(self, query: BulkQuery) -> BulkSummary:
+        '''
+        Terminates the workflows that match the query, and their workers and jobs, with set-based updates
+        Args:
+            query:      Workflow uids and/or filters
+        Returns:
+            Summary of the terminated workflows and jobs
+        '''
+        workflows = list(self._collection_workflow_list.find(self._bulk_workflows_query(query),
+                                                             {'uid': 1, 'workers_list': 1}))
+        workflow_uids = [workflow['uid'] for workflow in workflows]
+        worker_uids = [worker_uid for workflow in workflows for worker_uid in workflow['workers_list']]
+        job_uids = self._collection_job_list.distinct('uid', {'workflow_uid': {'$in': workflow_uids}})
+        summary = self._terminate_jobs(job_uids)
+        summary.matched = len(workflow_uids)
+        for collection, uids in [(self._collection_worker_list, worker_uids),
+                                 (self._collection_workflow_list, workflow_uids)]:
+            # terminate if it has not finalized yet, or cancel if it is in queue
+            collection.update_many(
+                {'uid': {'$in': uids}, 'status.state': {'$nin': ['complete', 'failed', 'complete with errors']}},
+                {'$set': {'terminate': True}})
+            collection.update_many(
+                {'uid': {'$in': uids}, 'status.state': 'queue'},
+                {'$set': {'terminate': True, 'status.state': 'canceled'}})
+        return summary
+
+    def requeue_workflows(self, query: BulkQuery) -> BulkSummary:
+        '''
+        Sends the finished workflows that match the query back to queue, their jobs are executed again from scratch
+        Args:
+            query:      Workflow uids and/or filters
+        Returns:
+            Summary of the requeued workflows
+        '''
+        workflows_query = self._bulk_workflows_query(query)
+        summary = BulkSummary(matched=self._collection_workflow_list.count_documents(workflows_query))
+        finished_query = {'$and': [workflows_query,
+                                   {'status.state': {'$in': ['complete', 'complete with errors', 'failed',
+                                                             'terminated', 'canceled']}}]}
+        workflows = list(self._collection_workflow_list.find(finished_query, {'uid': 1, 'workers_list': 1}))
+        if len(workflows) == 0:
+            return summary
+        workflow_uids = [workflow['uid'] for workflow in workflows]
+        worker_uids = [worker_uid for workflow in workflows for worker_uid in workflow['workers_list']]
+        # all the updates are computed before writing, leaving out the jobs that were deleted
+        jobs = list(self._collection_job_list.find({'workflow_uid': {'$in': workflow_uids},
+                                                    'pending_delete': {'$ne': True}},
+                                                   {'uid': 1, 'dependencies': 1}))
+        job_uids = set(job['uid'] for job in jobs)
+        workers = list(self._collection_worker_list.find({'uid': {'$in': worker_uids}},
+                                                         {'uid': 1, 'host_uid': 1, 'jobs_list': 1}))
+        for worker in workers:
+            worker['jobs_list'] = [job_uid for job_uid in worker['jobs_list'] if job_uid in job_uids]
+        # the workers without jobs left keep their state, as well as the workflows without workers to requeue
+        workers = [worker for worker in workers if len(worker['jobs_list']) > 0]
+        requeued_workers = set(worker['uid'] for worker in workers)
+        workflow_uids = [workflow['uid'] for workflow in workflows
+                         if requeued_workers.intersection(workflow['workers_list'])]
+        if len(workflow_uids) == 0:
+            return summary
+        # jobs wait again for all their dependencies that have not been deleted
+        dependencies = {job['uid']: job['dependencies'] for job in jobs}
+        pending_deps = {job_uid: len([dep for dep in dependencies[job_uid] if dep in job_uids])
+                        for worker in workers for job_uid in worker['jobs_list']}
+        queue = Status(state='queue').dict()
+        reset = {'status': queue, 'terminate': None, 'error': None,
+                 'timestamps.execution_time': None, 'timestamps.end_time': None}
+        job_updates = [UpdateOne({'uid': uid}, {'$set': dict(reset, pending_deps=num_deps, logs=None, log_seq=0)})
+                       for uid, num_deps in pending_deps.items()]
+        worker_updates = [UpdateOne({'uid': worker['uid']},
+                                    {'$set': dict(reset, jobs_list=worker['jobs_list'],
+                                                  dependencies=[pending_deps[job_uid]
+                                                                for job_uid in worker['jobs_list']],
+                                                  **{'requirements.list_gpus': [], 'requirements.kwargs': None})})
+                          for worker in workers]
+        self._collection_job_list.bulk_write(job_updates, ordered=False)
+        self._collection_log_list.delete_many({'job_uid': {'$in': list(pending_deps)}})
+        self._collection_worker_list.bulk_write(worker_updates, ordered=False)
+        self._collection_workflow_list.update_many({'uid': {'$in': workflow_uids}}, {'$set': reset})
+        for host_uid in set(worker['host_uid'] for worker in workers):
+            self._notify('queue', host_uid)
+        summary.requeued = len(workflow_uids)
+        return summary
+
     def split_workers(self, user_workflow: UserWorkflow):
         '''
         This function receives an user-defined MLExchange workflow and returns the lists of workers with their
@@ -911,28 +1038,22 @@ class ComputeService:
         requirements = user_workflow.requirements
         job_list = user_workflow.job_list
         constraints = requirements.constraints
-        cost_matrix = []
         if constraints:
-            num_nodes = 0
-            list_num_processors = []
-            list_num_gpus = []
-            costs = []
-            for constraint in constraints:
-                num_nodes += constraint.num_nodes
-                list_num_processors.extend([constraint.num_processors] * num_nodes)
-                list_num_gpus.extend([constraint.num_gpus] * num_nodes)
-                costs.extend(self._calculate_cost(job_list, constraint.num_processors, constraint.num_gpus) *
-                             constraint.num_nodes)
+            nodes_per_constraint = [constraint.num_nodes for constraint in constraints]
+            num_nodes = sum(nodes_per_constraint)
+            list_num_processors = np.repeat([constraint.num_processors for constraint in constraints],
+                                            nodes_per_constraint).tolist()
+            list_num_gpus = np.repeat([constraint.num_gpus for constraint in constraints],
+                                      nodes_per_constraint).tolist()
         else:
             num_nodes = requirements.num_nodes
             num_processors = requirements.num_processors
             num_gpus = requirements.num_gpus
-            host_uid = requirements.host_uid
-            costs = (self._calculate_cost(job_list, num_processors, num_gpus) * num_nodes)
-        cost_matrix = np.array(costs)
-        cost_matrix = cost_matrix.reshape(num_nodes, len(job_list))
+            list_num_processors = [num_processors] * num_nodes
+            list_num_gpus = [num_gpus] * num_nodes
+        cost_matrix = self._calculate_cost(job_list, list_num_processors, list_num_gpus)
         print(f'Cost matrix: {cost_matrix}')
-        if MAX_COST*num_nodes in sum(cost_matrix):
+        if (cost_matrix >= MAX_COST).all(axis=0).any():     # a job does not fit in any node
             raise WorkflowNotValid(f"the list of jobs cannot be completed with the arranged resources")
         allocation_matrix = self._assign_jobs(cost_matrix)
         mlex_jobs_dict = []
@@ -945,14 +1066,24 @@ class ComputeService:
             job.dependencies = list(map(jobs_uid.__getitem__, user_workflow.dependencies[str(ind)]))
             worker_dependencies[ind] = len(job.dependencies)
             services_type.append(job.service_type)      # frontend vs backend
-            mlex_jobs_dict.append(job.dict())
+            job_dict = job.dict()
+            job_dict['pending_deps'] = len(job.dependencies)    # number of dependencies that have not finished
+            job_dict['user_uid'] = user_workflow.user_uid
+            job_dict['workflow_uid'] = user_workflow.uid
+            mlex_jobs_dict.append(job_dict)
         mlex_workers_dict = []
         worker_uid_list = []
+        query = {'hostname': {'$in': host_list}} if host_list else {}     # no host list means any host
+        hosts = self._find_hosts(query)                                     # candidate hosts, loaded once
+        eligible_hosts = {}
+        placed_processors = dict.fromkeys([host.uid for host in hosts], 0)
         for node in range(num_nodes):
             if constraints:
                 num_processors = list_num_processors[node]
                 num_gpus = list_num_gpus[node]
                 requirements = {'num_processors':num_processors, "num_gpus": num_gpus}
+            if not allocation_matrix[node,].any():
+                continue                                # more nodes than jobs
             jobs_in_node = list(compress(jobs_uid, allocation_matrix[node,]))
             dependencies = list(compress(worker_dependencies, allocation_matrix[node,]))
             services_in_node = list(compress(services_type, allocation_matrix[node,]))
@@ -960,13 +1091,19 @@ class ComputeService:
                 service_type = services_in_node[0]      # if all are frontend or backend
             else:
                 service_type = 'hybrid'
-            resources_query = ResourcesQuery(num_processors=num_processors,
-                                             num_gpus=num_gpus,
-                                             service_type=service_type)
-            host = self.get_host(hostnames=host_list, resources_query=resources_query)
-            if not host:
+            resources_key = (service_type, num_processors, num_gpus)
+            if resources_key not in eligible_hosts:
+                resources_query = ResourcesQuery(num_processors=num_processors,
+                                                 num_gpus=num_gpus,
+                                                 service_type=service_type)
+                eligible_hosts[resources_key] = [host for host in hosts if self._host_fits(host, resources_query)]
+            if not eligible_hosts[resources_key]:
                 raise WorkflowNotValid(f"not enough resources to execute workflow")
-            host_uid = MlexHost.parse_obj(host).uid
+            # spread the nodes across the eligible hosts by their spare capacity
+            host_uid = max(eligible_hosts[resources_key],
+                           key=lambda host: self._available_resources(host, service_type).num_processors -
+                                            placed_processors[host.uid]).uid
+            placed_processors[host_uid] += num_processors or 0
             worker = MlexWorker(uid=str(uuid4()),
                                 service_type=service_type,
                                 host_uid=host_uid,
@@ -976,6 +1113,9 @@ class ComputeService:
             worker_uid_list.append(worker.uid)
             worker_dict = worker.dict()
             mlex_workers_dict.append(worker_dict)
+            for ind in compress(range(len(job_list)), allocation_matrix[node,]):
+                mlex_jobs_dict[ind]['worker_uid'] = worker.uid
+                mlex_jobs_dict[ind]['host_uid'] = host_uid
         if len(set(services_type)) == 1:
             workflow_service_type = services_type[0]    # if all are frontend or backend
         else:
@@ -984,58 +1124,695 @@ class ComputeService:
         user_workflow.service_type = workflow_service_type
         return user_workflow.dict(), mlex_workers_dict, mlex_jobs_dict
 
-    def _update_dependencies(self, job_uid):
+    def _update_dependencies(self, job_uids):
         '''
         Updates the job dependencies accross workers
+        Args:
+            job_uids:   List of unique identifiers of the jobs that have finished
+        Returns:
+            None
+        '''
+        # update dependencies, a job is decreased once per finished dependency
+        dependent_jobs = self._collection_job_list.find({'dependencies': {'$in': job_uids}},
+                                                        {'uid': 1, 'dependencies': 1})
+        job_decrements = self._dependency_decrements(dependent_jobs, job_uids)
+        if len(job_decrements) == 0:
+            return
+        self._collection_job_list.bulk_write([UpdateOne({'uid': uid}, {'$inc': {'pending_deps': -decrement}})
+                                              for uid, decrement in job_decrements.items()], ordered=False)
+        # update workers dependencies, decreasing the counters of all the dependent jobs in a single bulk operation
+        workers = self._collection_worker_list.find({'jobs_list': {'$in': list(job_decrements)}},
+                                                    {'uid': 1, 'host_uid': 1, 'jobs_list': 1})
+        operations, hosts = self._worker_decrements(workers, job_decrements)
+        if len(operations) > 0:
+            self._collection_worker_list.bulk_write(operations, ordered=False)
+        for host_uid in hosts:
+            self._notify('queue', host_uid)
+
+    def _reserve_host_resources(self, mlex_host, reservations):
+        '''
+        Reserves computing resources at a host in a single atomic operation, as long as they are still available
+        Args:
+            mlex_host:      Host, as retrieved before the reservation
+            reservations:   Resources to reserve per availability field, e.g. {"backend_available": Constraints}
+        Returns:
+            Dictionary of reserved GPUs per availability field, None if the resources are no longer available
+        '''
+        reservation_update = self._reservation_update(mlex_host, reservations)
+        if reservation_update is None:
+            return None
+        query, update = reservation_update
+        host = self._collection_resources_list.find_one_and_update(query, update,
+                                                                   projection=list(reservations),
+                                                                   return_document=ReturnDocument.BEFORE)
+        if not host:
+            return None
+        return {field: host[field]["list_gpus"][:resources.num_gpus] for field, resources in reservations.items()}
+
+    def _terminate_jobs(self, job_uids):
+        '''
+        Terminates a list of jobs with set-based updates, the jobs in queue are canceled and their dependencies updated
+        Args:
+            job_uids:   List of job unique identifiers
+        Returns:
+            Summary of the terminated jobs
+        '''
+        cancel_uid = str(uuid4())
+        self._collection_job_list.update_many(
+            {'uid': {'$in': job_uids}, 'status.state': {'$nin': ['complete', 'failed']}},
+            {'$set': {'terminate': True}})
+        # the jobs canceled by this update are marked with its uid, such that their dependencies are updated once
+        self._collection_job_list.update_many(
+            {'uid': {'$in': job_uids}, 'status.state': 'queue'},
+            {'$set': {'terminate': True, 'status.state': 'canceled', 'timestamps.end_time': datetime.utcnow(),
+                      'cancel_uid': cancel_uid}})
+        canceled_jobs = self._collection_job_list.distinct('uid', {'uid': {'$in': job_uids}, 'cancel_uid': cancel_uid})
+        if len(canceled_jobs) > 0:
+            self._update_dependencies(canceled_jobs)
+        terminating = self._collection_job_list.count_documents({'uid': {'$in': job_uids},
+                                                                 'status.state': 'running'})
+        for job_uid in job_uids:
+            self._notify('terminate', job_uid)
+        return BulkSummary(matched=len(job_uids), canceled=len(canceled_jobs), terminating=terminating)
+
+    def _bulk_jobs_query(self, query):
+        '''
+        Builds the query of the jobs that match a bulk query
+        '''
+        subqueries = []
+        if query.uids is not None:
+            subqueries.append({"uid": {"$in": query.uids}})
+        if query.user:
+            subqueries.append({"user_uid": query.user})
+        if query.host_uid:
+            subqueries.append({"host_uid": query.host_uid})
+        if query.mlex_app:
+            subqueries.append({"mlex_app": query.mlex_app})
+        if query.state:
+            subqueries.append({"status.state": query.state})
+        return {"$and": subqueries}
+
+    def _bulk_workflows_query(self, query):
+        '''
+        Builds the query of the workflows that match a bulk query, the host and app filters match the workflows with
+        at least one job at the host or from the app
+        '''
+        subqueries = []
+        if query.uids is not None:
+            subqueries.append({"uid": {"$in": query.uids}})
+        if query.user:
+            subqueries.append({"user_uid": query.user})
+        if query.host_uid:
+            workflows_uid = self._collection_job_list.distinct("workflow_uid", {"host_uid": query.host_uid})
+            subqueries.append({"uid": {"$in": workflows_uid}})
+        if query.mlex_app:
+            workflows_uid = self._collection_job_list.distinct("workflow_uid", {"mlex_app": query.mlex_app})
+            subqueries.append({"uid": {"$in": workflows_uid}})
+        if query.state:
+            subqueries.append({"status.state": query.state})
+        return {"$and": subqueries}
+
+    def _delete_if_pending(self, job_uid):
+        '''
+        Deletes a job and its logs if it is pending deletion and has finished
         Args:
             job_uid:    Job unique identifier
         Returns:
             None
         '''
-        # update dependencies
-        dependent_jobs = self._collection_job_list.find({'dependencies': job_uid})
-        dependent_jobs = [dependent_job['uid'] for dependent_job in dependent_jobs]
-        # update workers dependencies
-        workers = self._collection_worker_list.find({'jobs_list': {'$in': dependent_jobs}})
-        for worker in workers:
-            worker = MlexWorker.parse_obj(worker)
-            worker_jobs = worker.jobs_list
-            for indx, worker_job in enumerate(worker_jobs):
-                if worker_job in dependent_jobs:
-                    self._collection_worker_list.update_one(
-                        {"uid": worker.uid},
-                        {"$inc": {f"dependencies.{indx}": -1}},
-                    )
-        # self._collection_worker_list.update_many(
-        #     {'jobs_list': {'$in': dependent_jobs}},
-        #     {'$inc': {"dependencies.$[ind]": -1}},
-        #     {"arrayFilters": [{"jobs_list.$[ind]": {'$in': dependent_jobs} }]}
-        # )
-        #                              {"$cond": {"if": {"$in": ["dependencies.$", dependent_jobs]},
-        #                         "then": -1,
-        #                         "else": 0}}}
-        #      }
-        # )
-        # #                     {"dependencies.$": -1}}
+        job = self._collection_job_list.find_one_and_delete(
+            {'uid': job_uid, 'pending_delete': True,
+             'status.state': {'$in': ['complete', 'failed', 'terminated', 'canceled']}},
+            projection={'uid': 1})
+        if job:
+            self._collection_log_list.delete_many({'job_uid': job_uid})
+
+    def _reap_deleted_jobs(self):
+        '''
+        Deletes the finished jobs that are pending deletion, e.g. if the service stopped before deleting them
+        Returns:
+            None
+        '''
+        terminal_states = ['complete', 'failed', 'terminated', 'canceled']
+        jobs = self._collection_job_list.find({'pending_delete': True, 'status.state': {'$in': terminal_states}},
+                                              {'uid': 1})
+        for job in jobs:
+            self._delete_if_pending(job['uid'])
+
+    def _terminate_host_workflows(self, host_uid):
+        '''
+        Terminates the workflows with workers at a given host
+        Args:
+            host_uid:   Host unique identifier
+        Returns:
+            None
+        '''
+        for workflow in self.get_workflows(host_uid=host_uid, fields=['uid']):
+            self.terminate_workflow(workflow['uid'])
+
+    def _start_drain(self, operation_type, host_uid=None):
+        '''
+        Records a new operation and drains the host in a background thread
+        Args:
+            operation_type:     Operation type
+            host_uid:           Host unique identifier, None for all hosts
+        Returns:
+            Operation
+        '''
+        operation = MlexOperation(uid=str(uuid4()), operation_type=operation_type, host_uid=host_uid,
+                                  status=Status(state='running'))
+        self._collection_operation_list.insert_one(operation.dict())
+        threading.Thread(target=self._drain_host, args=(operation.uid, operation_type, host_uid), daemon=True).start()
+        return operation
+
+    def _drain_host(self, operation_uid, operation_type, host_uid):
+        '''
+        Waits for the workers at a host to finish and completes the operation. The workers are only counted again when
+        a worker releases its resources at the host
+        Args:
+            operation_uid:      Operation unique identifier
+            operation_type:     Operation type
+            host_uid:           Host unique identifier, None for all hosts
+        Returns:
+            None
+        '''
+        query = {'status.state': {'$in': ['queue', 'running', 'warning']}}
+        if host_uid:
+            query['host_uid'] = host_uid
+        notified = threading.Event()
+        callback = lambda _: notified.set()
+        deadline = time.monotonic() + HOST_DRAIN_TIMEOUT
+        self.subscribe('queue', host_uid, callback)         # subscribe before counting to avoid missing notifications
+        try:
+            while True:
+                notified.clear()
+                pending_workers = self._collection_worker_list.count_documents(query)
+                remaining = deadline - time.monotonic()
+                if pending_workers == 0 or remaining <= 0:
+                    break
+                self._collection_operation_list.update_one({'uid': operation_uid},
+                                                           {'$set': {'pending_workers': pending_workers}})
+                notified.wait(remaining)
+        finally:
+            self.unsubscribe('queue', host_uid, callback)
+        if pending_workers > 0:
+            self._collection_operation_list.update_one(
+                {'uid': operation_uid},
+                {'$set': {'status.state': 'failed', 'pending_workers': pending_workers,
+                          'error': f'{pending_workers} workers did not finish in {HOST_DRAIN_TIMEOUT} s',
+                          'timestamps.end_time': datetime.utcnow()}})
+            return
+        if operation_type == OperationType.delete_host:
+            self._collection_resources_list.delete_one({'uid': host_uid})
+        if operation_type == OperationType.reset_system:
+            self._collection_job_list.delete_many({})
+            self._collection_log_list.delete_many({})
+            self._collection_worker_list.delete_many({})
+            self._collection_workflow_list.delete_many({})
+        self._collection_operation_list.update_one(
+            {'uid': operation_uid},
+            {'$set': {'status.state': 'complete', 'pending_workers': 0, 'timestamps.end_time': datetime.utcnow()}})
+
+    def _notify(self, event, uid):
+        '''
+        Calls the callbacks subscribed to an event on a given asset
+        Args:
+            event:      Event name
+            uid:        Asset unique identifier
+        Returns:
+            None
+        '''
+        with self._subscribers_lock:
+            callbacks = list(self._subscribers.get((event, uid), []))
+            if event == 'queue':
+                callbacks += list(self._subscribers.get((event, None), []))
+        for callback in callbacks:
+            callback(uid)
+
+    def _append_logs(self, job_uid, logs):
+        '''
+        Appends a new chunk of logs to a given job, without reading its previous logs
+        Args:
+            job_uid:    Job unique identifier
+            logs:       New chunk of logs
+        Returns:
+            None
+        '''
+        seq = self._next_log_seq(job_uid)
+        if seq is None:
+            raise JobNotFound(f"no job with id: {job_uid}")
+        self._collection_log_list.insert_one({'job_uid': job_uid, 'seq': seq, 'logs': logs})
+
+    def _next_log_seq(self, job_uid):
+        '''
+        Reserves the sequence number of the next log chunk of a given job
+        Args:
+            job_uid:    Job unique identifier
+        Returns:
+            Sequence number, None if the job does not exist
+        '''
+        job = self._collection_job_list.find_one_and_update({'uid': job_uid},
+                                                            {'$inc': {'log_seq': 1}},
+                                                            projection={'log_seq': 1},
+                                                            return_document=ReturnDocument.AFTER)
+        if not job:
+            return None
+        return job['log_seq']
+
+    def _get_logs(self, job_uids, inline_logs=None):
+        '''
+        Assembles the logs of a list of jobs from their log chunks
+        Args:
+            job_uids:       List of job unique identifiers
+            inline_logs:    Logs stored in the job documents before chunked storage, per job uid
+        Returns:
+            Dictionary of logs per job uid, None if the job has no logs
+        '''
+        logs = {job_uid: None for job_uid in job_uids}
+        if inline_logs:
+            logs.update({job_uid: inline_logs[job_uid] for job_uid in job_uids if inline_logs.get(job_uid)})
+        if len(job_uids) > 0:
+            chunks = self._collection_log_list.find({'job_uid': {'$in': job_uids}}).sort([('job_uid', 1), ('seq', 1)])
+            for chunk in chunks:
+                logs[chunk['job_uid']] = (logs[chunk['job_uid']] or '') + chunk['logs']
+        return logs
+
+    def _backfill_pending_deps(self):
+        '''
+        Sets the number of unfinished dependencies of queued jobs that were submitted before this counter was introduced
+        Returns:
+            None
+        '''
+        jobs = self._collection_job_list.find({'status.state': 'queue', 'pending_deps': {'$exists': False}},
+                                              {'uid': 1, 'dependencies': 1})
+        for job in jobs:
+            pending_deps = self._collection_job_list.count_documents(
+                {'uid': {'$in': job['dependencies']},
+                 'status.state': {'$nin': ['complete', 'failed', 'terminated', 'canceled']}})
+            self._collection_job_list.update_one({'uid': job['uid']}, {'$set': {'pending_deps': pending_deps}})
+
+    def _backfill_job_owners(self):
+        '''
+        Sets the user, workflow, worker and host uids of the jobs that were submitted before these fields were stored in
+        the job documents
+        Returns:
+            None
+        '''
+        if not self._collection_job_list.find_one({'workflow_uid': {'$exists': False}}, {'uid': 1}):
+            return
+        workflows = self._collection_workflow_list.find({}, {'uid': 1, 'user_uid': 1, 'workers_list': 1})
+        for workflow in workflows:
+            workers = self._collection_worker_list.find({'uid': {'$in': workflow['workers_list']}},
+                                                        {'uid': 1, 'host_uid': 1, 'jobs_list': 1})
+            operations = [UpdateMany({'uid': {'$in': worker['jobs_list']}, 'workflow_uid': {'$exists': False}},
+                                     {'$set': {'user_uid': workflow['user_uid'],
+                                               'workflow_uid': workflow['uid'],
+                                               'worker_uid': worker['uid'],
+                                               'host_uid': worker['host_uid']}})
+                          for worker in workers]
+            if len(operations) > 0:
+                self._collection_job_list.bulk_write(operations, ordered=False)
 
     def _create_indexes(self):
-        self._collection_resources_list.create_index([('nickname', 1)], unique=True)
-        self._collection_resources_list.create_index([('hostname', 1)], unique=True)
+        for collection_name, indexes in INDEXES.items():
+            collection = self._db[collection_name]
+            existing_indexes = collection.index_information()
+            for index_name in OBSOLETE_INDEXES.get(collection_name, []):
+                if index_name in existing_indexes:
+                    collection.drop_index(index_name)
+            for keys, kwargs in indexes:
+                collection.create_index(keys, **kwargs)
+
+    def check_indexes(self) -> dict:
+        '''
+        Compares the indexes in the database with the expected index set and reports the indexes that are missing or
+        have not been used since the database started. The usage is only available when the database supports
+        $indexStats
+        Returns:
+            Dictionary with the missing and unused index names per collection
+        '''
+        report = {}
+        for collection_name, indexes in INDEXES.items():
+            collection = self._db[collection_name]
+            try:
+                usage = {stat['name']: stat['accesses']['ops']
+                         for stat in collection.aggregate([{'$indexStats': {}}])}
+            except (OperationFailure, NotImplementedError):
+                usage = {index_name: None for index_name in collection.index_information()}
+            expected = ['_'.join(f'{key}_{direction}' for key, direction in keys) for keys, _ in indexes]
+            missing = [index_name for index_name in expected if index_name not in usage]
+            unused = [index_name for index_name, ops in usage.items() if ops == 0 and index_name != '_id_']
+            if missing:
+                logger.warning(f'Missing indexes in {collection_name}: {missing}')
+            if unused:
+                logger.info(f'Unused indexes in {collection_name}: {unused}')
+            report[collection_name] = {'missing': missing, 'unused': unused}
+        return report
+
+    def _find_page(self, collection, query, limit=None, after=None, projection=None,
+                   sort_field="timestamps.submission_time"):
+        '''
+        Finds a page of documents sorted by a given field and uid
+        Args:
+            collection:     Collection to query
+            query:          Query
+            limit:          Maximum number of documents, all documents if None
+            after:          Uid of the last document in the previous page
+            projection:     Projection
+            sort_field:     Field used to sort the documents, ties are sorted by uid
+        Returns:
+            List of documents without mongo ID
+        '''
+        sort = [(sort_field, 1), ("uid", 1)] if sort_field != "uid" else [("uid", 1)]
+        if after:
+            if sort_field == "uid":
+                query = {"$and": [query, {"uid": {"$gt": after}}]}
+            else:
+                last_item = collection.find_one({"uid": after}, {sort_field: 1})
+                if last_item:
+                    last_value = last_item
+                    for key in sort_field.split("."):
+                        last_value = last_value.get(key) if last_value else None
+                    query = {"$and": [query, {"$or": [{sort_field: {"$gt": last_value}},
+                                                      {sort_field: last_value, "uid": {"$gt": after}}]}]}
+        cursor = collection.find(query, projection).sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        items = []
+        for item in cursor:
+            self._clean_id(item)
+            items.append(item)
+        return items
+
+    def _find_hosts(self, query):
+        '''
+        Finds the hosts that match a query
+        Args:
+            query:          Hosts query
+        Returns:
+            List of MLExchange hosts
+        '''
+        mlex_hosts = []
+        for host in self._collection_resources_list.find(query):
+            self._clean_id(host)
+            mlex_hosts.append(MlexHost.parse_obj(host))
+        return mlex_hosts
 
-        self._collection_workflow_list.create_index([('uid', 1)], unique=True)
-        self._collection_workflow_list.create_index([('user_uid', 1)])
-        self._collection_workflow_list.create_index([('workflow_type', 1)])
-        self._collection_workflow_list.create_index([('status', 1)])
+    @classmethod
+    def _host_fits(cls, mlex_host, resources_query):
+        '''
+        Checks in memory if the maximum resources of a host can fit the queried resources, as in get_host
+        Args:
+            mlex_host:          Host
+            resources_query:    Resources query
+        Returns:
+            True if the host fits the resources
+        '''
+        constraints = cls._service_resources(mlex_host.frontend_constraints, mlex_host.backend_constraints,
+                                             resources_query.service_type)
+        return (constraints.num_processors or 0) >= (resources_query.num_processors or 0) and \
+            (constraints.num_gpus or 0) >= (resources_query.num_gpus or 0)
 
-        self._collection_worker_list.create_index([('uid', 1)], unique=True)
-        self._collection_worker_list.create_index([('host_uid', 1)])
-        self._collection_worker_list.create_index([('status', 1)])
+    @staticmethod
+    def _reservable_gpus(mlex_host, service_type):
+        '''
+        Finds the number of GPUs that can be reserved at a host for a given service type, i.e. the GPUs that are
+        available and listed at the host
+        Args:
+            mlex_host:      Host
+            service_type:   frontend, backend, or hybrid
+        Returns:
+            Number of GPUs
+        '''
+        fields = {'frontend': ['frontend_available'],
+                  'backend': ['backend_available'],
+                  'hybrid': ['frontend_available', 'backend_available']}[ServiceType(service_type).value]
+        return sum(min(getattr(mlex_host, field).num_gpus, len(getattr(mlex_host, field).list_gpus))
+                   for field in fields)
 
-        self._collection_job_list.create_index([('uid', 1)], unique=True)
-        self._collection_job_list.create_index([('mlex_app', 1)])
-        self._collection_job_list.create_index([('type', 1)])
-        self._collection_job_list.create_index([('status', 1)])
-        self._collection_job_list.create_index([('pid', 1)])
+    @classmethod
+    def _available_resources(cls, mlex_host, service_type):
+        '''
+        Finds the resources available at a host for a given service type
+        Args:
+            mlex_host:      Host
+            service_type:   frontend, backend, or hybrid
+        Returns:
+            Available constraints
+        '''
+        return cls._service_resources(mlex_host.frontend_available, mlex_host.backend_available, service_type)
+
+    @staticmethod
+    def _service_resources(front, back, service_type):
+        '''
+        Combines the frontend and backend resources of a host for a given service type
+        Args:
+            front:          Frontend constraints
+            back:           Backend constraints
+            service_type:   frontend, backend, or hybrid
+        Returns:
+            Constraints
+        '''
+        if service_type == "frontend":
+            return front
+        if service_type == "backend":
+            return back
+        return Constraints(num_processors=front.num_processors + back.num_processors,
+                           num_gpus=front.num_gpus + back.num_gpus,
+                           num_nodes=front.num_nodes + back.num_nodes)
+
+    @staticmethod
+    def _next_worker_query(host_uid, service_type, available, skipped_workers=()):
+        '''
+        Builds the query of the queued workers that fit in the available resources at a host, leaving out the skipped
+        workers
+        '''
+        return {"host_uid": host_uid,
+                "uid": {"$nin": list(skipped_workers)},
+                "service_type": service_type,
+                "status.state": "queue",
+                "requirements.num_processors": {'$lte': available.num_processors},
+                "requirements.num_gpus": {'$lte': available.num_gpus},
+                "dependencies": 0}
+
+    @classmethod
+    def _worker_reservations(cls, mlex_host, service_type, requirements):
+        '''
+        Splits the requirements of a worker across the availability fields of a host
+        Args:
+            mlex_host:      Host
+            service_type:   frontend, backend, or hybrid
+            requirements:   Worker requirements
+        Returns:
+            Resources to reserve per availability field, e.g. {"backend_available": Constraints}
+        '''
+        service_type = ServiceType(service_type).value     # the enum does not format as its value in f-strings
+        num_processors = requirements.num_processors
+        num_gpus = requirements.num_gpus
+        if service_type != 'hybrid':
+            return {f"{service_type}_available": Constraints(num_processors=num_processors,
+                                                              num_gpus=num_gpus,
+                                                              num_nodes=1)}
+        front = mlex_host.frontend_available
+        back = mlex_host.backend_available
+        _, (f_aloc_num_gpus, b_aloc_num_gpus) = \
+            cls._update_hybrid_resources(front.num_gpus, back.num_gpus, num_gpus)
+        _, (f_aloc_num_processors, b_aloc_num_processors) = \
+            cls._update_hybrid_resources(front.num_processors, back.num_processors, num_processors)
+        _, (f_aloc_num_nodes, b_aloc_num_nodes) = \
+            cls._update_hybrid_resources(front.num_nodes, back.num_nodes, 1)
+        return {"frontend_available": Constraints(num_processors=f_aloc_num_processors,
+                                                  num_gpus=f_aloc_num_gpus,
+                                                  num_nodes=f_aloc_num_nodes),
+                "backend_available": Constraints(num_processors=b_aloc_num_processors,
+                                                 num_gpus=b_aloc_num_gpus,
+                                                 num_nodes=b_aloc_num_nodes)}
+
+    @staticmethod
+    def _reserved_worker_update(service_type, reservations, reserved_gpus):
+        '''
+        Builds the update of the requirements of a worker with the resources that were reserved at the host
+        '''
+        worker_update = {"requirements.list_gpus": reserved_gpus.get("frontend_available", []) +
+                                                   reserved_gpus.get("backend_available", [])}
+        if service_type == 'hybrid':
+            frontend = reservations["frontend_available"]
+            worker_update["requirements.kwargs"] = {"num_processors": frontend.num_processors,
+                                                    "num_gpus": frontend.num_gpus,
+                                                    "list_gpus": reserved_gpus["frontend_available"],
+                                                    "num_nodes": frontend.num_nodes}
+        return worker_update
+
+    @staticmethod
+    def _reservation_update(mlex_host, reservations):
+        '''
+        Builds the guarded query and the update that reserve resources at a host in a single atomic operation
+        Args:
+            mlex_host:      Host, as retrieved before the reservation
+            reservations:   Resources to reserve per availability field, e.g. {"backend_available": Constraints}
+        Returns:
+            Query and update, None if the host did not list enough GPUs
+        '''
+        query = {"uid": mlex_host.uid}
+        update = {"$inc": {}, "$push": {}}
+        for field, resources in reservations.items():
+            num_listed_gpus = len(getattr(mlex_host, field).list_gpus)
+            if resources.num_gpus > num_listed_gpus:
+                return None
+            query[f"{field}.num_processors"] = {"$gte": resources.num_processors}
+            query[f"{field}.num_gpus"] = {"$gte": resources.num_gpus}
+            query[f"{field}.num_nodes"] = {"$gte": resources.num_nodes}
+            update["$inc"][f"{field}.num_processors"] = -resources.num_processors
+            update["$inc"][f"{field}.num_gpus"] = -resources.num_gpus
+            update["$inc"][f"{field}.num_nodes"] = -resources.num_nodes
+            if resources.num_gpus > 0:
+                # the first GPUs in list are reserved, as long as the list has not changed its size
+                query[f"{field}.list_gpus"] = {"$size": num_listed_gpus}
+                update["$push"][f"{field}.list_gpus"] = {"$each": [],
+                                                         "$slice": resources.num_gpus - num_listed_gpus}
+        if len(update["$push"]) == 0:
+            del update["$push"]
+        return query, update
+
+    @staticmethod
+    def _release_update(worker_requirements, service_type):
+        '''
+        Builds the update that releases the resources of a worker back to its host
+        Args:
+            worker_requirements:    Work requirements
+            service_type:           Backend, Frontend, Hybrid
+        Returns:
+            Update
+        '''
+        service_type = ServiceType(service_type).value     # the enum does not format as its value in f-strings
+        num_processors = worker_requirements.num_processors
+        num_gpus = worker_requirements.num_gpus
+        list_gpus = worker_requirements.list_gpus
+        if service_type == 'hybrid':
+            frontend_specs = Constraints.parse_obj(worker_requirements.kwargs)
+            f_num_processors = frontend_specs.num_processors
+            f_num_gpus = frontend_specs.num_gpus
+            f_list_gpus = frontend_specs.list_gpus
+            f_num_workers = frontend_specs.num_nodes
+            return {"$addToSet": {"frontend_available.list_gpus": {"$each": f_list_gpus},
+                                  "backend_available.list_gpus": {"$each": list(set(list_gpus)^set(f_list_gpus))}},
+                    "$inc": {"frontend_available.num_processors": f_num_processors,
+                             "frontend_available.num_gpus": f_num_gpus,
+                             "frontend_available.num_nodes": f_num_workers,
+                             "backend_available.num_processors": num_processors - f_num_processors,
+                             "backend_available.num_gpus": num_gpus - f_num_gpus,
+                             "backend_available.num_nodes": 1 - f_num_workers}}
+        return {"$addToSet": {f"{service_type}_available.list_gpus": {"$each": list_gpus}},
+                "$inc": {f"{service_type}_available.num_processors": num_processors,
+                         f"{service_type}_available.num_gpus": num_gpus,
+                         f"{service_type}_available.num_nodes": 1}}
+
+    @staticmethod
+    def _workflow_status_updates(status):
+        '''
+        Builds the updates of a workflow that changes to a given status
+        '''
+        updates = []
+        if status.state == 'running':
+            updates.append({'$set': {'status': status.dict(), "timestamps.execution_time": datetime.utcnow()}})
+        if status.state in ['complete', 'complete with errors', 'failed', 'terminated', 'canceled']:
+            updates.append({'$set': {'status': status.dict(), "timestamps.end_time": datetime.utcnow()}})
+        else:
+            updates.append({'$set': {'status': status.dict()}})
+        return updates
+
+    @staticmethod
+    def _worker_state(job_state, worker_state, last_job):
+        '''
+        Finds the state of a worker after one of its jobs changes its state
+        Args:
+            job_state:      New job state
+            worker_state:   Current worker state
+            last_job:       True if there are no other jobs running or in queue in the worker
+        Returns:
+            New worker state
+        '''
+        state = job_state
+        if state in ['failed', 'terminated', 'canceled']:       # if the job failed or was terminated/canceled,
+            state = 'warning'                                   # the worker is tagged as "warning"
+        # check if it is the last job in worker with error/termination
+        if last_job and (worker_state == 'warning' or state == 'warning'):
+            state = 'complete with errors'
+        # if it is not the last job in worker and there was a previous error/termination
+        elif worker_state == 'warning':
+            state = 'warning'
+        # if it is not the last job, but it has completed it's execution
+        elif not last_job and state == 'complete':
+            state = 'running'
+        return state
+
+    @staticmethod
+    def _workflow_state(worker_state, workflow_state, last_worker):
+        '''
+        Finds the state of a workflow after one of its workers changes its state
+        Args:
+            worker_state:   New worker state
+            workflow_state: Current workflow state
+            last_worker:    True if there are no other workers running, in queue or with warnings in the workflow
+        Returns:
+            New workflow state
+        '''
+        state = worker_state
+        # check if it is the last worker in workflow with error/termination
+        if last_worker and workflow_state == 'warning' and state in ['complete', 'complete with errors']:
+            state = 'complete with errors'
+        # if it is not the last worker in workflow and the worker has failed, completed with errors or was
+        # terminated or canceled, the workflow is tagged with a "warning"
+        elif not last_worker and (workflow_state == 'warning' or
+                                  state in ['failed', 'terminated', 'canceled', 'complete with errors']):
+            state = 'warning'
+        # if it is not the last worker, but it has completed it's execution
+        elif not last_worker and state == 'complete':
+            state = 'running'
+        return state
+
+    @staticmethod
+    def _dependency_decrements(dependent_jobs, job_uids):
+        '''
+        Counts the finished dependencies of each dependent job
+        Args:
+            dependent_jobs:     Jobs with their dependencies
+            job_uids:           List of unique identifiers of the jobs that have finished
+        Returns:
+            Number of finished dependencies per dependent job uid
+        '''
+        finished_jobs = set(job_uids)
+        return {job['uid']: len(finished_jobs.intersection(job['dependencies'])) for job in dependent_jobs}
+
+    @staticmethod
+    def _worker_decrements(workers, job_decrements):
+        '''
+        Builds the updates that decrease the dependency counters of the dependent jobs in their workers
+        Args:
+            workers:            Workers with their list of jobs and host
+            job_decrements:     Number of finished dependencies per dependent job uid
+        Returns:
+            List of worker updates and set of host uids of these workers
+        '''
+        operations = []
+        hosts = set()
+        for worker in workers:
+            decrements = {f"dependencies.{indx}": -job_decrements[worker_job]
+                          for indx, worker_job in enumerate(worker['jobs_list']) if worker_job in job_decrements}
+            operations.append(UpdateOne({"uid": worker['uid']}, {"$inc": decrements}))
+            hosts.add(worker['host_uid'])
+        return operations, hosts
+
+    @staticmethod
+    def _projection(fields):
+        '''
+        Builds the projection of a list of fields, the uid is always included
+        '''
+        if not fields:
+            return None
+        projection = {field: 1 for field in fields}
+        projection["uid"] = 1
+        return projection
 
     @staticmethod
     def _clean_id(data):
@@ -1046,81 +1823,99 @@ class ComputeService:
             del data['_id']
 
     @staticmethod
-    def _calculate_cost(job_list, num_processors, num_gpus):
+    def _calculate_cost(job_list, list_num_processors, list_num_gpus):
         '''
-        Calculates the costs of the list of jobs for a given worker with the input constraints
+        Calculates the cost matrix of the list of jobs for the nodes with the input constraints, where the cost is the
+        number of unused resources in the node and MAX_COST when the job does not fit in the node. The requirements
+        that are not defined in a job take the value of the node
         Args:
-            job_list:           List of jobs
-            num_processors:     Number of CPUs
-            num_gpus:           Number of GPUs
+            job_list:               List of jobs
+            list_num_processors:    Number of CPUs per node
+            list_num_gpus:          Number of GPUs per node
+        Returns:
+            Cost matrix (nodes x jobs)
         '''
         penalty = 10            # penalty for GPUs
-        costs = []
-        for job in job_list:
-            cost = 0
-            if job.requirements:
-                job_num_processors = job.requirements.num_processors
-                job_num_gpus = job.requirements.num_gpus
-                if not job_num_processors:
-                    job_num_processors = num_processors
-                if not job_num_gpus:
-                    job_num_gpus = num_gpus
-                if num_processors>=job_num_processors and num_gpus>=job_num_gpus:
-                    cost = num_processors - job_num_processors + penalty*(num_gpus - job_num_gpus)
-                else:
-                    cost = MAX_COST
-            costs.append(cost)
-        return costs
+        job_processors = np.array([job.requirements.num_processors or np.nan if job.requirements else np.nan
+                                   for job in job_list], dtype=float)
+        job_gpus = np.array([job.requirements.num_gpus or np.nan if job.requirements else np.nan
+                             for job in job_list], dtype=float)
+        node_processors = np.array(list_num_processors, dtype=float)[:, np.newaxis]
+        node_gpus = np.array(list_num_gpus, dtype=float)[:, np.newaxis]
+        unused_processors = np.where(np.isnan(job_processors), 0, node_processors - job_processors)
+        unused_gpus = np.where(np.isnan(job_gpus), 0, node_gpus - job_gpus)
+        fits = (unused_processors >= 0) & (unused_gpus >= 0)
+        return np.where(fits, unused_processors + penalty * unused_gpus, MAX_COST)
 
     @staticmethod
     def _assign_jobs(cost_matrix):
         '''
-        Creates an allocation matrix for jobs and workers
+        Creates an allocation matrix for jobs and workers that minimizes the total cost, such that each job is assigned
+        to one worker and each worker receives at least one job. Each job is first assigned to its cheapest worker. If
+        some workers are left without jobs, the jobs that cover every worker are chosen with a minimum cost assignment
+        over the extra cost of moving a job away from its cheapest worker, which gives the optimal allocation. If there
+        are more workers than jobs, the cheapest assignment is kept
         Args:
             cost_matrix:    Cost matrix
+        Returns:
+            Allocation matrix (workers x jobs)
         '''
         num_workers, num_tasks = cost_matrix.shape
-        demands = np.ones((num_tasks)).astype(int)
-        supply = np.ones((num_workers)).astype(int)*num_tasks
-        model = cp_model.CpModel()
-        x = {}
-        for worker in range(num_workers):
-            for task in range(num_tasks):
-                x[worker, task] = model.NewBoolVar(f'x[{worker}, {task}]')
-
-        for worker in range(num_workers):
-            model.Add(sum(x[worker, task] for task in range(num_tasks)) <= supply[worker])
-
-        for worker in range(num_workers):
-            model.Add(sum(x[worker, task] for task in range(num_tasks)) >= 1)
-
-        for task in range(num_tasks):
-            model.Add(sum(x[worker, task] for worker in range(num_workers)) == demands[task])
-
-        objective_terms = []
-        for worker in range(num_workers):
-            for task in range(num_tasks):
-                objective_terms.append(cost_matrix[worker][task] * x[worker, task])
-
-        model.Minimize(sum(objective_terms))
-        solver = cp_model.CpSolver()
-        status = solver.Solve(model)
-
-        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            print(f'Total cost = {solver.ObjectiveValue()}\n')
-
-        val = []
-        for worker in range(num_workers):
-            for task in range(num_tasks):
-                try:
-                    val.append(solver.Value(x[worker, task]))
-                except:
-                    print("error could not find value")
-        
-        sol = np.array(val)
-        sol = sol.reshape(num_workers, num_tasks)
-        print(f'Job assignment: {sol}')
-        return sol
+        assignment = np.argmin(cost_matrix, axis=0)                 # cheapest worker per job
+        jobs_per_worker = np.bincount(assignment, minlength=num_workers)
+        if num_workers <= num_tasks and not jobs_per_worker.all():
+            extra_cost = cost_matrix - cost_matrix.min(axis=0)
+            workers, tasks = ComputeService._min_cost_assignment(extra_cost)
+            assignment[tasks] = workers
+        allocation_matrix = np.zeros((num_workers, num_tasks), dtype=int)
+        allocation_matrix[assignment, np.arange(num_tasks)] = 1
+        return allocation_matrix
+
+    @staticmethod
+    def _min_cost_assignment(cost_matrix):
+        '''
+        Assigns a different column to each row with the minimum total cost (Hungarian algorithm with potentials, the
+        scan over columns is vectorized)
+        Args:
+            cost_matrix:    Cost matrix (rows x columns), with rows <= columns
+        Returns:
+            Array of rows and array of their assigned columns
+        '''
+        num_rows, num_cols = cost_matrix.shape
+        u = np.zeros(num_rows + 1)
+        v = np.zeros(num_cols + 1)
+        row_of_col = np.zeros(num_cols + 1, dtype=int)          # 1-based row matched to each column, 0 if free
+        way = np.zeros(num_cols + 1, dtype=int)
+        for row in range(1, num_rows + 1):
+            row_of_col[0] = row
+            col0 = 0
+            min_slack = np.full(num_cols + 1, np.inf)
+            used = np.zeros(num_cols + 1, dtype=bool)
+            while True:
+                used[col0] = True
+                row0 = row_of_col[col0]
+                free = ~used
+                free[0] = False
+                slack = np.full(num_cols + 1, np.inf)
+                slack[1:] = cost_matrix[row0 - 1] - u[row0] - v[1:]
+                improve = free & (slack < min_slack)
+                min_slack[improve] = slack[improve]
+                way[improve] = col0
+                candidates = np.where(free, min_slack, np.inf)
+                col1 = int(np.argmin(candidates))
+                delta = candidates[col1]
+                u[row_of_col[used]] += delta
+                v[used] -= delta
+                min_slack[free] -= delta
+                col0 = col1
+                if row_of_col[col0] == 0:
+                    break
+            while col0 != 0:                                    # augmenting path
+                col1 = way[col0]
+                row_of_col[col0] = row_of_col[col1]
+                col0 = col1
+        cols = np.nonzero(row_of_col[1:])[0]
+        return row_of_col[cols + 1] - 1, cols
 
     @staticmethod
     def _update_hybrid_resources(front, back, job):
@@ -1,13 +1,22 @@
+import asyncio
+from functools import partial
 import logging
 import os
-from typing import List, Optional
+from typing import Callable, List, Optional, Union
+import zlib
 
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
 from pydantic import BaseModel, parse_obj_as
+from starlette.concurrency import run_in_threadpool
 from starlette.config import Config
 import uvicorn
 
-from model import MlexHost, MlexJob, MlexWorker, MlexWorkflow, UserWorkflow, Status, ResourcesQuery, States, ServiceType
+from model import MlexHost, MlexJob, MlexWorker, MlexWorkflow, UserWorkflow, Status, ResourcesQuery, States, ServiceType, \
+                  JobLogs, LogChunk, JobEvent, MlexOperation, BulkQuery, BulkSummary
+from async_job_service import AsyncComputeService
 from job_service import ComputeService, Context
 
 
@@ -25,6 +34,7 @@ def init_logging():
 config = Config()
 JOB_MANAGER_DB_NAME = config("JOB_MANAGER_DB_NAME", cast=str, default="job_manager")
 JOB_MANAGER_LOG_LEVEL = config("JOB_MANAGER_LOG_LEVEL", cast=str, default="INFO")
+MAX_LOGS_SIZE = config("MAX_LOGS_SIZE", cast=int, default=16 * 1024 * 1024)    # bytes of a decompressed logs batch
 MONGO_DB_USERNAME = os.getenv('MONGO_INITDB_ROOT_USERNAME', default="")
 MONGO_DB_PASSWORD = os.getenv('MONGO_INITDB_ROOT_PASSWORD', default="")
 MONGO_DB_URI = "mongodb://%s:%s@mongodb:27017/?authSource=admin" % (MONGO_DB_USERNAME, MONGO_DB_PASSWORD)
@@ -33,36 +43,120 @@ API_URL_PREFIX = "/api/v0"
 
 init_logging()
 
+
+class GzipRequest(Request):
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            if "gzip" in self.headers.getlist("Content-Encoding"):
+                # decompresses up to the maximum size, such that a small body cannot exhaust the memory
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                try:
+                    body = decompressor.decompress(body, MAX_LOGS_SIZE + 1)
+                except zlib.error as err:
+                    raise HTTPException(status_code=400, detail=f'Invalid gzip body: {err}')
+                if len(body) > MAX_LOGS_SIZE:
+                    raise HTTPException(status_code=413, detail=f'Decompressed body exceeds {MAX_LOGS_SIZE} bytes')
+            self._body = body
+        return self._body
+
+
+class GzipRoute(APIRoute):
+    '''
+    Route that accepts gzip-compressed request bodies, only used by the log ingestion endpoint
+    '''
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def custom_route_handler(request: Request) -> Response:
+            request = GzipRequest(request.scope, request.receive)
+            return await original_route_handler(request)
+
+        return custom_route_handler
+
+
 app = FastAPI(
     openapi_url="/api/job_manager/openapi.json",
     docs_url="/api/job_manager/docs",
     redoc_url="/api/job_manager/redoc",)
+logs_router = APIRouter(route_class=GzipRoute)
 
 
 svc_context = Context
 
 
 @app.on_event("startup")
-def startup_event():
-    from pymongo import MongoClient
+async def startup_event():
+    from motor.motor_asyncio import AsyncIOMotorClient
     logger.debug('starting server')
-    db = MongoClient(MONGO_DB_URI)
-    comp_svc = ComputeService(db)
+    comp_svc = AsyncComputeService(AsyncIOMotorClient(MONGO_DB_URI))
+    await call_service(comp_svc.check_indexes)
     svc_context.comp_svc = comp_svc
 
 
-def set_compute_service(new_comp_svc: ComputeService):
+def set_compute_service(new_comp_svc: Union[AsyncComputeService, ComputeService]):
     global comp_svc
     svc_context.comp_svc = new_comp_svc
 
 
+async def call_service(method: Callable, *args, **kwargs):
+    '''
+    Calls an operation of the compute service. The asynchronous operations of AsyncComputeService are awaited on the
+    event loop, while the blocking operations of ComputeService (e.g. the control-plane operations delegated by
+    AsyncComputeService, or all the operations of the ComputeService used by the tests) are run in the threadpool
+    Args:
+        method:     Compute service operation
+        args:       Positional arguments
+        kwargs:     Keyword arguments
+    Returns:
+        Result of the operation
+    '''
+    if asyncio.iscoroutinefunction(method):
+        return await method(*args, **kwargs)
+    return await run_in_threadpool(method, *args, **kwargs)
+
+
+async def wait_for_event(event: str, uid: Optional[str], fetch: Callable, done: Callable, timeout: float):
+    '''
+    Calls fetch through call_service until done(result) is true or timeout seconds have passed. Instead of polling the
+    database, fetch is only called again when the compute service notifies the event for the asset uid
+    Args:
+        event:      Event name, as in ComputeService.subscribe
+        uid:        Asset unique identifier
+        fetch:      Compute service operation that retrieves the result, with its arguments bound
+        done:       Function that checks if the result can be returned before the timeout
+        timeout:    Maximum waiting time in seconds
+    Returns:
+        Last result of fetch
+    '''
+    comp_svc = svc_context.comp_svc
+    loop = asyncio.get_running_loop()
+    notified = asyncio.Event()
+    callback = lambda _: loop.call_soon_threadsafe(notified.set)
+    deadline = loop.time() + timeout
+    comp_svc.subscribe(event, uid, callback)        # subscribe before fetching to avoid missing notifications
+    try:
+        while True:
+            notified.clear()
+            result = await call_service(fetch)
+            remaining = deadline - loop.time()
+            if done(result) or remaining <= 0:
+                return result
+            try:
+                await asyncio.wait_for(notified.wait(), remaining)
+            except asyncio.TimeoutError:
+                return result
+    finally:
+        comp_svc.unsubscribe(event, uid, callback)
+
+
 class ResponseModel(BaseModel):
     uid: str
     flag: Optional[bool] = None
 
 
 @app.post(API_URL_PREFIX + '/hosts', tags=['hosts'])
-def submit_host(host: MlexHost):
+async def submit_host(host: MlexHost):
     '''
     This function submits a new host to MLExchange
     Args:
@@ -70,12 +164,12 @@ def submit_host(host: MlexHost):
     Returns:
         host_uid
     '''
-    new_host_uid = svc_context.comp_svc.submit_host(host=host)
+    new_host_uid = await call_service(svc_context.comp_svc.submit_host, host=host)
     return new_host_uid
 
 
 @app.get(API_URL_PREFIX + '/hosts/{host_uid}', tags=['hosts'])
-def get_host(host_uid: str,
+async def get_host(host_uid: str,
              hostnames: List[str] = None,
              nickname: str = None):
     '''
@@ -87,54 +181,77 @@ def get_host(host_uid: str,
     Returns:
         List of resources at host
     '''
-    output = svc_context.comp_svc.get_host(host_uid=host_uid, hostnames=hostnames, nickname=nickname)
+    output = await call_service(svc_context.comp_svc.get_host, host_uid=host_uid, hostnames=hostnames,
+                                nickname=nickname)
     return output
 
 
 @app.get(API_URL_PREFIX + '/hosts', tags=['hosts'])
-def get_hosts(hostname: str = None,
-              nickname: str = None):
+async def get_hosts(hostname: str = None,
+              nickname: str = None,
+              limit: Optional[int] = None,
+              after: Optional[str] = None,
+              fields: Optional[List[str]] = Query(None)):
     '''
     This function requests the list of hosts
     Args:
         hostname:      Hostname
         nickname:      Nickname
+        limit:         Maximum number of hosts
+        after:         Uid of the last host in the previous page
+        fields:        Fields to retrieve, all fields if None
     Returns:
         List of resources at host
     '''
-    output = svc_context.comp_svc.get_hosts(hostname=hostname, nickname=nickname)
+    output = await call_service(svc_context.comp_svc.get_hosts, hostname=hostname, nickname=nickname, limit=limit,
+                                after=after, fields=fields)
     return output
 
 
-@app.patch(API_URL_PREFIX + '/host/{uid}/reset', tags=['hosts'], response_model=ResponseModel)
-def reset_host(uid: str):
+@app.patch(API_URL_PREFIX + '/host/{uid}/reset', tags=['hosts'], response_model=MlexOperation)
+async def reset_host(uid: str):
     '''
-    This function resets the database
+    This function terminates the workflows at a host. The host is reset in the background, its progress can be
+    retrieved through GET /operations/{uid}
     '''
-    host_uid, flag = svc_context.comp_svc.reset_host(uid)
-    return ResponseModel(uid=host_uid, flag=flag)
+    operation = await call_service(svc_context.comp_svc.reset_host, uid)
+    return operation
 
 
 @app.patch(API_URL_PREFIX + '/host/{uid}/hard_reset', tags=['hosts'], response_model=ResponseModel)
-def hard_reset_host(uid: str):
+async def hard_reset_host(uid: str):
     '''
     This function hard resets the database
     '''
-    response = svc_context.comp_svc.hard_reset_host(uid)
+    response = await call_service(svc_context.comp_svc.hard_reset_host, uid)
     return ResponseModel(uid=response)
 
 
-@app.delete(API_URL_PREFIX + '/host/{uid}/delete', tags=['hosts'], response_model=ResponseModel)
-def delete_host(uid: str):
+@app.delete(API_URL_PREFIX + '/host/{uid}/delete', tags=['hosts'], response_model=MlexOperation)
+async def delete_host(uid: str):
     '''
-    This function resets the database
+    This function terminates the workflows at a host. The host is deleted in the background once they have finished,
+    its progress can be retrieved through GET /operations/{uid}
+    '''
+    operation = await call_service(svc_context.comp_svc.delete_host, uid)
+    return operation
+
+
+@app.get(API_URL_PREFIX + '/operations/{uid}', tags=['operations'], response_model=MlexOperation)
+async def get_operation(uid: str):
     '''
-    response, flag = svc_context.comp_svc.delete_host(uid)
-    return ResponseModel(uid=response, flag=flag)
+    This function returns the progress of a host reset/delete or system reset
+    Args:
+        uid:    Operation uid
+    Returns:
+        Operation
+    '''
+    operation = await call_service(svc_context.comp_svc.get_operation, uid)
+    return operation
 
 
 @app.post(API_URL_PREFIX + '/workflows', tags=['workflows'])
-def submit_workflow(workflow: UserWorkflow):
+async def submit_workflow(workflow: UserWorkflow):
     '''
     This function submits a new workflow to queue
     Args:
@@ -142,12 +259,12 @@ def submit_workflow(workflow: UserWorkflow):
     Returns:
         workflow_uid if the workflow is valid, -1 if invalid
     '''
-    new_workflow_uid = svc_context.comp_svc.submit_workflow(workflow=workflow)
+    new_workflow_uid = await call_service(svc_context.comp_svc.submit_workflow, workflow=workflow)
     return new_workflow_uid
 
 
 @app.get(API_URL_PREFIX + '/workflows/{uid}', tags=['workflows'])
-def get_workflow(uid: str) -> MlexWorkflow:
+async def get_workflow(uid: str) -> MlexWorkflow:
     """
     This function returns the workflow that matches the query parameters
     Args:
@@ -155,12 +272,12 @@ def get_workflow(uid: str) -> MlexWorkflow:
     Returns:
         MlexWorkflow: Full object MlexWorkflow that matches the query parameters
     """
-    workflow = svc_context.comp_svc.get_workflow(uid=uid)
+    workflow = await call_service(svc_context.comp_svc.get_workflow, uid=uid)
     return workflow
 
 
 @app.get(API_URL_PREFIX + '/workflows/{uid}/mapping', tags=['workflows'])
-def get_workflow_mapping(uid: str) -> dict:
+async def get_workflow_mapping(uid: str) -> dict:
     """
     This function returns the workflow that matches the query parameters
     Args:
@@ -168,14 +285,17 @@ def get_workflow_mapping(uid: str) -> dict:
     Returns:
         MlexWorkflow: Full object MlexWorkflow that matches the query parameters
     """
-    workflow = svc_context.comp_svc.get_workflow_mapping(uid=uid)
+    workflow = await call_service(svc_context.comp_svc.get_workflow_mapping, uid=uid)
     return workflow
 
 
 @app.get(API_URL_PREFIX + '/workflows', tags=['workflows'])
-def get_workflows(user: Optional[str] = None,
+async def get_workflows(user: Optional[str] = None,
                   host_uid: Optional[str] = None,
-                  state: Optional[States] = None
+                  state: Optional[States] = None,
+                  limit: Optional[int] = None,
+                  after: Optional[str] = None,
+                  fields: Optional[List[str]] = Query(None)
                   ) -> List[MlexWorkflow]:
     """
     This function returns the list of jobs that match the query parameters
@@ -183,15 +303,21 @@ def get_workflows(user: Optional[str] = None,
         user (Optional[str], optional): find workflows based on the user. Defaults to None
         host_uid (Optional[str], optional): find workflows based on the host uid. Defaults to None
         state (Optional[State], optional): find jobs based on the state. Defaults to None
+        limit (Optional[int], optional): maximum number of workflows. Defaults to None
+        after (Optional[str], optional): uid of the last workflow in the previous page. Defaults to None
+        fields (Optional[List[str]], optional): fields to retrieve. Defaults to None
     Returns:
-        List[MlexWorkflow]: [Full object MlexWorkflow that match the query parameters]
+        List[MlexWorkflow]: [Full object MlexWorkflow that match the query parameters, sorted by submission time]
     """
-    workflows = svc_context.comp_svc.get_workflows(user=user, host_uid=host_uid, state=state)
+    workflows = await call_service(svc_context.comp_svc.get_workflows, user=user, host_uid=host_uid, state=state,
+                                   limit=limit, after=after, fields=fields)
+    if fields:
+        return JSONResponse(jsonable_encoder(workflows))
     return workflows
 
 
 @app.patch(API_URL_PREFIX + '/workflows/{uid}/terminate', tags=['workflows'], response_model=ResponseModel)
-def terminate_workflow(uid: str):
+async def terminate_workflow(uid: str):
     '''
     This function terminates the workflow
     Args:
@@ -199,12 +325,38 @@ def terminate_workflow(uid: str):
     Returns:
         workflow_uid
     '''
-    svc_context.comp_svc.terminate_workflow(uid)
+    await call_service(svc_context.comp_svc.terminate_workflow, uid)
     return ResponseModel(uid=uid)
 
 
+@app.post(API_URL_PREFIX + '/workflows/terminate', tags=['workflows'], response_model=BulkSummary)
+async def terminate_workflows(query: BulkQuery):
+    '''
+    This function terminates the workflows that match the query
+    Args:
+        query: Workflow uids and/or filters (user, host_uid, mlex_app, state)
+    Returns:
+        Summary of the terminated workflows and jobs
+    '''
+    summary = await call_service(svc_context.comp_svc.terminate_workflows, query)
+    return summary
+
+
+@app.post(API_URL_PREFIX + '/workflows/requeue', tags=['workflows'], response_model=BulkSummary)
+async def requeue_workflows(query: BulkQuery):
+    '''
+    This function sends the finished workflows that match the query back to queue
+    Args:
+        query: Workflow uids and/or filters (user, host_uid, mlex_app, state)
+    Returns:
+        Summary of the requeued workflows
+    '''
+    summary = await call_service(svc_context.comp_svc.requeue_workflows, query)
+    return summary
+
+
 @app.get(API_URL_PREFIX + '/workers/{uid}', tags=['workers'])
-def get_worker(uid: str) -> MlexWorker:
+async def get_worker(uid: str) -> MlexWorker:
     '''
     This function returns the worker that matches the query parameters
     Args:
@@ -212,28 +364,37 @@ def get_worker(uid: str) -> MlexWorker:
     Returns:
         Worker
     '''
-    worker = svc_context.comp_svc.get_worker(uid=uid)
+    worker = await call_service(svc_context.comp_svc.get_worker, uid=uid)
     return worker
 
 
 @app.get(API_URL_PREFIX + '/workers', tags=['workers'])
-def get_workers(host_uid: Optional[str] = None,
-                state: Optional[States] = None
+async def get_workers(host_uid: Optional[str] = None,
+                state: Optional[States] = None,
+                limit: Optional[int] = None,
+                after: Optional[str] = None,
+                fields: Optional[List[str]] = Query(None)
                 ) -> List[MlexWorker]:
     '''
     This function returns the information on the user
     Args:
         host_uid:       Host uid
         state:          Worker state
+        limit:          Maximum number of workers
+        after:          Uid of the last worker in the previous page
+        fields:         Fields to retrieve, all fields if None
     Returns:
         Worker information
     '''
-    workers = svc_context.comp_svc.get_workers(host_uid=host_uid, state=state)
+    workers = await call_service(svc_context.comp_svc.get_workers, host_uid=host_uid, state=state, limit=limit,
+                                 after=after, fields=fields)
+    if fields:
+        return JSONResponse(jsonable_encoder(workers))
     return workers
 
 
 @app.patch(API_URL_PREFIX + '/workers/{uid}/terminate', tags=['workers'], response_model=ResponseModel)
-def terminate_worker(uid: str):
+async def terminate_worker(uid: str):
     '''
     This function terminates the worker operation
     Args:
@@ -241,12 +402,12 @@ def terminate_worker(uid: str):
     Returns:
         worker_uid
     '''
-    svc_context.comp_svc.terminate_worker(uid)
+    await call_service(svc_context.comp_svc.terminate_worker, uid)
     return ResponseModel(uid=uid)
 
 
 @app.get(API_URL_PREFIX + '/jobs/{uid}', tags=['jobs'])
-def get_job(uid: str) -> MlexJob:
+async def get_job(uid: str) -> MlexJob:
     """
     This function returns the job that matches the query parameters
     Args:
@@ -254,16 +415,33 @@ def get_job(uid: str) -> MlexJob:
     Returns:
         MlexJob: Full object MlexJob that matches the query parameters
     """
-    job = svc_context.comp_svc.get_job(uid=uid)
+    job = await call_service(svc_context.comp_svc.get_job, uid=uid)
     return job
 
 
+@app.get(API_URL_PREFIX + '/jobs/{uid}/logs', tags=['jobs'], response_model=JobLogs)
+async def get_job_logs(uid: str, offset: int = 0) -> JobLogs:
+    """
+    This function returns the logs of a job that were appended after the given offset
+    Args:
+        uid:        Job UID
+        offset:     Offset returned by the previous call, 0 retrieves the full logs
+    Returns:
+        JobLogs: Logs after offset and the offset to use in the next call
+    """
+    logs = await call_service(svc_context.comp_svc.get_job_logs, uid=uid, offset=offset)
+    return logs
+
+
 @app.get(API_URL_PREFIX + '/jobs', tags=['jobs'])
-def get_jobs(user: Optional[str] = None,
+async def get_jobs(user: Optional[str] = None,
              mlex_app: Optional[str] = None,
              host_uid: Optional[str] = None,
              service_type: Optional[ServiceType] = None,
-             state: Optional[States] = None
+             state: Optional[States] = None,
+             limit: Optional[int] = None,
+             after: Optional[str] = None,
+             fields: Optional[List[str]] = Query(None)
              ) -> List[MlexJob]:
     """
     This function returns the list of jobs that match the query parameters
@@ -273,16 +451,22 @@ def get_jobs(user: Optional[str] = None,
         host_uid (Optional[str], optional): find jobs based on the host uid. Defaults to None
         service_type (Optional[ServiceType], optional): find jobs based on service type. Defaults to None
         state (Optional[State], optional): find jobs based on the state. Defaults to None
+        limit (Optional[int], optional): maximum number of jobs. Defaults to None
+        after (Optional[str], optional): uid of the last job in the previous page. Defaults to None
+        fields (Optional[List[str]], optional): fields to retrieve, logs are only included when requested.
+            Defaults to None
     Returns:
-        List[MlexJob]: [Full object MlexJob that match the query parameters]
+        List[MlexJob]: [Full object MlexJob that match the query parameters, sorted by submission time]
     """
-    jobs = svc_context.comp_svc.get_jobs(user=user, mlex_app=mlex_app, host_uid=host_uid, service_type=service_type,
-                                         state=state)
+    jobs = await call_service(svc_context.comp_svc.get_jobs, user=user, mlex_app=mlex_app, host_uid=host_uid,
+                              service_type=service_type, state=state, limit=limit, after=after, fields=fields)
+    if fields:
+        return JSONResponse(jsonable_encoder(jobs))
     return jobs
 
 
 @app.patch(API_URL_PREFIX + '/jobs/{uid}/terminate', tags=['jobs'], response_model=ResponseModel)
-def terminate_job(uid: str):
+async def terminate_job(uid: str):
     '''
     This function terminates the job
     Args:
@@ -290,53 +474,107 @@ def terminate_job(uid: str):
     Returns:
         job_uid
     '''
-    svc_context.comp_svc.terminate_job(uid)
+    await call_service(svc_context.comp_svc.terminate_job, uid)
     return ResponseModel(uid=uid)
 
 
 @app.delete(API_URL_PREFIX + '/jobs/{uid}/delete', tags=['jobs'], response_model=ResponseModel)
-def delete_job(uid: str):
+async def delete_job(uid: str):
     '''
-    This function deletes the job
+    This function deletes the job once it has been terminated
     Args:
         uid: Unique job identifier
     Returns:
         job_uid
     '''
-    svc_context.comp_svc.delete_job(uid)
+    await call_service(svc_context.comp_svc.delete_job, uid)
     return ResponseModel(uid=uid)
 
 
+@app.post(API_URL_PREFIX + '/jobs/terminate', tags=['jobs'], response_model=BulkSummary)
+async def terminate_jobs(query: BulkQuery):
+    '''
+    This function terminates the jobs that match the query
+    Args:
+        query: Job uids and/or filters (user, host_uid, mlex_app, state)
+    Returns:
+        Summary of the terminated jobs
+    '''
+    summary = await call_service(svc_context.comp_svc.terminate_jobs, query)
+    return summary
+
+
+@app.post(API_URL_PREFIX + '/jobs/delete', tags=['jobs'], response_model=BulkSummary)
+async def delete_jobs(query: BulkQuery):
+    '''
+    This function deletes the jobs that match the query once they have been terminated
+    Args:
+        query: Job uids and/or filters (user, host_uid, mlex_app, state)
+    Returns:
+        Summary of the deleted jobs
+    '''
+    summary = await call_service(svc_context.comp_svc.delete_jobs, query)
+    return summary
+
+
 @app.get(API_URL_PREFIX + '/private/jobs', tags=['private'])
-def get_next_job(worker_uid: str) -> MlexJob:
+async def get_next_job(worker_uid: str) -> Optional[Union[MlexJob, int]]:
     """
-    This function returns the job that matches the query parameters
+    This function returns the next job in worker whose dependencies have finished
     Args:
         worker_uid:    Worker UID
     Returns:
-        MlexJob: Full object MlexJob that matches the query parameters
+        MlexJob: Full object MlexJob, None if the remaining jobs are waiting for their dependencies, or -1 if there are
+        no jobs left to run in worker
     """
-    job = svc_context.comp_svc.get_next_job(worker_uid=worker_uid)
+    job = await call_service(svc_context.comp_svc.get_next_job, worker_uid=worker_uid)
     return job
 
 
+@app.get(API_URL_PREFIX + '/private/jobs/{uid}/events', tags=['private'], response_model=JobEvent)
+async def get_job_event(uid: str, timeout: float = 0) -> JobEvent:
+    """
+    This function returns the status and termination flag of a job. If the job has not been flagged for termination,
+    it waits up to timeout seconds for this to happen before returning
+    Args:
+        uid:        Job UID
+        timeout:    Maximum waiting time in seconds
+    Returns:
+        JobEvent: Job status and termination flag
+    """
+    job_event = await wait_for_event('terminate', uid,
+                                     partial(svc_context.comp_svc.get_job_event, uid),
+                                     lambda job_event: job_event.terminate,
+                                     timeout)
+    return job_event
+
+
 @app.get(API_URL_PREFIX + '/private/workers', tags=['private'])
-def get_next_worker(service_type: str, host_uid: str = None) -> Optional[MlexWorker]:
+async def get_next_worker(service_type: List[ServiceType] = Query(...),
+                          host_uid: str = None,
+                          timeout: float = 0
+                          ) -> Optional[MlexWorker]:
     '''
     This function returns the next worker to be launched at host location and updates the status of this worker and the
-    host resources in the database
+    host resources in the database. If there is no worker ready to be launched, it waits up to timeout seconds for one
     Args:
         host_uid:       Host uid
-        service_type:   Frontend, Backend, Hybrid
+        service_type:   Frontend, Backend, Hybrid. Several service types can be given in order of priority, and the
+                        next worker of the first service type that has one is returned
+        timeout:        Maximum waiting time in seconds
     Returns:
         Worker to be executed
     '''
-    next_worker = svc_context.comp_svc.get_next_worker(host_uid, service_type)
+    next_worker = await wait_for_event('queue', host_uid,
+                                       partial(svc_context.comp_svc.get_next_worker_by_priority, host_uid,
+                                               service_type),
+                                       lambda next_worker: next_worker is not None,
+                                       timeout)
     return next_worker
 
 
 @app.patch(API_URL_PREFIX + '/private/workers/{uid}/update', tags=['private'], response_model=ResponseModel)
-def update_worker(uid: str,
+async def update_worker(uid: str,
                   status: Status
                   ):
     '''
@@ -347,12 +585,12 @@ def update_worker(uid: str,
     Returns:
         worker_uid
     '''
-    svc_context.comp_svc.update_worker(uid, status)
+    await call_service(svc_context.comp_svc.update_worker, uid, status)
     return ResponseModel(uid=uid)
 
 
 @app.patch(API_URL_PREFIX + '/private/jobs/{uid}/update', tags=['private'], response_model=ResponseModel)
-def update_job(uid: str,
+async def update_job(uid: str,
                status: Optional[Status] = None,
                logs: Optional[str] = None,
                ):
@@ -365,12 +603,29 @@ def update_job(uid: str,
     Returns:
         job_uid
     '''
-    svc_context.comp_svc.update_job(uid, status, logs)
+    await call_service(svc_context.comp_svc.update_job, uid, status, logs)
     return ResponseModel(uid=uid)
 
 
+@logs_router.post(API_URL_PREFIX + '/private/jobs/logs', tags=['private'], response_model=List[str])
+async def append_logs(chunks: List[LogChunk]):
+    '''
+    This function appends a batch of logs to one or more jobs. The request body can be gzip-compressed
+    (Content-Encoding: gzip)
+    Args:
+        chunks:     List of log chunks, in the order they were produced
+    Returns:
+        List of job uids that were updated
+    '''
+    job_uids = await call_service(svc_context.comp_svc.append_logs, chunks)
+    return job_uids
+
+
+app.include_router(logs_router)
+
+
 @app.patch(API_URL_PREFIX + '/private/jobs/{uid}/update/mapping', tags=['private'], response_model=ResponseModel)
-def update_job_mapping(uid: str,
+async def update_job_mapping(uid: str,
                        ports: Optional[dict] = None,
                        ):
     '''
@@ -380,25 +635,26 @@ def update_job_mapping(uid: str,
     Returns:
         job_uid
     '''
-    svc_context.comp_svc.update_job_mapping(uid, ports)
+    await call_service(svc_context.comp_svc.update_job_mapping, uid, ports)
     return ResponseModel(uid=uid)
 
 
-@app.delete(API_URL_PREFIX + '/system/reset', tags=['system'], response_model=List[ResponseModel])
-def reset_system():
+@app.delete(API_URL_PREFIX + '/system/reset', tags=['system'], response_model=MlexOperation)
+async def reset_system():
     '''
-    This function resets the database
+    This function terminates all the workflows. The database is reset in the background once they have finished, its
+    progress can be retrieved through GET /operations/{uid}
     '''
-    response = svc_context.comp_svc.reset_system()
-    return parse_obj_as(List[ResponseModel], response)
+    operation = await call_service(svc_context.comp_svc.reset_system)
+    return operation
 
 
 @app.delete(API_URL_PREFIX + '/system/hard_reset', tags=['system'], response_model=str)
-def hard_reset_system():
+async def hard_reset_system():
     '''
     This function resets the database
     '''
-    response = svc_context.comp_svc.hard_reset_system()
+    response = await call_service(svc_context.comp_svc.hard_reset_system)
     return response
 
 
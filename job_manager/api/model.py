@@ -1,7 +1,7 @@
 from enum import Enum
 from datetime import datetime
 
-from pydantic import BaseModel, Extra, Field, validator
+from pydantic import BaseModel, Extra, Field, root_validator, validator
 from typing import Optional, List, Union
 
 
@@ -23,6 +23,12 @@ class ServiceType(str, Enum):
     hybrid = "hybrid"
 
 
+class OperationType(str, Enum):
+    reset_host = "reset_host"
+    delete_host = "delete_host"
+    reset_system = "reset_system"
+
+
 ###################################################### SUBCLASSES ######################################################
 class Status(BaseModel):
     state: States
@@ -42,6 +48,8 @@ class DockerJob(BaseModel):
     map: Optional[dict] = Field(description="{'port1/tcp': '', 'port2/tcp': '', ... }", default=None)
     container_kwargs: Optional[dict] = Field(description="container kwargs", default=None)
     kwargs: Optional[dict] = Field(description="job kwargs", default=None)
+    reuse_container: Optional[bool] = Field(description="run the job in a container that is reused by the next jobs "
+                                                        "of the worker with the same image", default=False)
 
 
 class Resources(BaseModel):
@@ -69,8 +77,47 @@ class ResourcesQuery(Resources):
     service_type: ServiceType
 
 
+class JobEvent(BaseModel):
+    uid: str
+    status: Status
+    terminate: Optional[bool] = Field(description="terminate", default=None)
+
+
+class LogChunk(BaseModel):
+    uid: str = Field(description="job uid")
+    logs: str = ''
+    status: Optional[Status] = Field(description="job status, applied after the logs of the batch", default=None)
+
+
+class JobLogs(BaseModel):
+    uid: str
+    logs: str = Field(description="logs appended after the requested offset", default='')
+    offset: int = Field(description="sequence number of the last log chunk", default=0)
+
+
+class BulkQuery(BaseModel):
+    uids: Optional[List[str]] = Field(description="list of uids", default=None)
+    user: Optional[str] = Field(description="user uid", default=None)
+    host_uid: Optional[str] = Field(description="host uid", default=None)
+    mlex_app: Optional[str] = Field(description="MLExchange app associated with the jobs", default=None)
+    state: Optional[States] = None
+
+    @root_validator
+    def check_filter(cls, values):
+        if not any(value is not None for value in values.values()):
+            raise ValueError('a list of uids or at least one filter is required')
+        return values
+
+
+class BulkSummary(BaseModel):
+    matched: int = Field(description="number of jobs or workflows that match the query", default=0)
+    canceled: int = Field(description="number of jobs in queue that were canceled", default=0)
+    terminating: int = Field(description="number of running jobs flagged for termination", default=0)
+    deleted: int = Field(description="number of jobs deleted", default=0)
+    requeued: int = Field(description="number of workflows sent back to queue", default=0)
+
+
 ####################################################### CLASSES #######################################################
-DEFAULT_TIMESTAMP = TimeStamps(submission_time=datetime.utcnow())
 SCHEMA_VERSION = "1.0"
 DEFAULT_UID = "425f6781-e42b-23e2-a341-2431564214523"
 DEFAULT_JOB_PID = str(0)
@@ -97,7 +144,7 @@ class MlexHost(BaseModel):
 class BasicAsset(BaseModel):
     uid: str = DEFAULT_UID
     schema_version: str = SCHEMA_VERSION
-    timestamps: TimeStamps = DEFAULT_TIMESTAMP
+    timestamps: TimeStamps = Field(default_factory=TimeStamps)
     description: Optional[str] = Field(description='description', default=None)
     error: Optional[str] = Field(description="error description", default=None)
     terminate: Optional[bool] = Field(description="terminate", default=None)
@@ -113,6 +160,7 @@ class MlexJob(BasicAsset):
     requirements: Optional[Resources] = None
     logs: Optional[str] = None
     dependencies: List[str] = DEFAULT_UID_LIST
+    pending_delete: Optional[bool] = Field(description="the job is deleted once it finishes", default=None)
     class Config:
         extra = Extra.ignore
 
@@ -142,3 +190,12 @@ class UserWorkflow(MlexWorkflow):
     dependencies: dict
     host_list: List[str] = Field(description='list of hostnames')
     requirements: Optional[CompRequirements] = Field(description='computational requirements', default=None)
+
+
+class MlexOperation(BasicAsset):
+    operation_type: OperationType
+    host_uid: Optional[str] = Field(description='host identifier, None for system operations', default=None)
+    status: Status = DEFAULT_STATUS
+    pending_workers: int = Field(description='number of workers that have not finished yet', default=0)
+    class Config:
+        extra = Extra.ignore
@@ -0,0 +1,103 @@
+from fastapi.testclient import TestClient
+from model import BulkSummary, MlexWorker, Status
+
+from test_api import COMP_URL
+from test_workers import host2, workflow3
+
+
+def test_terminate_workflows(rest_client: TestClient):
+    '''
+    This test terminates the workflows of a user, with one running job, in a single request
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    rest_client.post(f'{COMP_URL}hosts', json=host2)
+    host_uid = rest_client.get(f'{COMP_URL}hosts').json()[0]['uid']
+    workflow_uids = [rest_client.post(f'{COMP_URL}workflows', json=workflow3).json() for i in range(2)]
+    worker = rest_client.get(f'{COMP_URL}private/workers', params={'host_uid': host_uid,
+                                                                   'service_type': 'backend'}).json()
+    job = rest_client.get(f'{COMP_URL}private/jobs', params={'worker_uid': worker['uid']}).json()
+    response = rest_client.post(f'{COMP_URL}workflows/terminate', json={'user': workflow3['user_uid']})
+    summary = BulkSummary.parse_obj(response.json())
+    assert summary == BulkSummary(matched=2, canceled=3, terminating=1)
+    assert rest_client.get(f'{COMP_URL}workflows/{workflow_uids[1]}').json()['status']['state'] == 'canceled'
+    assert rest_client.get(f'{COMP_URL}jobs/{job["uid"]}').json()['terminate']
+    rest_client.patch(f'{COMP_URL}private/jobs/{job["uid"]}/update', json=Status(state='terminated').dict())
+    assert rest_client.get(f'{COMP_URL}workflows/{workflow_uids[0]}').json()['status']['state'] == \
+           'complete with errors'
+
+
+def test_requeue_workflows(rest_client: TestClient):
+    '''
+    This test sends the finished workflows of a user back to queue and checks that they can be launched again
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    response = rest_client.post(f'{COMP_URL}workflows/requeue', json={'user': workflow3['user_uid']})
+    assert BulkSummary.parse_obj(response.json()) == BulkSummary(matched=2, requeued=2)
+    host_uid = rest_client.get(f'{COMP_URL}hosts').json()[0]['uid']
+    worker = MlexWorker.parse_obj(rest_client.get(f'{COMP_URL}private/workers',
+                                                  params={'host_uid': host_uid, 'service_type': 'backend'}).json())
+    assert worker.dependencies == [0, 1] and not worker.terminate
+    jobs = [rest_client.get(f'{COMP_URL}jobs/{job_uid}').json() for job_uid in worker.jobs_list]
+    assert [job['status']['state'] for job in jobs] == ['queue', 'queue'] and jobs[0]['logs'] is None
+
+
+def test_delete_jobs(rest_client: TestClient):
+    '''
+    This test deletes the queued jobs of a user in a single request
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    response = rest_client.post(f'{COMP_URL}jobs/delete', json={'user': workflow3['user_uid'], 'state': 'queue'})
+    assert BulkSummary.parse_obj(response.json()) == BulkSummary(matched=4, canceled=4, deleted=4)
+    assert rest_client.get(f'{COMP_URL}jobs', params={'user': workflow3['user_uid']}).json() == []
+    assert rest_client.post(f'{COMP_URL}jobs/delete', json={}).status_code == 422
+
+
+def test_requeue_after_delete(rest_client: TestClient, comp_svc):
+    '''
+    This test deletes a job of a canceled workflow and checks that the workflow is requeued without it
+    Args:
+        rest_client: test client
+        comp_svc: compute service
+    Returns:
+        None
+    '''
+    workflow_uid = rest_client.post(f'{COMP_URL}workflows', json=dict(workflow3, user_uid='444')).json()
+    rest_client.post(f'{COMP_URL}workflows/terminate', json={'uids': [workflow_uid]})
+    workflow = rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()
+    worker_uid = workflow['workers_list'][0]
+    jobs_list = rest_client.get(f'{COMP_URL}workers/{worker_uid}').json()['jobs_list']
+    rest_client.delete(f'{COMP_URL}jobs/{jobs_list[0]}/delete')
+    response = rest_client.post(f'{COMP_URL}workflows/requeue', json={'uids': [workflow_uid]})
+    assert BulkSummary.parse_obj(response.json()) == BulkSummary(matched=1, requeued=1)
+    worker = MlexWorker.parse_obj(rest_client.get(f'{COMP_URL}workers/{worker_uid}').json())
+    assert worker.jobs_list == jobs_list[1:] and worker.dependencies == [0] and worker.status.state == 'queue'
+    job = comp_svc._collection_job_list.find_one({'uid': jobs_list[1]})
+    assert job['status']['state'] == 'queue' and job['pending_deps'] == 0
+    assert rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['status']['state'] == 'queue'
+
+
+def test_terminate_jobs_twice(rest_client: TestClient, comp_svc):
+    '''
+    This test terminates the queued jobs of a workflow twice and checks that they are only canceled once
+    Args:
+        rest_client: test client
+        comp_svc: compute service
+    Returns:
+        None
+    '''
+    workflow_uid = rest_client.post(f'{COMP_URL}workflows', json=dict(workflow3, user_uid='555')).json()
+    worker_uid = rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['workers_list'][0]
+    jobs_list = rest_client.get(f'{COMP_URL}workers/{worker_uid}').json()['jobs_list']
+    summaries = [BulkSummary.parse_obj(rest_client.post(f'{COMP_URL}jobs/terminate', json={'uids': jobs_list}).json())
+                 for i in range(2)]
+    assert summaries[0].canceled == 2 and summaries[1].canceled == 0
+    assert comp_svc._collection_job_list.find_one({'uid': jobs_list[1]})['pending_deps'] == 0
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+from model import JobEvent, MlexWorker
+
+from test_api import COMP_URL, host1, workflow1
+
+
+def test_job_event_timeout(rest_client: TestClient):
+    '''
+    This test checks that the job event request waits for the timeout when the job is not terminated
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    rest_client.post(f'{COMP_URL}hosts', json=host1)
+    rest_client.post(f'{COMP_URL}workflows', json=workflow1)
+    job_uid = rest_client.get(f'{COMP_URL}jobs').json()[0]['uid']
+    start = time.monotonic()
+    response = rest_client.get(f'{COMP_URL}private/jobs/{job_uid}/events', params={'timeout': 0.2})
+    job_event = JobEvent.parse_obj(response.json())
+    assert not job_event.terminate and time.monotonic() - start >= 0.2
+
+
+def test_job_event_terminate(rest_client: TestClient):
+    '''
+    This test checks that a waiting job event request returns as soon as the job is terminated
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    job_uid = rest_client.get(f'{COMP_URL}jobs').json()[0]['uid']
+    timer = threading.Timer(0.2, rest_client.patch, args=(f'{COMP_URL}jobs/{job_uid}/terminate',))
+    timer.start()
+    start = time.monotonic()
+    response = rest_client.get(f'{COMP_URL}private/jobs/{job_uid}/events', params={'timeout': 10})
+    timer.join()
+    job_event = JobEvent.parse_obj(response.json())
+    assert job_event.terminate and time.monotonic() - start < 5
+
+
+def test_next_worker_wait(rest_client: TestClient):
+    '''
+    This test checks that a waiting request for the next worker returns as soon as a new workflow is queued
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    host_uid = rest_client.get(f'{COMP_URL}hosts').json()[0]['uid']
+    params = {'host_uid': host_uid, 'service_type': 'frontend', 'timeout': 0.2}
+    assert rest_client.get(f'{COMP_URL}private/workers', params=params).json() is None
+
+    workflow = {'user_uid': '111',
+                'job_list': [{'service_type': 'frontend',
+                              'mlex_app': 'clinic',
+                              'job_kwargs': {'uri': 'image', 'cmd': 'python3'},
+                              'working_directory': 'home',
+                              'requirements': {'num_processors': 2}}],
+                'host_list': ['vaughan.als.lbl.gov'],
+                'dependencies': {'0': []},
+                'requirements': {'num_processors': 2, 'num_gpus': 0, 'num_nodes': 1}}
+    timer = threading.Timer(0.2, rest_client.post, args=(f'{COMP_URL}workflows',), kwargs={'json': workflow})
+    timer.start()
+    start = time.monotonic()
+    params['timeout'] = 10
+    worker = MlexWorker.parse_obj(rest_client.get(f'{COMP_URL}private/workers', params=params).json())
+    timer.join()
+    assert worker.service_type == 'frontend' and time.monotonic() - start < 5
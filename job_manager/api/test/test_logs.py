@@ -0,0 +1,108 @@
+import gzip
+import json
+
+from fastapi.testclient import TestClient
+import main
+from model import MlexJob, JobLogs
+
+from test_api import COMP_URL, host1, workflow1
+
+
+def test_append_logs(rest_client: TestClient):
+    '''
+    This test appends several chunks of logs to a job and checks that they are assembled in order
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    rest_client.post(f'{COMP_URL}hosts', json=host1)
+    rest_client.post(f'{COMP_URL}workflows', json=workflow1)
+    job_uid = rest_client.get(f'{COMP_URL}jobs').json()[0]['uid']
+    for chunk in ['first ', 'second ', 'third']:
+        response = rest_client.patch(f'{COMP_URL}private/jobs/{job_uid}/update', params={'logs': chunk})
+        assert response.status_code == 200
+    job = MlexJob.parse_obj(rest_client.get(f'{COMP_URL}jobs/{job_uid}').json())
+    assert job.logs == 'first second third'
+
+
+def test_get_job_logs_offset(rest_client: TestClient):
+    '''
+    This test retrieves the logs of a job incrementally through the offset returned by the previous call
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    job_uid = rest_client.get(f'{COMP_URL}jobs').json()[0]['uid']
+    job_logs = JobLogs.parse_obj(rest_client.get(f'{COMP_URL}jobs/{job_uid}/logs').json())
+    assert job_logs.logs == 'first second third' and job_logs.offset == 3
+
+    rest_client.patch(f'{COMP_URL}private/jobs/{job_uid}/update', params={'logs': ' fourth'})
+    job_logs = JobLogs.parse_obj(rest_client.get(f'{COMP_URL}jobs/{job_uid}/logs',
+                                                 params={'offset': job_logs.offset}).json())
+    assert job_logs.logs == ' fourth' and job_logs.offset == 4
+
+
+def test_append_logs_batch(rest_client: TestClient):
+    '''
+    This test sends a gzip-compressed batch of logs for several jobs in a single request
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    job_uids = [job['uid'] for job in rest_client.get(f'{COMP_URL}jobs').json()]
+    chunks = [{'uid': job_uids[1], 'logs': 'a'},
+              {'uid': job_uids[2], 'logs': 'b'},
+              {'uid': job_uids[1], 'logs': 'c'},
+              {'uid': 'unknown', 'logs': 'd'}]
+    response = rest_client.post(f'{COMP_URL}private/jobs/logs',
+                                content=gzip.compress(json.dumps(chunks).encode('utf-8')),
+                                headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.json() == [job_uids[1], job_uids[2]]
+    assert rest_client.get(f'{COMP_URL}jobs/{job_uids[1]}').json()['logs'] == 'ac'
+    assert rest_client.get(f'{COMP_URL}jobs/{job_uids[2]}').json()['logs'] == 'b'
+
+
+def test_append_logs_status(rest_client: TestClient):
+    '''
+    This test sends the last logs of a job and its status in the same batch
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    job_uids = [job['uid'] for job in rest_client.get(f'{COMP_URL}jobs').json()]
+    chunks = [{'uid': job_uids[2], 'logs': 'e', 'status': {'state': 'running'}},
+              {'uid': job_uids[1], 'status': {'state': 'running'}}]
+    response = rest_client.post(f'{COMP_URL}private/jobs/logs', json=chunks)
+    assert response.status_code == 200
+    assert response.json() == [job_uids[2], job_uids[1]]
+    job = rest_client.get(f'{COMP_URL}jobs/{job_uids[2]}').json()
+    assert job['logs'] == 'be' and job['status']['state'] == 'running'
+    job = rest_client.get(f'{COMP_URL}jobs/{job_uids[1]}').json()
+    assert job['logs'] == 'ac' and job['status']['state'] == 'running'
+
+
+def test_append_logs_too_large(rest_client: TestClient, monkeypatch):
+    '''
+    This test sends a compressed batch of logs that exceeds the maximum size once decompressed
+    Args:
+        rest_client: test client
+        monkeypatch: pytest monkeypatch
+    Returns:
+        None
+    '''
+    monkeypatch.setattr(main, 'MAX_LOGS_SIZE', 1024)
+    job_uid = rest_client.get(f'{COMP_URL}jobs').json()[0]['uid']
+    chunks = [{'uid': job_uid, 'logs': 'a' * 2048}]
+    response = rest_client.post(f'{COMP_URL}private/jobs/logs',
+                                content=gzip.compress(json.dumps(chunks).encode('utf-8')),
+                                headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    assert response.status_code == 413
+    # the other routes do not accept compressed bodies
+    response = rest_client.post(f'{COMP_URL}hosts', content=gzip.compress(json.dumps(host1).encode('utf-8')),
+                                headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    assert response.status_code in [400, 422]
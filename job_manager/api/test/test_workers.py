@@ -0,0 +1,493 @@
+import itertools
+import time
+
+import numpy as np
+
+from fastapi.testclient import TestClient
+from job_service import ComputeService, INDEXES
+from model import MlexHost, MlexWorker, MlexOperation, Constraints, Status, UserWorkflow
+
+from test_api import COMP_URL
+
+
+def test_reserve_gpus(rest_client: TestClient):
+    '''
+    This test launches several workers at the same host and checks that each one reserves different GPUs
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    rest_client.post(f'{COMP_URL}hosts', json=host2)
+    rest_client.post(f'{COMP_URL}workflows', json=workflow2)
+    host_uid = rest_client.get(f'{COMP_URL}hosts').json()[0]['uid']
+    params = {'host_uid': host_uid, 'service_type': 'backend'}
+    workers = []
+    for i in range(3):
+        workers.append(rest_client.get(f'{COMP_URL}private/workers', params=params).json())
+    assert workers[2] is None               # there are no GPUs left for the third worker
+    list_gpus = [MlexWorker.parse_obj(worker).requirements.list_gpus for worker in workers[:2]]
+    assert sorted(list_gpus) == [['1'], ['2']]
+    host = MlexHost.parse_obj(rest_client.get(f'{COMP_URL}hosts').json()[0])
+    assert host.backend_available.num_gpus == 0 and host.backend_available.list_gpus == []
+    assert host.backend_available.num_processors == 6 and host.backend_available.num_nodes == 1
+
+
+def test_reserve_outdated_host(comp_svc):
+    '''
+    This test checks that resources are not reserved when they have been reserved since the host was retrieved
+    Args:
+        comp_svc: compute service
+    Returns:
+        None
+    '''
+    mlex_host = comp_svc.get_hosts()[0]
+    mlex_host.backend_available.list_gpus = ['1']
+    reservation = {'backend_available': Constraints(num_processors=1, num_gpus=1, num_nodes=1)}
+    assert comp_svc._reserve_host_resources(mlex_host, reservation) is None
+
+
+def test_next_job_dependencies(rest_client: TestClient):
+    '''
+    This test checks that the jobs in a worker are dequeued once all their dependencies have finished
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    workflow_uid = rest_client.post(f'{COMP_URL}workflows', json=workflow3).json()
+    worker_uid = rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['workers_list'][0]
+    jobs_list = rest_client.get(f'{COMP_URL}workers/{worker_uid}').json()['jobs_list']
+    complete = Status(state='complete').dict()
+    for job_uid in jobs_list:
+        job = rest_client.get(f'{COMP_URL}private/jobs', params={'worker_uid': worker_uid}).json()
+        assert job['uid'] == job_uid and job['status']['state'] == 'running'
+        # the next job is not ready until its dependency has finished
+        assert rest_client.get(f'{COMP_URL}private/jobs', params={'worker_uid': worker_uid}).json() is None
+        rest_client.patch(f'{COMP_URL}private/jobs/{job_uid}/update', json=complete)
+    assert rest_client.get(f'{COMP_URL}private/jobs', params={'worker_uid': worker_uid}).json() == -1
+
+
+def test_update_dependencies(rest_client: TestClient):
+    '''
+    This test cancels a job with several dependent jobs in the same worker and checks that all their dependency
+    counters are decreased
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    workflow = dict(workflow3, job_list=[job_cpu] * 3, dependencies={'0': [], '1': [0], '2': [0]})
+    workflow_uid = rest_client.post(f'{COMP_URL}workflows', json=workflow).json()
+    worker_uid = rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['workers_list'][0]
+    worker = MlexWorker.parse_obj(rest_client.get(f'{COMP_URL}workers/{worker_uid}').json())
+    assert worker.dependencies == [0, 1, 1]
+    rest_client.patch(f'{COMP_URL}jobs/{worker.jobs_list[0]}/terminate')
+    worker = MlexWorker.parse_obj(rest_client.get(f'{COMP_URL}workers/{worker_uid}').json())
+    assert worker.dependencies == [0, 0, 0]
+
+
+def test_update_dependencies_once(rest_client: TestClient, comp_svc):
+    '''
+    This test sends two final statuses for the same job and checks that its dependent job is only decreased once
+    Args:
+        rest_client: test client
+        comp_svc: compute service
+    Returns:
+        None
+    '''
+    workflow = dict(workflow3, job_list=[job_cpu] * 2, dependencies={'0': [], '1': [0]})
+    workflow_uid = rest_client.post(f'{COMP_URL}workflows', json=workflow).json()
+    worker_uid = rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['workers_list'][0]
+    jobs_list = rest_client.get(f'{COMP_URL}workers/{worker_uid}').json()['jobs_list']
+    assert rest_client.get(f'{COMP_URL}private/jobs', params={'worker_uid': worker_uid}).json()['uid'] == jobs_list[0]
+    for state in ['terminated', 'complete']:
+        rest_client.patch(f'{COMP_URL}private/jobs/{jobs_list[0]}/update', json=Status(state=state).dict())
+    assert rest_client.get(f'{COMP_URL}jobs/{jobs_list[0]}').json()['status']['state'] == 'terminated'
+    assert comp_svc._collection_job_list.find_one({'uid': jobs_list[1]})['pending_deps'] == 0
+    assert rest_client.get(f'{COMP_URL}workers/{worker_uid}').json()['dependencies'] == [0, 0]
+    assert rest_client.get(f'{COMP_URL}private/jobs', params={'worker_uid': worker_uid}).json()['uid'] == jobs_list[1]
+
+
+def test_update_status_last_job(rest_client: TestClient):
+    '''
+    This test finishes the jobs of a worker and checks that the worker and workflow states are updated once the last
+    job has finished
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    workflow = dict(workflow3, dependencies={'0': [], '1': []})
+    workflow_uid = rest_client.post(f'{COMP_URL}workflows', json=workflow).json()
+    worker_uid = rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['workers_list'][0]
+    jobs_list = rest_client.get(f'{COMP_URL}workers/{worker_uid}').json()['jobs_list']
+    rest_client.patch(f'{COMP_URL}private/jobs/{jobs_list[0]}/update', json=Status(state='failed').dict())
+    assert rest_client.get(f'{COMP_URL}workers/{worker_uid}').json()['status']['state'] == 'warning'
+    rest_client.patch(f'{COMP_URL}private/jobs/{jobs_list[1]}/update', json=Status(state='complete').dict())
+    assert rest_client.get(f'{COMP_URL}workers/{worker_uid}').json()['status']['state'] == 'complete with errors'
+    assert rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['status']['state'] == 'complete with errors'
+
+
+def test_workflow_mapping(rest_client: TestClient):
+    '''
+    This test updates the port mapping of a job and checks the mapping of its workflow
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    workflow_uid = rest_client.post(f'{COMP_URL}workflows', json=workflow3).json()
+    worker_uid = rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['workers_list'][0]
+    jobs_list = rest_client.get(f'{COMP_URL}workers/{worker_uid}').json()['jobs_list']
+    ports = {'8050/tcp': [{'HostIp': '0.0.0.0', 'HostPort': '49153'}]}
+    rest_client.patch(f'{COMP_URL}private/jobs/{jobs_list[0]}/update/mapping', json={'ports': ports})
+    mapping = rest_client.get(f'{COMP_URL}workflows/{workflow_uid}/mapping').json()
+    assert mapping == {jobs_list[0]: ports, jobs_list[1]: None}
+
+
+def test_get_jobs_filters(rest_client: TestClient):
+    '''
+    This test retrieves the jobs of a user at a given host
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    host_uid = rest_client.get(f'{COMP_URL}hosts').json()[0]['uid']
+    jobs = rest_client.get(f'{COMP_URL}jobs', params={'user': '222', 'host_uid': host_uid}).json()
+    assert len(jobs) == 3
+    jobs = rest_client.get(f'{COMP_URL}jobs', params={'user': '222', 'host_uid': 'unknown'}).json()
+    assert len(jobs) == 0
+
+
+def test_get_jobs_page(rest_client: TestClient):
+    '''
+    This test retrieves the jobs of a user page by page, with and without projection
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    jobs = rest_client.get(f'{COMP_URL}jobs', params={'user': '222'}).json()
+    assert all(job['logs'] is None for job in jobs)
+    params = {'user': '222', 'limit': 2}
+    page1 = rest_client.get(f'{COMP_URL}jobs', params=params).json()
+    page2 = rest_client.get(f'{COMP_URL}jobs', params=dict(params, after=page1[-1]['uid'])).json()
+    assert [job['uid'] for job in page1 + page2] == [job['uid'] for job in jobs]
+    params = {'user': '222', 'fields': ['status.state', 'logs']}
+    jobs = rest_client.get(f'{COMP_URL}jobs', params=params).json()
+    assert set(jobs[0]) == {'uid', 'status', 'logs'} and set(jobs[0]['status']) == {'state'}
+
+
+def test_backfill_job_owners(mongodb, comp_svc):
+    '''
+    This test removes the denormalized workflow information from a job and checks that it is restored at start-up
+    Args:
+        mongodb:    database
+        comp_svc:   compute service
+    Returns:
+        None
+    '''
+    job = comp_svc.get_jobs(user='222')[0]
+    fields = ['user_uid', 'workflow_uid', 'worker_uid', 'host_uid']
+    owners = comp_svc._collection_job_list.find_one({'uid': job.uid}, fields)
+    comp_svc._collection_job_list.update_one({'uid': job.uid}, {'$unset': {field: '' for field in fields}})
+    ComputeService(mongodb)
+    assert comp_svc._collection_job_list.find_one({'uid': job.uid}, fields) == owners
+
+
+def test_check_indexes(comp_svc):
+    '''
+    This test drops an index and checks that it is reported as missing, and restored at start-up
+    Args:
+        comp_svc: compute service
+    Returns:
+        None
+    '''
+    assert all(not report['missing'] for report in comp_svc.check_indexes().values())
+    comp_svc._collection_worker_list.drop_index('jobs_list_1')
+    assert comp_svc.check_indexes()['worker_list']['missing'] == ['jobs_list_1']
+    comp_svc._create_indexes()
+    assert len(comp_svc._collection_job_list.index_information()) == len(INDEXES['job_list']) + 1
+
+
+def test_reset_host(rest_client: TestClient):
+    '''
+    This test resets a host with a running worker and checks that the operation completes once the worker finishes
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    host_uid = rest_client.post(f'{COMP_URL}hosts', json=host3).json()
+    workflow_uid = rest_client.post(f'{COMP_URL}workflows', json=dict(workflow3, host_list=[host3['hostname']])).json()
+    worker = rest_client.get(f'{COMP_URL}private/workers', params={'host_uid': host_uid,
+                                                                   'service_type': 'backend'}).json()
+    operation = MlexOperation.parse_obj(rest_client.patch(f'{COMP_URL}host/{host_uid}/reset').json())
+    assert operation.status.state == 'running'
+    assert rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['terminate']
+    rest_client.patch(f'{COMP_URL}private/workers/{worker["uid"]}/update', json=Status(state='terminated').dict())
+    assert wait_for_operation(rest_client, operation.uid).status.state == 'complete'
+
+
+def test_delete_host(rest_client: TestClient):
+    '''
+    This test deletes a host without running workers and checks that it is removed in the background
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    host_uid = rest_client.get(f'{COMP_URL}hosts', params={'nickname': host3['nickname']}).json()[0]['uid']
+    operation = MlexOperation.parse_obj(rest_client.delete(f'{COMP_URL}host/{host_uid}/delete').json())
+    assert wait_for_operation(rest_client, operation.uid).status.state == 'complete'
+    assert rest_client.get(f'{COMP_URL}hosts', params={'nickname': host3['nickname']}).json() == []
+
+
+def test_delete_running_job(rest_client: TestClient, comp_svc):
+    '''
+    This test deletes a running job and checks that it is only deleted once it has been terminated
+    Args:
+        rest_client: test client
+        comp_svc: compute service
+    Returns:
+        None
+    '''
+    workflow_uid = rest_client.post(f'{COMP_URL}workflows', json=dict(workflow3, dependencies={'0': [], '1': []})).json()
+    worker_uid = rest_client.get(f'{COMP_URL}workflows/{workflow_uid}').json()['workers_list'][0]
+    job_uid = rest_client.get(f'{COMP_URL}private/jobs', params={'worker_uid': worker_uid}).json()['uid']
+    rest_client.delete(f'{COMP_URL}jobs/{job_uid}/delete')
+    job = rest_client.get(f'{COMP_URL}jobs/{job_uid}').json()
+    assert job['pending_delete'] and job['terminate'] and job['status']['state'] == 'running'
+    rest_client.patch(f'{COMP_URL}private/jobs/{job_uid}/update', json=Status(state='terminated').dict())
+    assert comp_svc._collection_job_list.find_one({'uid': job_uid}) is None
+
+
+def test_assign_jobs():
+    '''
+    This test checks that the job assignment gives at least one job to each worker at the minimum total cost
+    Args:
+        None
+    Returns:
+        None
+    '''
+    allocation = ComputeService._assign_jobs(np.ones((3, 5)))
+    assert (allocation.sum(axis=0) == 1).all() and (allocation.sum(axis=1) >= 1).all()
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        cost_matrix = rng.integers(0, 10, (3, 5)).astype(float)
+        allocation = ComputeService._assign_jobs(cost_matrix)
+        assert (allocation.sum(axis=0) == 1).all() and (allocation.sum(axis=1) >= 1).all()
+        min_cost = min(cost_matrix[assignment, range(5)].sum()
+                       for assignment in itertools.product(range(3), repeat=5) if len(set(assignment)) == 3)
+        assert (allocation * cost_matrix).sum() == min_cost
+
+
+def test_split_workers_constraints(comp_svc):
+    '''
+    This test checks that each node receives the resources of its own constraint when the workflow requirements are
+    defined per group of nodes
+    Args:
+        comp_svc: compute service
+    Returns:
+        None
+    '''
+    constraints = [{'num_processors': 4, 'num_gpus': 0, 'num_nodes': 2},
+                   {'num_processors': 2, 'num_gpus': 1, 'num_nodes': 1}]
+    user_workflow = UserWorkflow.parse_obj(dict(workflow3,
+                                                job_list=[job_cpu, job_cpu, job_gpu],
+                                                dependencies={'0': [], '1': [], '2': []},
+                                                requirements={'constraints': constraints}))
+    _, workers, jobs = comp_svc.split_workers(user_workflow)
+    resources = sorted((worker['requirements']['num_processors'], worker['requirements']['num_gpus'])
+                       for worker in workers)
+    assert resources == [(2, 1), (4, 0), (4, 0)]
+    gpu_worker = next(worker['uid'] for worker in workers if worker['requirements']['num_gpus'] == 1)
+    assert jobs[2]['worker_uid'] == gpu_worker
+
+
+def test_split_workers_any_host(comp_svc):
+    '''
+    This test checks that the workers of a workflow without a list of hosts can be placed at any host
+    Args:
+        comp_svc: compute service
+    Returns:
+        None
+    '''
+    user_workflow = UserWorkflow.parse_obj(dict(workflow3, host_list=[]))
+    _, workers, _ = comp_svc.split_workers(user_workflow)
+    host_uids = [host.uid for host in comp_svc.get_hosts()]
+    assert len(workers) > 0 and all(worker['host_uid'] in host_uids for worker in workers)
+
+
+def test_split_workers_spread(rest_client: TestClient, comp_svc):
+    '''
+    This test checks that the nodes of a workflow are spread across the eligible hosts by their available resources
+    Args:
+        rest_client: test client
+        comp_svc: compute service
+    Returns:
+        None
+    '''
+    hostnames = ['spread1.als.lbl.gov', 'spread2.als.lbl.gov']
+    for hostname in hostnames:
+        rest_client.post(f'{COMP_URL}hosts', json=dict(host2, nickname=hostname, hostname=hostname))
+    user_workflow = UserWorkflow.parse_obj(dict(workflow3,
+                                                host_list=hostnames,
+                                                dependencies={'0': [], '1': []},
+                                                requirements={'num_processors': 6, 'num_gpus': 0, 'num_nodes': 2}))
+    _, workers, _ = comp_svc.split_workers(user_workflow)
+    assert len(set(worker['host_uid'] for worker in workers)) == 2
+
+
+def test_next_worker_priority(rest_client: TestClient):
+    '''
+    This test requests the next worker across several service types and checks that they are tried in order of priority
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    hostname = 'priority.als.lbl.gov'
+    host_uid = rest_client.post(f'{COMP_URL}hosts', json=dict(host2, nickname='priority', hostname=hostname)).json()
+    job_frontend = dict(job_cpu, service_type='frontend')
+    for job in [job_cpu, job_frontend]:
+        rest_client.post(f'{COMP_URL}workflows', json=dict(workflow3, job_list=[job], host_list=[hostname],
+                                                           dependencies={'0': []}))
+    params = {'host_uid': host_uid, 'service_type': ['frontend', 'backend']}
+    workers = [rest_client.get(f'{COMP_URL}private/workers', params=params).json() for i in range(3)]
+    assert [worker['service_type'] for worker in workers[:2]] == ['frontend', 'backend'] and workers[2] is None
+    params = {'host_uid': host_uid, 'service_type': ['frontend', 'backnd']}
+    assert rest_client.get(f'{COMP_URL}private/workers', params=params).status_code == 422
+
+
+def test_release_host_resources(rest_client: TestClient):
+    '''
+    This test completes a worker and checks that its resources are released back to the host
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    hostname = 'release.als.lbl.gov'
+    host_uid = rest_client.post(f'{COMP_URL}hosts', json=dict(host2, nickname='release', hostname=hostname)).json()
+    rest_client.post(f'{COMP_URL}workflows', json=dict(workflow3, job_list=[job_gpu], host_list=[hostname],
+                                                       dependencies={'0': []},
+                                                       requirements={'num_processors': 2, 'num_gpus': 1,
+                                                                     'num_nodes': 1}))
+    params = {'host_uid': host_uid, 'service_type': 'backend'}
+    worker = MlexWorker.parse_obj(rest_client.get(f'{COMP_URL}private/workers', params=params).json())
+    host = MlexHost.parse_obj(rest_client.get(f'{COMP_URL}hosts/{host_uid}').json())
+    assert host.backend_available.num_processors == 8 and host.backend_available.num_nodes == 2
+    job_uid = rest_client.get(f'{COMP_URL}private/jobs', params={'worker_uid': worker.uid}).json()['uid']
+    rest_client.patch(f'{COMP_URL}private/jobs/{job_uid}/update', json=Status(state='complete').dict())
+    host = rest_client.get(f'{COMP_URL}hosts/{host_uid}').json()
+    assert 'ServiceType' not in str(host)
+    host = MlexHost.parse_obj(host)
+    assert host.backend_available.num_processors == 10 and host.backend_available.num_gpus == 2
+    assert host.backend_available.num_nodes == 3 and sorted(host.backend_available.list_gpus) == ['1', '2']
+
+
+def test_next_worker_unplaceable(rest_client: TestClient):
+    '''
+    This test queues a worker that requests more GPUs than the ones listed at the host, and checks that it does not
+    block the next workers in queue
+    Args:
+        rest_client: test client
+    Returns:
+        None
+    '''
+    hostname = 'unlisted.als.lbl.gov'
+    host = dict(host2, nickname='unlisted', hostname=hostname,
+                backend_constraints=dict(host2['backend_constraints'], list_gpus=[1]))
+    host_uid = rest_client.post(f'{COMP_URL}hosts', json=host).json()
+    job_two_gpus = dict(job_gpu, requirements={'num_processors': 2, 'num_gpus': 2})
+    for job, num_gpus in [(job_two_gpus, 2), (job_cpu, 0)]:
+        rest_client.post(f'{COMP_URL}workflows', json=dict(workflow3, job_list=[job], host_list=[hostname],
+                                                           dependencies={'0': []},
+                                                           requirements={'num_processors': 2, 'num_gpus': num_gpus,
+                                                                         'num_nodes': 1}))
+    params = {'host_uid': host_uid, 'service_type': 'backend'}
+    worker = MlexWorker.parse_obj(rest_client.get(f'{COMP_URL}private/workers', params=params).json())
+    assert worker.requirements.num_gpus == 0
+    workers = rest_client.get(f'{COMP_URL}workers', params={'host_uid': host_uid, 'state': 'queue'}).json()
+    assert len(workers) == 1 and workers[0]['requirements']['num_gpus'] == 2
+
+
+def wait_for_operation(rest_client: TestClient, operation_uid: str, timeout: float = 5) -> MlexOperation:
+    '''
+    Retrieves an operation until it finishes or timeout seconds have passed
+    '''
+    deadline = time.monotonic() + timeout
+    while True:
+        operation = MlexOperation.parse_obj(rest_client.get(f'{COMP_URL}operations/{operation_uid}').json())
+        if operation.status.state != 'running' or time.monotonic() > deadline:
+            return operation
+        time.sleep(0.05)
+
+
+#################################################### TEST ELEMENTS ####################################################
+job_gpu = {
+    'service_type': 'backend',
+    'mlex_app': 'mlcoach',
+    'job_kwargs': {'uri': 'image', 'cmd': 'python3'},
+    'working_directory': 'home',
+    'requirements': {'num_processors': 2,
+                     'num_gpus': 1}
+}
+
+job_cpu = {
+    'service_type': 'backend',
+    'mlex_app': 'seg-demo',
+    'job_kwargs': {'uri': 'image', 'cmd': 'python3'},
+    'working_directory': 'home',
+    'requirements': {'num_processors': 1,
+                     'num_gpus': 0}
+}
+
+workflow2 = {
+    'user_uid': '222',
+    'job_list': [job_gpu, job_gpu, job_gpu],
+    'host_list': ['lambda.als.lbl.gov'],
+    'dependencies': {'0': [], '1': [], '2': []},
+    'requirements': {'num_processors': 2,
+                     'num_gpus': 1,
+                     'num_nodes': 3}
+}
+
+host2 = {
+    'nickname': 'lambda',
+    'hostname': 'lambda.als.lbl.gov',
+    'frontend_constraints': {'num_processors': 2,
+                             'num_gpus': 0,
+                             'list_gpus': [],
+                             'num_nodes': 1},
+    'backend_constraints': {'num_processors': 10,
+                            'num_gpus': 2,
+                            'list_gpus': [1, 2],
+                            'num_nodes': 3},
+}
+
+workflow3 = {
+    'user_uid': '333',
+    'job_list': [job_cpu, job_cpu],
+    'host_list': ['lambda.als.lbl.gov'],
+    'dependencies': {'0': [], '1': [0]},
+    'requirements': {'num_processors': 2,
+                     'num_gpus': 0,
+                     'num_nodes': 1}
+}
+
+host3 = {
+    'nickname': 'local',
+    'hostname': 'local.als.lbl.gov',
+    'frontend_constraints': {'num_processors': 0,
+                             'num_gpus': 0,
+                             'list_gpus': [],
+                             'num_nodes': 0},
+    'backend_constraints': {'num_processors': 2,
+                            'num_gpus': 0,
+                            'list_gpus': [],
+                            'num_nodes': 1},
+}
@@ -1,10 +1,15 @@
 import argparse
+import codecs
+import gzip
 import json
 import logging
-import math
+import os
+import shlex
 import subprocess
+import threading
 import time
 import traceback
+from multiprocessing.connection import Listener
 
 import docker
 import requests
@@ -45,6 +50,21 @@ def get_job(job_uid):
     return job
 
 
+def wait_for_termination(job_uid, timeout):
+    '''
+    Waits until the job is flagged for termination or the timeout expires
+    Args:
+        job_uid:    Job UID
+        timeout:    Maximum waiting time in seconds
+    Returns:
+        terminate:  True if the job has been flagged for termination
+    '''
+    response = requests.get(f'{COMP_API_URL}private/jobs/{job_uid}/events', params={'timeout': timeout},
+                            timeout=timeout + REQUEST_TIMEOUT_MARGIN)
+    job_event = response.json()
+    return bool(job_event['terminate'])
+
+
 def get_next_job(worker_uid):
     '''
     Gets the next job in worker
@@ -63,34 +83,31 @@ def get_next_job(worker_uid):
     return job
 
 
-def update_job_status(job_id, status=None, logs=None):
+def send_logs(job_logs, job_statuses=None):
     '''
-    Updates the status of a given job
+    Sends a batch of logs and statuses to the job service in a single compressed request, the statuses are applied
+    after the logs of the batch
     Args:
-        job_id:     Job UID
-        status:     [Status]
-        logs:       Job logs
+        job_logs:       Dictionary of new logs per job UID
+        job_statuses:   Dictionary of new statuses [Status] per job UID
     Returns:
         None
     '''
-    count=0
-    json = None
-    params = None
-    num_msgs = 1
-    if status:
-        json = status.dict()
-    if logs:
-        if len(logs) > 50000:
-            num_msgs = math.ceil(len(logs) / 50000)
-    for i in range(num_msgs):
-        if logs:
-            min_value = min((i + 1) * 50000, len(logs))
-            params = {'logs': logs[i * 50000:min_value]}
-        response = requests.patch(f'{COMP_API_URL}private/jobs/{job_id}/update', params=params, json=json)
-    if status:
-        logging.info(f'\"Update job {job_id} with status {status.state}\" {response.status_code}')
-    else:
-        logging.info(f'\"Update job {job_id} logs\" {response.status_code}')
+    job_statuses = job_statuses or {}
+    job_uids = list(dict.fromkeys(list(job_logs) + list(job_statuses)))
+    chunks = []
+    for job_uid in job_uids:
+        chunk = {'uid': job_uid, 'logs': job_logs.get(job_uid, '')}
+        if job_uid in job_statuses:
+            chunk['status'] = job_statuses[job_uid].dict()
+        chunks.append(chunk)
+    body = gzip.compress(json.dumps(chunks).encode('utf-8'))
+    response = requests.post(f'{COMP_API_URL}private/jobs/logs',
+                             data=body,
+                             headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    response.raise_for_status()
+    logging.info(f'\"Update logs of jobs {list(job_logs)} and statuses of jobs {list(job_statuses)}\" '
+                 f'{response.status_code}')
     pass
 
 
@@ -111,12 +128,13 @@ def check_assets(container_name, new_job_uid):
         None
     '''
     try:
+        # the records are copied to paths of their own since several jobs of the worker can finish at the same time
         subprocess.run(["docker", "cp", f"{container_name}:/tmp/file_record_init.txt",
-                        "/tmp/file_record_init.txt"])
+                        f"/tmp/{new_job_uid}_file_record_init.txt"])
         subprocess.run(["docker", "cp", f"{container_name}:/tmp/file_record_final.txt",
-                        "/tmp/file_record_final.txt"])
-        init_list = open('/tmp/file_record_init.txt', 'r').read().splitlines()
-        final_list = open('/tmp/file_record_final.txt', 'r').read().splitlines()
+                        f"/tmp/{new_job_uid}_file_record_final.txt"])
+        init_list = open(f'/tmp/{new_job_uid}_file_record_init.txt', 'r').read().splitlines()
+        final_list = open(f'/tmp/{new_job_uid}_file_record_final.txt', 'r').read().splitlines()
         if len(init_list)<len(final_list):
             assets = set(init_list[:-2]) ^ set(final_list[:-2])
             assets = [x for x in assets if not '__pycache__' in x]
@@ -127,112 +145,522 @@ def check_assets(container_name, new_job_uid):
     pass
 
 
-COMP_API_URL = 'http://job-service:8080/api/v0/'
-DOCKER_CLIENT = docker.from_env()
+class LogFollower:
+    '''
+    Follows the log stream of a container (or of a command executed in a container) in a background thread and
+    buffers the new output until it is flushed, such that only new bytes are retrieved from docker
+    Args:
+        log_stream: Docker log stream, e.g. container.logs(stdout=True, stream=True, follow=True)
+    '''
+    def __init__(self, log_stream):
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._thread = threading.Thread(target=self._follow, args=(log_stream,), daemon=True)
+        self._thread.start()
 
+    def _follow(self, log_stream):
+        try:
+            for chunk in log_stream:
+                with self._lock:
+                    self._buffer.append(chunk)
+        except Exception as err:
+            logging.error(f'Log stream was interrupted: {err}')
 
-if __name__ == '__main__':
-    init_logging()
+    def flush(self, timeout=None):
+        '''
+        Returns the logs received since the last flush
+        Args:
+            timeout:    Seconds to wait for the log stream to finish before flushing, None does not wait
+        Returns:
+            logs:       New logs
+        '''
+        if timeout is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            chunks = self._buffer
+            self._buffer = []
+        return self._decoder.decode(b''.join(chunks))
+
+
+class LogShipper:
+    '''
+    Collects the logs and final statuses of the jobs of a worker that run concurrently and sends them to the job service
+    in a single request every interval, or right away when a job has finished. The batches that could not be sent are
+    kept for the next request
+    Args:
+        interval:   Seconds between two requests
+    '''
+    def __init__(self, interval):
+        self._interval = interval
+        self._logs = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stops the background requests and sends the pending logs and statuses
+        '''
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self.flush()
+
+    def add_logs(self, job_uid, logs):
+        if logs:
+            with self._lock:
+                self._logs[job_uid] = self._logs.get(job_uid, '') + logs
+
+    def finish(self, job_uid, status, logs=None):
+        '''
+        Adds the last logs and the final status of a job, and sends them with the pending logs of the other jobs
+        '''
+        self.add_logs(job_uid, logs)
+        with self._lock:
+            self._statuses[job_uid] = status
+        logging.info(f'Job {job_uid} finished with status {status.state}')
+        self.flush()
+
+    def flush(self):
+        with self._flush_lock:          # keeps the batches in order
+            with self._lock:
+                job_logs, self._logs = self._logs, {}
+                job_statuses, self._statuses = self._statuses, {}
+            if not job_logs and not job_statuses:
+                return
+            try:
+                send_logs(job_logs, job_statuses)
+            except Exception as err:
+                logging.error(f'Could not send the logs of jobs {list(job_logs)}: {err}')
+                with self._lock:
+                    for job_uid, logs in job_logs.items():
+                        self._logs[job_uid] = logs + self._logs.get(job_uid, '')
+                    self._statuses = dict(job_statuses, **self._statuses)
+
+
+class ReusableContainers:
+    '''
+    Long-lived containers that run the successive jobs with the same image and container arguments through exec. Each
+    container runs one job at a time, and it is started the first time it is needed or again if it has stopped. The
+    containers are kept alive by overriding the entrypoint of the image with sleep, and the entrypoint of the image is
+    prepended to the command of each job. The images without sleep cannot be reused and their jobs run in containers
+    of their own
+    '''
+    def __init__(self):
+        self._idle = {}
+        self._keys = {}
+        self._entrypoints = {}
+        self._lock = threading.Lock()
+
+    def get(self, uri, run_kwargs):
+        '''
+        Returns an idle container of the image that matches the container arguments
+        Args:
+            uri:            Container uri
+            run_kwargs:     Arguments to run the container
+        Returns:
+            container:      Docker container, None if the image cannot be kept alive
+            entrypoint:     Entrypoint to prepend to the job command
+        '''
+        key = json.dumps([uri, run_kwargs], sort_keys=True, default=str)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            container = idle.pop() if idle else None
+            entrypoint = self._entrypoints.get(key, [])
+        if key in self._entrypoints and entrypoint is None:
+            return None, None
+        if container:
+            container.reload()
+            if container.status == 'running':
+                return container, entrypoint
+            self._remove(container)
+        entrypoint = self._entrypoint(self._get_image(uri), run_kwargs)
+        # the command of each job is executed in the container, which stays idle in between
+        container = DOCKER_CLIENT.containers.create(uri, **dict(run_kwargs, entrypoint=['sleep', 'infinity']))
+        try:
+            container.start()
+            container.reload()
+            if container.status != 'running':
+                raise RuntimeError(f'container is {container.status}')
+        except (docker.errors.APIError, RuntimeError) as err:
+            logging.warning(f'Image {uri} cannot be kept alive with sleep, its jobs run in their own containers: {err}')
+            self._remove(container)
+            entrypoint = container = None
+        with self._lock:
+            self._entrypoints[key] = entrypoint
+            if container:
+                self._keys[container.id] = key
+        return container, entrypoint
+
+    @staticmethod
+    def _get_image(uri):
+        # the image is pulled if it is not at the host yet, as containers.run does for the jobs that are not reused
+        try:
+            return DOCKER_CLIENT.images.get(uri)
+        except docker.errors.ImageNotFound:
+            return DOCKER_CLIENT.images.pull(uri)
+
+    @staticmethod
+    def _entrypoint(image, run_kwargs):
+        # the entrypoint in the container arguments takes precedence over the one of the image, as in docker run
+        entrypoint = run_kwargs.get('entrypoint')
+        if entrypoint is None:
+            entrypoint = image.attrs['Config'].get('Entrypoint')
+        if isinstance(entrypoint, str):
+            entrypoint = shlex.split(entrypoint)
+        return list(entrypoint or [])
+
+    def release(self, container):
+        '''
+        Makes a container available to the next jobs
+        '''
+        with self._lock:
+            self._idle[self._keys[container.id]].append(container)
+
+    def remove_all(self):
+        '''
+        Removes the idle containers
+        '''
+        with self._lock:
+            containers = [container for idle in self._idle.values() for container in idle]
+            self._idle = {}
+        for container in containers:
+            self._remove(container)
+
+    def _remove(self, container):
+        with self._lock:
+            self._keys.pop(container.id, None)
+        try:
+            container.remove(force=True)
+        except Exception as err:
+            logging.error(f'Could not remove container {container.name}: {err}')
+
+
+class WorkerResources:
+    '''
+    Processors and GPUs allocated to a worker, which are shared by the jobs of the worker that run concurrently
+    Args:
+        num_processors: Number of processors of the worker, None runs one job at a time
+        list_gpus:      GPUs of the worker
+    '''
+    def __init__(self, num_processors, list_gpus):
+        self.num_processors = num_processors
+        self._total_processors = num_processors or 1
+        self._free_processors = self._total_processors
+        self._free_gpus = list(list_gpus)
+        self._total_gpus = len(list_gpus)
+        self._condition = threading.Condition()
+
+    def job_request(self, job):
+        '''
+        Returns the number of processors and GPUs requested by a job. The processors that are not defined and the
+        requests that exceed the worker allocation take the whole worker, and the GPUs that are not defined take all
+        the GPUs of the worker
+        '''
+        num_processors = self._total_processors
+        num_gpus = self._total_gpus
+        if job.requirements:
+            if job.requirements.num_processors:
+                num_processors = min(job.requirements.num_processors, self._total_processors)
+            if job.requirements.num_gpus is not None:
+                num_gpus = min(job.requirements.num_gpus, self._total_gpus)
+        return num_processors, num_gpus
+
+    def acquire(self, num_processors, num_gpus):
+        '''
+        Waits until the resources are free and reserves them
+        Returns:
+            list_gpus:      Reserved GPUs
+        '''
+        with self._condition:
+            self._condition.wait_for(lambda: self._free_processors >= num_processors and
+                                             len(self._free_gpus) >= num_gpus)
+            self._free_processors -= num_processors
+            list_gpus = self._free_gpus[:num_gpus]
+            self._free_gpus = self._free_gpus[num_gpus:]
+        return list_gpus
+
+    def release(self, num_processors, list_gpus):
+        with self._condition:
+            self._free_processors += num_processors
+            self._free_gpus.extend(list_gpus)
+            self._condition.notify_all()
+
+    def wait_for_free_processors(self):
+        '''
+        Waits until there is at least one free processor
+        '''
+        with self._condition:
+            self._condition.wait_for(lambda: self._free_processors > 0)
+
+    def wait_for_release(self, timeout):
+        '''
+        Waits up to timeout seconds for a job to release its resources
+        '''
+        with self._condition:
+            self._condition.wait(timeout)
+
+
+def is_job_running(container, exec_id=None):
+    '''
+    Checks if a job is still running in its container, or as a command executed in a reusable container
+    '''
+    if exec_id:
+        return DOCKER_CLIENT.api.exec_inspect(exec_id)['Running']
+    return container.status == 'created' or container.status == 'running'
+
+
+def wait_for_job(container, exec_id=None):
+    '''
+    Waits for a job to finish and returns its result as in container.wait()
+    '''
+    if exec_id:
+        while is_job_running(container, exec_id):
+            time.sleep(0.1)
+        return {'StatusCode': DOCKER_CLIENT.api.exec_inspect(exec_id)['ExitCode'], 'Error': None}
+    return container.wait()
+
+
+class JobMonitor:
+    '''
+    Monitors a running job in background threads: one waits for the job to exit, and the other one waits for the job
+    to be flagged for termination through the long-poll of the job service and kills the job. The job is only killed
+    while it is running, such that a reused container is not killed once it has moved on to the next job
+    Args:
+        job_uid:    Job UID
+        container:  Docker container of the job
+        exec_id:    Exec ID of the job in a reused container, None if the job runs in a container of its own
+    '''
+    def __init__(self, job_uid, container, exec_id=None):
+        self.result = None
+        self.terminated = False
+        self._exited = threading.Event()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._wait_for_exit, args=(job_uid, container, exec_id), daemon=True).start()
+        threading.Thread(target=self._wait_for_termination, args=(job_uid, container), daemon=True).start()
+
+    def wait(self, timeout):
+        '''
+        Waits up to timeout seconds for the job to exit
+        Returns:
+            True if the job has exited
+        '''
+        return self._exited.wait(timeout)
+
+    def _wait_for_exit(self, job_uid, container, exec_id):
+        try:
+            result = wait_for_job(container, exec_id)
+        except Exception as err:
+            logging.error(f'Could not wait for job {job_uid}: {err}')
+            result = {'StatusCode': -1, 'Error': str(err)}
+        with self._lock:
+            self.result = result
+            self._exited.set()
+
+    def _wait_for_termination(self, job_uid, container):
+        while not self._exited.is_set():
+            try:
+                terminate = wait_for_termination(job_uid, timeout=TERMINATION_POLL_TIMEOUT)
+            except Exception as err:
+                logging.error(f'Could not check the termination of job {job_uid}: {err}')
+                self._exited.wait(1)
+                continue
+            if terminate:
+                with self._lock:
+                    if self._exited.is_set():
+                        return
+                    self.terminated = True
+                    try:
+                        container.kill()                            # kill container
+                    except docker.errors.APIError as err:
+                        logging.info(f'Job {job_uid} exited before it was killed: {err}')
+                return
+
+
+def run_job(new_job, resources, num_processors, list_gpus, reusable_containers, log_shipper):
+    '''
+    Executes a job with the reserved resources and monitors its container until it finishes, then releases the
+    resources
+    Args:
+        new_job:                [MlexJob]
+        resources:              [WorkerResources]
+        num_processors:         Number of reserved processors
+        list_gpus:              Reserved GPUs
+        reusable_containers:    [ReusableContainers]
+        log_shipper:            [LogShipper]
+    Returns:
+        None
+    '''
+    cpu_count = num_processors if resources.num_processors else None
+    exec_id = None
+    reused_container = None
+    try:
+        job_uid = new_job.uid
+        try:        # launch job
+            docker_job = new_job.job_kwargs
+            cmd = docker_job.cmd
+            volumes = []
+            if len(new_job.working_directory)>0:
+                volumes = ['{}:/app/work/data'.format(new_job.working_directory)]
+                cmd = f"tree -ifo /tmp/file_record_init.txt ; {cmd} ; tree -ifo /tmp/file_record_final.txt"
+                cmd = f'bash -c {json.dumps(cmd)}'
+            else:
+                file_record = None              # Not reporting assets
+            ports = {}
+            if docker_job.map:
+                for port in docker_job.map:
+                    ports[port] = None     # assigns random port
+            device_requests = []
+            if len(list_gpus)>0:
+                device_requests.append(docker.types.DeviceRequest(device_ids=list_gpus,
+                                                                  capabilities=[['gpu']]
+                                                                  )),
+            run_kwargs = dict(cpu_count=cpu_count,
+                              device_requests=device_requests,
+                              ports=ports,
+                              network='computing_api_default',
+                              volumes=volumes,
+                              detach=True,
+                              **(docker_job.container_kwargs or {}))
+            container = None
+            if docker_job.reuse_container:
+                container, entrypoint = reusable_containers.get(docker_job.uri, run_kwargs)
+            if container:
+                reused_container = container
+                exec_id = DOCKER_CLIENT.api.exec_create(container.id, entrypoint + shlex.split(cmd))['Id']
+                log_stream = DOCKER_CLIENT.api.exec_start(exec_id, stream=True)
+            else:
+                container = DOCKER_CLIENT.containers.run(docker_job.uri, command=cmd, **run_kwargs)
+        except Exception as err:
+            if str(err) != '(\'Connection aborted.\', ConnectionResetError(104, \'Connection reset by peer\'))':
+                logging.error(f'Job {new_job.uid} failed: {str(err)}\n{traceback.format_exc()}')
+                log_shipper.finish(new_job.uid, Status(state="failed", return_code=str(err)))
+        else:
+            container.reload()      # to get the ports
+            update_job_mapping(new_job.uid, container.ports)
+            if not exec_id:
+                log_stream = container.logs(stdout=True, stream=True, follow=True)
+            log_follower = LogFollower(log_stream)
+            job_monitor = JobMonitor(job_uid, container, exec_id)
+            while not job_monitor.wait(LOG_SHIP_INTERVAL):
+                # the logs received since the last check are sent with the logs of the other jobs
+                log_shipper.add_logs(job_uid, log_follower.flush())
+            result = job_monitor.result
+            logs = log_follower.flush(timeout=LOG_STREAM_TIMEOUT)     # retrieve last logs and outputs
+            # the final status is reported once, after the job has exited
+            if job_monitor.terminated:
+                final_status = Status(state="terminated")
+            elif result["StatusCode"] == 0:
+                final_status = Status(state="complete")
+                if len(new_job.working_directory) > 0:
+                    check_assets(container.name, new_job.uid)
+            else:
+                try:
+                    check_assets(container, new_job.uid)
+                except Exception:
+                    pass
+                err = "Code: "+str(result["StatusCode"])+ " Error: " + repr(result["Error"])
+                logging.error(f'Job {new_job.uid} failed: {err}\n{traceback.format_exc()}')
+                final_status = Status(state="failed", return_code=err)
+            log_shipper.finish(new_job.uid, final_status, logs)
+            # container.remove()
+    finally:
+        if reused_container:
+            reusable_containers.release(reused_container)
+        resources.release(num_processors, list_gpus)
 
-    parser = argparse.ArgumentParser()
-    parser.add_argument('worker', help='worker description')
-    args = parser.parse_args()
 
-    # get worker information
-    worker = MlexWorker(**json.loads(args.worker))
+def run_worker(worker):
+    '''
+    Executes the jobs of a worker, running the jobs that are ready concurrently as long as the resources allocated to
+    the worker allow it
+    Args:
+        worker:     [MlexWorker]
+    Returns:
+        None
+    '''
     jobs_list = worker.jobs_list
-    num_processors = worker.requirements.num_processors
-    list_gpus = worker.requirements.list_gpus
+    resources = WorkerResources(worker.requirements.num_processors, worker.requirements.list_gpus)
+    reusable_containers = ReusableContainers()
+    log_shipper = LogShipper(LOG_SHIP_INTERVAL)
+    log_shipper.start()
+    job_threads = []
     new_job = 0
 
     while len(jobs_list)>0 and new_job!=-1:
+        resources.wait_for_free_processors()        # the next job is only dequeued when it can start soon
         new_job = get_next_job(worker.uid)
         if new_job and new_job!=-1:
-            job_uid = new_job.uid
             jobs_list.remove(new_job.uid)
-            try:        # launch job
-                logs = ''
-                docker_job = new_job.job_kwargs
-                cmd = docker_job.cmd
-                volumes = []
-                if len(new_job.working_directory)>0:
-                    volumes = ['{}:/app/work/data'.format(new_job.working_directory)]
-                    cmd = f"tree -ifo /tmp/file_record_init.txt ; {cmd} ; tree -ifo /tmp/file_record_final.txt"
-                    cmd = f'bash -c {json.dumps(cmd)}'
-                else:
-                    file_record = None              # Not reporting assets
-                ports = {}
-                if docker_job.map:
-                    for port in docker_job.map:
-                        ports[port] = None     # assigns random port
-                device_requests = []
-                if len(list_gpus)>0:
-                    device_requests.append(docker.types.DeviceRequest(device_ids=list_gpus,
-                                                                      capabilities=[['gpu']]
-                                                                      )),
-                if docker_job.container_kwargs:
-                    container = DOCKER_CLIENT.containers.run(docker_job.uri,
-                                                            cpu_count=num_processors,
-                                                            device_requests=device_requests,
-                                                            command=cmd,
-                                                            ports=ports,
-                                                            network='computing_api_default',
-                                                            volumes=volumes,
-                                                            detach=True,
-                                                            **docker_job.container_kwargs)
-                else:
-                    container = DOCKER_CLIENT.containers.run(docker_job.uri,
-                                                            cpu_count=num_processors,
-                                                            device_requests=device_requests,
-                                                            command=cmd,
-                                                            ports=ports,
-                                                            network='computing_api_default',
-                                                            volumes=volumes,
-                                                            detach=True)
+            num_processors, num_gpus = resources.job_request(new_job)
+            list_gpus = resources.acquire(num_processors, num_gpus)
+            job_thread = threading.Thread(target=run_job,
+                                          args=(new_job, resources, num_processors, list_gpus, reusable_containers,
+                                                log_shipper))
+            job_thread.start()
+            job_threads.append(job_thread)
+        elif new_job is None:
+            # waits up to 1s for the dependencies of the remaining jobs to finish
+            resources.wait_for_release(1)
+    for job_thread in job_threads:
+        job_thread.join()
+    log_shipper.stop()
+    reusable_containers.remove_all()
+
+
+def serve(port):
+    '''
+    Warm pool mode: waits for worker assignments from the launcher and executes them one at a time, replying to the
+    launcher when each worker has finished
+    Args:
+        port:       Port to listen to
+    Returns:
+        None
+    '''
+    listener = Listener(('0.0.0.0', port), authkey=os.environ['WARM_POOL_AUTHKEY'].encode())
+    logging.info(f'Waiting for worker assignments at port {port}')
+    while True:
+        with listener.accept() as conn:
+            worker = MlexWorker(**json.loads(conn.recv()))
+            logging.info(f'Received worker: {worker.uid}')
+            try:
+                run_worker(worker)
             except Exception as err:
-                if str(err) != '(\'Connection aborted.\', ConnectionResetError(104, \'Connection reset by peer\'))':
-                    logging.error(f'Job {new_job.uid} failed: {str(err)}\n{traceback.format_exc()}')
-                    update_job_status(new_job.uid, status=Status(state="failed", return_code=str(err)))
-            else:
-                container.reload()      # to get the ports
-                update_job_mapping(new_job.uid, container.ports)
-                while container.status == 'created' or container.status == 'running':
-                    new_job = get_job(job_uid)      # gets current state of the job in database to check if terminated
-                    if new_job.terminate:
-                        output = container.logs(stdout=True)            # retrieve last logs and outputs
-                        container.kill()                                # kill container
-                        update_job_status(new_job.uid, status=Status(state="terminated"))
-                    else:
-                        try:
-                            # retrieve logs and check if new assets have been created
-                            tmp_logs = container.logs(stdout=True)
-                            if logs != tmp_logs:
-                                update_job_status(new_job.uid, logs=tmp_logs[len(logs):])
-                                logs = tmp_logs
-                        except Exception as err:
-                            if str(err) != '(\'Connection aborted.\', ConnectionResetError(104, \'Connection reset by peer\'))':
-                                logging.error(f'Job {new_job.uid} failed: {str(err)}\n{traceback.format_exc()}')
-                                update_job_status(new_job.uid, status=Status(state="failed", return_code=str(err)))
-                    time.sleep(1)
-                    container = DOCKER_CLIENT.containers.get(container.id)
-                result = container.wait()
-                if result["StatusCode"] == 0:
-                    tmp_logs = container.logs(stdout=True)
-                    logs = tmp_logs[len(logs):]
-                    update_job_status(new_job.uid, status=Status(state="complete"), logs=logs)
-                    logs = tmp_logs
-                    if len(new_job.working_directory) > 0:
-                        check_assets(container.name, new_job.uid)
-                else:
-                    if new_job.terminate is None:
-                        try:
-                            output = container.logs(stdout=True)
-                            update_job_status(new_job.uid, logs=output[len(logs):])
-                            logs = output
-                            check_assets(container, new_job.uid)
-                        except Exception:
-                            pass
-                        err = "Code: "+str(result["StatusCode"])+ " Error: " + repr(result["Error"])
-                        logging.error(f'Job {new_job.uid} failed: {err}\n{traceback.format_exc()}')
-                        update_job_status(new_job.uid, status=Status(state="failed", return_code=err))
-                # container.remove()
+                logging.error(f'Worker {worker.uid} failed: {err}\n{traceback.format_exc()}')
+                requests.patch(f'{COMP_API_URL}private/workers/{worker.uid}/update',
+                               json=Status(state='failed', return_code=str(err)).dict())
+            conn.send(worker.uid)
+
+
+COMP_API_URL = 'http://job-service:8080/api/v0/'
+LOG_STREAM_TIMEOUT = 10                 # seconds to wait for the remaining logs once the container has exited
+LOG_SHIP_INTERVAL = 1                   # seconds between two batches of logs of the running jobs
+TERMINATION_POLL_TIMEOUT = 30           # seconds of each long-poll for the termination of a job
+REQUEST_TIMEOUT_MARGIN = 10             # seconds to wait for a long-poll response after its timeout
+WARM_POOL_PORT = 8787                   # port of the warm pool mode
+DOCKER_CLIENT = docker.from_env()
+
+
+if __name__ == '__main__':
+    init_logging()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('worker', nargs='?', help='worker description')
+    parser.add_argument('--serve', action='store_true', help='wait for worker assignments from the launcher')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(WARM_POOL_PORT)
+    else:
+        # get worker information
+        worker = MlexWorker(**json.loads(args.worker))
+        run_worker(worker)
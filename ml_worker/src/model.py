@@ -42,6 +42,8 @@ class DockerJob(BaseModel):
     map: Optional[dict] = Field(description="{'port1/tcp': '', 'port2/tcp': '', ... }")
     container_kwargs: Optional[dict] = Field(description="container kwargs")
     kwargs: Optional[dict] = Field(description="container kwargs")
+    reuse_container: Optional[bool] = Field(description="run the job in a container that is reused by the next jobs "
+                                                        "of the worker with the same image", default=False)
 
 
 class Resources(BaseModel):
@@ -0,0 +1,70 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+
+SERVICE_TYPES = ['frontend', 'hybrid', 'backend']
+DEFAULT_WEIGHTS = {'frontend': 5, 'hybrid': 2, 'backend': 2}
+
+
+class Scheduler(ABC):
+    '''
+    Decides the order of priority of the service types requested to the job service. The worker launcher asks for the
+    next worker across all the service types in one call and reports which service type was dispatched
+    '''
+    def __init__(self, weights: Dict[str, float] = None):
+        if weights is None:
+            weights = DEFAULT_WEIGHTS
+        self.weights = {service_type: weights.get(service_type, 0) for service_type in SERVICE_TYPES}
+
+    @abstractmethod
+    def priorities(self) -> List[str]:
+        '''
+        Returns:
+            List of service types in order of priority
+        '''
+
+    def dispatched(self, service_type: str):
+        '''
+        Records that a worker of service_type has been launched
+        Args:
+            service_type:   Frontend, Backend, Hybrid
+        Returns:
+            None
+        '''
+        pass
+
+
+class PriorityScheduler(Scheduler):
+    '''
+    Strict priorities: the service types are always requested in decreasing order of weight
+    '''
+    def priorities(self) -> List[str]:
+        return sorted(self.weights, key=self.weights.get, reverse=True)
+
+
+class WeightedFairScheduler(Scheduler):
+    '''
+    Weighted-fair priorities (smooth weighted round-robin): every dispatch credits each service type with its weight and
+    charges the dispatched type with the total weight. When there is work of every type, each type is dispatched in
+    proportion to its weight. A type that keeps waiting accumulates credit until it gets the first priority, and the
+    credits are bounded so that a type that was idle does not starve the others with a burst when its work arrives
+    '''
+    def __init__(self, weights: Dict[str, float] = None):
+        super().__init__(weights)
+        self.total_weight = sum(self.weights.values())
+        self.credits = dict.fromkeys(self.weights, 0)
+
+    def priorities(self) -> List[str]:
+        return sorted(self.credits, key=lambda service_type: (self.credits[service_type],
+                                                              self.weights[service_type]),
+                      reverse=True)
+
+    def dispatched(self, service_type: str):
+        self.credits[service_type] -= self.total_weight
+        for key in self.credits:
+            credit = self.credits[key] + self.weights[key]
+            self.credits[key] = max(-self.total_weight, min(credit, self.total_weight))
+
+
+SCHEDULERS = {'priority': PriorityScheduler,
+              'weighted_fair': WeightedFairScheduler}
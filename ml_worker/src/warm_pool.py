@@ -0,0 +1,109 @@
+import json
+import logging
+import queue
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client
+from uuid import uuid4
+
+
+WARM_POOL_LABEL = 'mlex.warm_pool'      # label of the warm containers, to find them after the launcher restarts
+
+
+class WarmPool:
+    '''
+    Keeps a number of idle ml_worker containers that have already started (ml_worker.py --serve) and hands them worker
+    assignments through a local connection, such that the workers do not wait for a new container to boot. The warm
+    containers left by a previous launcher are removed before the pool is started
+    Args:
+        docker_client:      Docker client
+        image:              ml_worker image
+        size:               Number of warm containers
+        port:               Port of the warm pool mode in the ml_worker containers
+        container_kwargs:   Arguments to run the ml_worker containers (cpu_count, network, volumes)
+    '''
+    def __init__(self, docker_client, image, size, port, **container_kwargs):
+        self._docker_client = docker_client
+        self._image = image
+        self._port = port
+        self._container_kwargs = container_kwargs
+        self._authkey = secrets.token_hex(16)
+        self._idle = queue.Queue()
+        self._remove_stale_containers()
+        for i in range(size):
+            self._start_container()
+
+    def _remove_stale_containers(self):
+        # the containers of a previous launcher cannot be reached, since they use a different authentication key
+        for container in self._docker_client.containers.list(all=True, filters={'label': WARM_POOL_LABEL}):
+            logging.info(f'Removing stale warm worker container {container.name}')
+            try:
+                container.remove(force=True)
+            except Exception as err:
+                logging.error(f'Could not remove warm worker container {container.name}: {err}')
+
+    def _start_container(self):
+        container = self._docker_client.containers.run(self._image,
+                                                       name=f'mlex-warm-worker-{uuid4().hex[:12]}',
+                                                       command='python3 src/ml_worker.py --serve',
+                                                       environment={'WARM_POOL_AUTHKEY': self._authkey},
+                                                       labels=[WARM_POOL_LABEL],
+                                                       detach=True,
+                                                       **self._container_kwargs)
+        logging.info(f'Started warm worker container {container.name}')
+        self._idle.put(container)
+
+    def _connect(self, container, timeout=10):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return Client((container.name, self._port), authkey=self._authkey.encode())
+            except (ConnectionRefusedError, OSError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)         # the container is still booting
+
+    def assign(self, worker):
+        '''
+        Hands a worker to an idle warm container
+        Args:
+            worker:     [MlexWorker]
+        Returns:
+            True if the worker was assigned, False if there are no idle containers
+        '''
+        try:
+            container = self._idle.get_nowait()
+        except queue.Empty:
+            return False
+        try:
+            conn = self._connect(container)
+            conn.send(json.dumps(worker.dict(), default=str))
+        except Exception as err:
+            logging.error(f'Warm worker container {container.name} is not reachable: {err}')
+            self._replace(container)
+            return False
+        threading.Thread(target=self._wait_for_release, args=(container, conn), daemon=True).start()
+        return True
+
+    def _wait_for_release(self, container, conn):
+        # the container goes back to the pool once it has finished the worker
+        try:
+            worker_uid = conn.recv()
+            logging.info(f'Warm worker container {container.name} finished worker {worker_uid}')
+            self._idle.put(container)
+        except Exception as err:
+            logging.error(f'Warm worker container {container.name} exited: {err}')
+            self._replace(container)
+        finally:
+            conn.close()
+
+    def _replace(self, container):
+        try:
+            container.remove(force=True)
+        except Exception as err:
+            logging.error(f'Could not remove warm worker container {container.name}: {err}')
+        try:
+            self._start_container()
+        except Exception as err:
+            logging.error(f'Could not start a warm worker container: {err}')
@@ -2,12 +2,15 @@ import ast
 import json
 import logging
 import os
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import docker
 import requests
 
 from model import MlexHost, MlexWorker, Status
+from scheduler import SCHEDULERS
+from warm_pool import WarmPool
 
 
 def init_logging():
@@ -41,16 +44,19 @@ def get_host(host):
     return host_uid
 
 
-def get_next_worker(service_type, host_uid):
+def get_next_worker(service_type, host_uid, timeout=0):
     '''
     This function returns the next worker in queue that matches the available compute resources at the host
     Args:
-        host_uid:   Host UID
+        service_type:   Frontend, Backend, Hybrid, or a list of them in order of priority
+        host_uid:       Host UID
+        timeout:        Maximum waiting time in seconds for a worker to be queued
     Returns:
-        worker:     [MlexWorker]
+        worker:         [MlexWorker]
     '''
     response = requests.get(f'{COMP_API_URL}private/workers', params={'service_type': service_type,
-                                                                      'host_uid': host_uid})
+                                                                      'host_uid': host_uid,
+                                                                      'timeout': timeout})
     worker = response.json()
     if worker:
         worker = MlexWorker.parse_obj(worker)
@@ -72,11 +78,47 @@ def update_worker_status(worker_id, status: Status):
     pass
 
 
+def launch_worker(worker, launch_slots, warm_pool=None):
+    '''
+    This function hands the worker to an idle container of the warm pool or, if there are none, starts a new container
+    for the worker. The worker is reported as failed if it could not be started
+    Args:
+        worker:         [MlexWorker]
+        launch_slots:   Semaphore that bounds the number of concurrent launches, released when the launch finishes
+        warm_pool:      [WarmPool], None to always start a new container
+    Returns:
+        None
+    '''
+    try:
+        if warm_pool and warm_pool.assign(worker):
+            logging.info(f'Worker {worker.uid} assigned to the warm pool')
+            return
+        worker_info = json.dumps(worker.dict(), default=str)
+        DOCKER_CLIENT.containers.run(MLWORKER_URI,
+                                     cpu_count  = NUM_PROCESSORS,
+                                     command    = "python3 src/ml_worker.py \'"+ worker_info+' \'',
+                                     network    = NETWORK,
+                                     volumes    = ["/var/run/docker.sock:/var/run/docker.sock"],
+                                     detach     = True)
+    except Exception as err:
+        logging.error(f'Worker {worker.uid} failed: {err}')
+        status = Status(state="failed", return_code=str(err))
+        update_worker_status(worker.uid, status)
+    finally:
+        launch_slots.release()
+
+
 COMP_API_URL = 'http://job-service:8080/api/v0/'
 MLWORKER_URI = str(os.environ['WORKER_IMAGE'])
 NUM_PROCESSORS = int(os.environ['NUM_PROCESSORS'])      # number of processors assigned to ml_workers
 NETWORK = str(os.environ['NETWORK'])
 HOST = ast.literal_eval(os.environ['HOST'])
+QUEUE_TIMEOUT = 3                       # seconds the job service holds a request while waiting for a new worker
+SCHEDULER = os.getenv('SCHEDULER', 'weighted_fair')                 # priority, weighted_fair
+SCHEDULER_WEIGHTS = ast.literal_eval(os.getenv('SCHEDULER_WEIGHTS', 'None'))    # e.g. {'frontend': 5, 'backend': 2}
+MAX_CONCURRENT_LAUNCHES = int(os.getenv('MAX_CONCURRENT_LAUNCHES', 8))   # containers started in parallel
+WARM_POOL_SIZE = int(os.getenv('WARM_POOL_SIZE', 0))     # idle ml_worker containers, 0 disables the warm pool
+WARM_POOL_PORT = 8787                   # port of the warm pool mode in ml_worker
 DOCKER_CLIENT = docker.from_env()
 
 
@@ -87,29 +129,24 @@ if __name__ == '__main__':
     host_uid = get_host(host)
     mlworker_image = DOCKER_CLIENT.images.pull(MLWORKER_URI)
 
-    cont = -1
+    warm_pool = None
+    if WARM_POOL_SIZE > 0:
+        warm_pool = WarmPool(DOCKER_CLIENT, MLWORKER_URI, WARM_POOL_SIZE, WARM_POOL_PORT,
+                             cpu_count=NUM_PROCESSORS,
+                             network=NETWORK,
+                             volumes=["/var/run/docker.sock:/var/run/docker.sock"])
+    scheduler = SCHEDULERS[SCHEDULER](SCHEDULER_WEIGHTS)
+    launch_slots = threading.BoundedSemaphore(MAX_CONCURRENT_LAUNCHES)
+    executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_LAUNCHES)
+    timeout = QUEUE_TIMEOUT
     while True and host_uid!=-1:
-        cont += 1
-        if cont < 5:                        # Priority to frontend services
-            new_worker = get_next_worker('frontend', host_uid)
-        elif cont < 7:                      # Next, hybrid services
-            new_worker = get_next_worker('hybrid', host_uid)
-        elif cont < 9:                      # Finally, backend services
-            new_worker = get_next_worker('backend', host_uid)
-        else:
-            cont = -1
+        launch_slots.acquire()              # wait for a free launch slot before dequeuing the next worker
+        # one request across all the service types, returns as soon as any of them has a worker ready
+        new_worker = get_next_worker(scheduler.priorities(), host_uid, timeout)
         if new_worker:
-            try:
-                worker_info = json.dumps(new_worker.dict(), default=str)
-                container = DOCKER_CLIENT.containers.run(MLWORKER_URI,
-                                                         cpu_count  = NUM_PROCESSORS,
-                                                         command    = "python3 src/ml_worker.py \'"+ worker_info+' \'',
-                                                         network    = NETWORK,
-                                                         volumes    = ["/var/run/docker.sock:/var/run/docker.sock"],
-                                                         detach     = True)
-            except Exception as err:
-                logging.error(f'Worker {new_worker.uid} failed: {err}')
-                status = Status(state="failed", return_code=str(err))
-                update_worker_status(new_worker.uid, status)
-            new_worker = None
-        time.sleep(3)
+            scheduler.dispatched(new_worker.service_type)
+            executor.submit(launch_worker, new_worker, launch_slots, warm_pool)
+            timeout = 0                     # keep dequeuing while the host has free capacity
+        else:
+            launch_slots.release()
+            timeout = QUEUE_TIMEOUT